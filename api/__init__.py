@@ -2,6 +2,8 @@ from flask import Flask
 from flask_cors import CORS
 from api.routes import init_routes
 from api.data_db import create_tables
+from core.ml_operations.registry import registry
+from config.settings import MODELS_TO_WARMUP
 import subprocess
 import logging
 
@@ -12,6 +14,9 @@ def create_app():
 
     create_tables()
     enable_git_longpaths()
+    # Models not warmed up here are loaded by the first request that needs them
+    if MODELS_TO_WARMUP:
+        registry.warmup(MODELS_TO_WARMUP, background=True)
 
     return app
 
@@ -3,11 +3,19 @@ import os
 from dotenv import load_dotenv
 from datetime import datetime
 import psycopg2
+from psycopg2.extras import execute_values
 import time
 import logging
-from core.ml_operations.loader import load_codebert_model
+from core.ml_operations.registry import get_codebert
 from core.analysis.codebert_sliding_window import codebert_sliding_window
-from config.settings import CLONED_REPO_BASE_PATH, CODEBERT_BASE_PATH
+from core.analysis.scores import (
+    apply_thresholds,
+    pack_ku_scores,
+    pack_window_scores,
+    unpack_ku_scores,
+    unpack_window_scores,
+)
+from config.settings import CLONED_REPO_BASE_PATH
 
 
 # Database connection settings
@@ -18,10 +26,6 @@ DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 
-
-# Load model
-model = load_codebert_model(CODEBERT_BASE_PATH, 27)
-
 def get_db_connection():
     conn = psycopg2.connect(
         dbname=DB_NAME,
@@ -84,6 +88,30 @@ def create_tables():
         '''
     ]
 
+    # Columns and tables added after the first release, also applied to existing databases
+    migrations = [
+        'ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS ku_scores BYTEA',
+        'ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS window_scores BYTEA',
+        'ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS analysis_params JSONB',
+        'ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS model_version VARCHAR(40)',
+        'ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS ku_scores_partial BOOLEAN',
+        'ALTER TABLE commits ADD COLUMN IF NOT EXISTS blob_sha VARCHAR(40)',
+        'ALTER TABLE commits ADD COLUMN IF NOT EXISTS previous_blob_sha VARCHAR(40)',
+        # Looked up by get_blob_windows for the content of a blob
+        'CREATE INDEX IF NOT EXISTS commits_blob_sha ON commits (blob_sha)',
+        '''
+        CREATE TABLE IF NOT EXISTS blob_results (
+            blob_sha VARCHAR(40),
+            analysis_key VARCHAR(40),
+            ku_scores BYTEA NOT NULL,
+            window_scores BYTEA,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (blob_sha, analysis_key)
+        )
+        ''',
+        'ALTER TABLE blob_results ADD COLUMN IF NOT EXISTS ku_scores_partial BOOLEAN',
+    ]
+
     conn = None
     try:
         conn = get_db_connection()
@@ -94,11 +122,13 @@ def create_tables():
         (table_exists,) = cur.fetchone()
         if table_exists:
             print("Tables already exists. Skipping table creation.")
-            return
+        else:
+            # Create tables
+            for command in commands:
+                cur.execute(command)
 
-        # Create tables
-        for command in commands:
-            cur.execute(command)
+        for migration in migrations:
+            cur.execute(migration)
         cur.close()
         conn.commit()
     except Exception as e:
@@ -195,8 +225,9 @@ def save_commits_to_db(repo_name, commits):
         cur = conn.cursor()
         for commit in commits:
             cur.execute('''
-                INSERT INTO commits (repo_name, sha, author, file_content, changed_lines, temp_filepath, timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                INSERT INTO commits (repo_name, sha, author, file_content, changed_lines, temp_filepath, timestamp,
+                                     blob_sha, previous_blob_sha)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
             ''', (
                 repo_name,
                 commit.get('sha'),
@@ -204,7 +235,9 @@ def save_commits_to_db(repo_name, commits):
                 commit.get('file_content'),
                 commit.get('changed_lines'),
                 commit.get('temp_filepath'),
-                commit.get('timestamp')
+                commit.get('timestamp'),
+                commit.get('blob_sha'),
+                commit.get('previous_blob_sha')
             ))
         conn.commit()
         cur.close()
@@ -218,7 +251,7 @@ def get_commits_from_db(repo_name):
         conn = get_db_connection()
         cur = conn.cursor()
         cur.execute('''
-            SELECT sha, author, file_content, changed_lines, temp_filepath, timestamp
+            SELECT sha, author, file_content, changed_lines, temp_filepath, timestamp, blob_sha, previous_blob_sha
             FROM commits
             WHERE repo_name = %s
         ''', (repo_name,))
@@ -234,7 +267,9 @@ def get_commits_from_db(repo_name):
                 "file_content": row[2],
                 "changed_lines": row[3],
                 "temp_filepath": row[4],
-                "timestamp": row[5]
+                "timestamp": row[5],
+                "blob_sha": row[6],
+                "previous_blob_sha": row[7]
             }
             commits.append(commit)
 
@@ -275,7 +310,8 @@ def getdetected_kus():
         conn.close()
 
 
-def save_analysis_to_db(repo_name, file_data):
+def save_analysis_to_db(repo_name, file_data, ku_scores=None, window_scores=None, analysis_params=None,
+                        model_version=None, ku_scores_partial=False):
     try:
         conn = get_db_connection()
         cur = conn.cursor()
@@ -283,9 +319,21 @@ def save_analysis_to_db(repo_name, file_data):
         detected_kus_serialized = json.dumps(file_data["detected_kus"], default=str)
         timestamp_serialized = file_data["timestamp"].isoformat() if isinstance(file_data["timestamp"], datetime) else file_data["timestamp"]
 
+        # The per-KU probabilities are kept, so that detected_kus can be recomputed with other thresholds
+        ku_scores_serialized = psycopg2.Binary(pack_ku_scores(ku_scores)) if ku_scores is not None else None
+        window_scores_serialized = (
+            psycopg2.Binary(pack_window_scores(window_scores, len(ku_scores)))
+            if window_scores is not None and ku_scores is not None else None
+        )
+
+        # The window parameters the result was computed with
+        analysis_params_serialized = json.dumps(analysis_params) if analysis_params is not None else None
+
         cur.execute('''
-            INSERT INTO analysis_results (repo_name, filename, author, timestamp, sha, detected_kus, elapsed_time)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            INSERT INTO analysis_results (repo_name, filename, author, timestamp, sha, detected_kus, elapsed_time,
+                                          ku_scores, window_scores, analysis_params, model_version,
+                                          ku_scores_partial)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         ''', (
             repo_name,
             file_data["filename"],
@@ -293,7 +341,12 @@ def save_analysis_to_db(repo_name, file_data):
             timestamp_serialized,
             file_data["sha"],
             detected_kus_serialized,
-            file_data["elapsed_time"]
+            file_data["elapsed_time"],
+            ku_scores_serialized,
+            window_scores_serialized,
+            analysis_params_serialized,
+            model_version,
+            ku_scores_partial
         ))
 
         conn.commit()
@@ -311,7 +364,7 @@ def get_analysis_from_db(repo_name):
 
         # Εκτέλεση του query για ανάκτηση των δεδομένων
         cur.execute('''
-            SELECT filename, author, timestamp, sha, detected_kus, elapsed_time
+            SELECT filename, author, timestamp, sha, detected_kus, elapsed_time, analysis_params, model_version
             FROM analysis_results
             WHERE repo_name = %s
         ''', (repo_name,))
@@ -322,7 +375,7 @@ def get_analysis_from_db(repo_name):
 
         # Επεξεργασία των δεδομένων
         for row in rows:
-            filename, author, timestamp, sha, detected_kus, elapsed_time = row
+            filename, author, timestamp, sha, detected_kus, elapsed_time, analysis_params, model_version = row
 
             # Αν η στήλη detected_kus είναι JSON string, κάνουμε deserialization
             if isinstance(detected_kus, str):
@@ -340,7 +393,9 @@ def get_analysis_from_db(repo_name):
                 "timestamp": timestamp_deserialized.isoformat() if timestamp_deserialized else None,
                 "sha": sha,
                 "detected_kus": detected_kus_deserialized,
-                "elapsed_time": elapsed_time
+                "elapsed_time": elapsed_time,
+                "analysis_params": analysis_params,
+                "model_version": model_version
             })
 
         cur.close()
@@ -363,7 +418,8 @@ def get_allanalysis_from_db():
 
         # Εκτέλεση του query για ανάκτηση όλων των δεδομένων από τον πίνακα analysis_results
         cur.execute('''
-            SELECT ar.filename, ar.author, ar.timestamp, ar.sha, ar.detected_kus, ar.elapsed_time
+            SELECT ar.filename, ar.author, ar.timestamp, ar.sha, ar.detected_kus, ar.elapsed_time,
+                ar.analysis_params, ar.model_version
             FROM analysis_results ar
             JOIN repositories r ON ar.repo_name = r.name  
             WHERE r.url LIKE 'https://github.com/apache/%';
@@ -375,7 +431,7 @@ def get_allanalysis_from_db():
 
         # Επεξεργασία των δεδομένων
         for row in rows:
-            filename, author, timestamp, sha, detected_kus, elapsed_time = row
+            filename, author, timestamp, sha, detected_kus, elapsed_time, analysis_params, model_version = row
 
             # Αν η στήλη detected_kus είναι JSON string, κάνουμε deserialization
             if isinstance(detected_kus, str):
@@ -393,7 +449,9 @@ def get_allanalysis_from_db():
                 "timestamp": timestamp_str,
                 "sha": sha,
                 "detected_kus": detected_kus_deserialized,
-                "elapsed_time": elapsed_time
+                "elapsed_time": elapsed_time,
+                "analysis_params": analysis_params,
+                "model_version": model_version
             })
 
         cur.close()
@@ -485,6 +543,168 @@ def get_analysis_withsha_db(sha):
     finally:
         conn.close()
 
+def rethreshold_analysis(thresholds, repo_name=None):
+    """
+    Recomputes detected_kus from the stored KU scores with new thresholds, without running the model again.
+    The results of an analysis of some KUs only are recomputed for those KUs.
+
+    Results with partial scores, whose analysis stopped before scoring every window, are skipped, as well as those
+    stored before partial scores were flagged: re-running the model with the new thresholds could give another
+    result for them.
+
+        Parameters:
+            thresholds (list): The threshold of every KU, in KU order.
+            repo_name (str): The repository to update, or None for all repositories.
+
+        Returns:
+            (updated, skipped) (tuple): The number of updated analysis results, and of results skipped because of
+            their partial scores, or None if an error occurred.
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        query = 'SELECT id, ku_scores, analysis_params FROM analysis_results WHERE ku_scores IS NOT NULL'
+        count_query = '''
+            SELECT COUNT(*) FROM analysis_results
+            WHERE ku_scores IS NOT NULL AND ku_scores_partial IS NOT FALSE
+        '''
+        params = ()
+        if repo_name is not None:
+            query += ' AND repo_name = %s'
+            count_query += ' AND repo_name = %s'
+            params = (repo_name,)
+        cur.execute(count_query, params)
+        (skipped,) = cur.fetchone()
+        cur.execute(query + ' AND ku_scores_partial IS FALSE', params)
+
+        updates = [
+            (result_id, json.dumps(apply_thresholds(
+                unpack_ku_scores(ku_scores), thresholds, (analysis_params or {}).get("only_kus"),
+            )))
+            for result_id, ku_scores, analysis_params in cur.fetchall()
+        ]
+        execute_values(cur, '''
+            UPDATE analysis_results AS ar
+            SET detected_kus = v.detected_kus::jsonb
+            FROM (VALUES %s) AS v(id, detected_kus)
+            WHERE ar.id = v.id
+        ''', updates, page_size=1000)
+
+        conn.commit()
+        cur.close()
+        return len(updates), skipped
+    except Exception as e:
+        print(f"An error occurred re-thresholding the analysis results: {e}")
+        return None
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def get_blob_scores(blob_shas, analysis_key):
+    """
+    Returns the stored KU scores of the given git blobs, for the blobs already analyzed with the same analysis key.
+
+        Parameters:
+            blob_shas (list): The ids of the git blobs to look up.
+            analysis_key (str): Identifies the model and window settings the scores were computed with.
+
+        Returns:
+            ku_scores (dict): The (KU scores, partial) of every blob found, by blob id, partial being whether the
+            scores only cover the windows scored before the analysis of the blob stopped early.
+    """
+    if not blob_shas:
+        return {}
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT blob_sha, ku_scores, ku_scores_partial IS NOT FALSE
+            FROM blob_results
+            WHERE analysis_key = %s AND blob_sha = ANY(%s)
+        ''', (analysis_key, list(set(blob_shas))))
+        blob_scores = {
+            blob_sha: (unpack_ku_scores(ku_scores), partial) for blob_sha, ku_scores, partial in cur.fetchall()
+        }
+        cur.close()
+        return blob_scores
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return {}
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def get_blob_windows(blob_shas, analysis_key):
+    """
+    Returns the content and the stored window scores of the given git blobs, for the blobs analyzed with the same
+    analysis key whose window scores were kept.
+
+        Parameters:
+            blob_shas (list): The ids of the git blobs to look up.
+            analysis_key (str): Identifies the model and window settings the scores were computed with.
+
+        Returns:
+            blob_windows (dict): The (file content, window scores) of every blob found, by blob id.
+    """
+    if not blob_shas:
+        return {}
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        # The content of a blob is that of any commit row with the blob
+        cur.execute('''
+            SELECT b.blob_sha, c.file_content, b.ku_scores, b.window_scores
+            FROM blob_results b
+            JOIN LATERAL (
+                SELECT file_content FROM commits WHERE commits.blob_sha = b.blob_sha LIMIT 1
+            ) c ON TRUE
+            WHERE b.analysis_key = %s AND b.blob_sha = ANY(%s) AND b.window_scores IS NOT NULL
+        ''', (analysis_key, list(set(blob_shas))))
+        blob_windows = {
+            blob_sha: (file_content, unpack_window_scores(window_scores, len(unpack_ku_scores(ku_scores))))
+            for blob_sha, file_content, ku_scores, window_scores in cur.fetchall()
+        }
+        cur.close()
+        return blob_windows
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return {}
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def save_blob_scores(blob_sha, analysis_key, ku_scores, window_scores=None, ku_scores_partial=False):
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        window_scores_serialized = (
+            psycopg2.Binary(pack_window_scores(window_scores, len(ku_scores))) if window_scores is not None else None
+        )
+        cur.execute('''
+            INSERT INTO blob_results (blob_sha, analysis_key, ku_scores, window_scores, ku_scores_partial)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (blob_sha, analysis_key) DO NOTHING
+        ''', (
+            blob_sha, analysis_key, psycopg2.Binary(pack_ku_scores(ku_scores)), window_scores_serialized,
+            ku_scores_partial,
+        ))
+        conn.commit()
+        cur.close()
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        if conn is not None:
+            conn.close()
+
+
 def update_analysis_status(repo_name, status, start_time=None, end_time=None, progress=None, error_message=None):
     try:
         conn = get_db_connection()
@@ -545,7 +765,7 @@ def analyze_repository_background(repo_name, files):
         try:
             logging.debug(f"Analyzing file: {file.filename}")
             file_start_time = time.time()
-            results = codebert_sliding_window([file], 35, 35, 1, 25, model)
+            results = codebert_sliding_window([file], 35, 35, 1, 25, get_codebert())
             file_end_time = time.time()
             elapsed_time = file_end_time - file_start_time
 
@@ -15,14 +15,51 @@ from api.data_db import (
     update_analysis_status,
     get_analysis_status,
     get_allanalysis_from_db,
+    rethreshold_analysis,
+    get_blob_scores,
+    get_blob_windows,
+    save_blob_scores,
 )
+from core.analysis.scores import ku_thresholds, ku_indices
 from core.git_operations import clone_repo, repo_exists, extract_contributions
 from core.git_operations.repo import pull_repo, get_history_repo
 from core.utils.code_files_loader import read_files_from_dict_list
 from flask_swagger_ui import get_swaggerui_blueprint  # Import the Swagger UI blueprint
-from core.ml_operations.loader import load_codebert_model
-from core.analysis.codebert_sliding_window import codebert_sliding_window
-from config.settings import CLONED_REPO_BASE_PATH, CODEBERT_BASE_PATH
+from core.ml_operations.registry import registry
+from core.analysis.inference_scheduler import get_scheduler, retire_scheduler
+from core.analysis.codebert_pool import get_codebert_pool, retire_codebert_pool
+from core.ml_operations.model_server import CodeBERTClient
+from core.analysis.near_duplicates import NearDuplicateIndex
+from core.analysis.blob_reuse import BlobReuse, analysis_key
+from core.analysis.incremental import IncrementalAnalysis
+from core.analysis.cascade import CascadeScreen
+from core.analysis.autotune import window_params, measure_throughput, tune_windows
+from core.utils.code_file import CodeFile
+from config.settings import (
+    CLONED_REPO_BASE_PATH,
+    CODEBERT_MIN_WINDOW_SIZE,
+    CODEBERT_MAX_WINDOW_SIZE,
+    CODEBERT_WINDOW_GROWTH_STEP,
+    CODEBERT_WINDOW_STRIDE,
+    CODEBERT_TARGET_TIME,
+    CODEBERT_AUTOTUNE_SIZES,
+    CODEBERT_MIN_COVERAGE,
+    CODEBERT_BATCH_SIZE,
+    CODEBERT_PROCESSES,
+    CODEBERT_THREADS_PER_PROCESS,
+    CODEBERT_SCHEDULER_LOOKAHEAD,
+    CODEBERT_TOKEN_LEVEL_WINDOWS,
+    CODEBERT_WINDOW_MODE,
+    CODEBERT_WINDOW_SCHEDULE,
+    CODEBERT_STORE_WINDOW_SCORES,
+    CODEBERT_NEAR_DUPLICATE_DISTANCE,
+    CODEBERT_INCREMENTAL,
+    CODEBERT_CASCADE,
+    CODEBERT_CASCADE_MARGIN,
+    CODEBERT_CASCADE_MARGINS,
+)
+from collections import deque
+from itertools import islice
 import threading
 import time
 import logging
@@ -33,11 +70,22 @@ import datetime
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes.  This is generally better than disabling it.
 
-# Load model
-model = load_codebert_model(CODEBERT_BASE_PATH, 27)
+# The scheduler and worker pool of a previous CodeBERT version are released once its last analysis finishes
+registry.on_retire("codebert", retire_scheduler)
+registry.on_retire("codebert", retire_codebert_pool)
+
+
+def analyze_repository_background(repo_url, files, params=None, target_time=None, only_kus=None):
+    # The model is loaded by the first analysis, unless it was warmed up. An analysis runs on the version current
+    # at its start until it ends, even if a newer version is swapped in by a reload meanwhile.
+    model, model_version = registry.checkout("codebert")
+    try:
+        yield from _analyze_repository(repo_url, files, model, model_version, params, target_time, only_kus)
+    finally:
+        registry.checkin("codebert", model_version)
 
 
-def analyze_repository_background(repo_url, files):
+def _analyze_repository(repo_url, files, model, model_version, params, target_time, only_kus):
     repo_name = repo_url.split("/")[-1].replace(".git", "")
     analysis_results = []
     total_files = len(files)
@@ -49,70 +97,188 @@ def analyze_repository_background(repo_url, files):
         repo_name, "in-progress", start_time=start_time, progress=0
     )
 
-    for file in files.values():
-        try:
-            logging.debug(f"Analyzing file: {file.filename}")
-            file_start_time = time.time()
-            results = codebert_sliding_window([file], 35, 35, 1, 25, model)
-            file_end_time = time.time()
-            elapsed_time = file_end_time - file_start_time
-
-            if isinstance(file.timestamp, datetime.datetime):
-                timestmp = file.timestamp.isoformat()
-            else:
-                timestmp = file.timestamp
-
-            file_data = {
-                "filename": file.filename,
-                "author": file.author,
-                "timestamp": timestmp,
-                "sha": file.sha,
-                "detected_kus": file.ku_results,
-                "elapsed_time": elapsed_time,
-                "repoUrl": repo_url,
-            }
-            analysis_results.append(file_data)
-            analyzed_files_count += 1
-
-            logging.info(
-                f"Successfully analyzed file {analyzed_files_count}/{total_files}: {file.filename}"
+    # The window parameters are tuned to the throughput of the host when there is a target time
+    params = params or window_params(
+        CODEBERT_MIN_WINDOW_SIZE, CODEBERT_MAX_WINDOW_SIZE, CODEBERT_WINDOW_GROWTH_STEP, CODEBERT_WINDOW_STRIDE,
+    )
+    if target_time:
+        windows_per_second = measure_throughput(model, files.values(), params, CODEBERT_BATCH_SIZE)
+        if windows_per_second:
+            params = tune_windows(
+                [file.total_lines for file in files.values()], windows_per_second, target_time,
+                CODEBERT_MIN_COVERAGE, CODEBERT_AUTOTUNE_SIZES, params,
             )
+            params["target_time"] = target_time
+            logging.info(f"Window parameters for {repo_name} at {windows_per_second:.1f} windows/s: {params}")
+    window_args = (params["min_win_size"], params["max_win_size"], params["win_increase_step"], params["move_step"])
+
+    # An analysis of some KUs only stops scanning a file once those are detected, and only stores their results
+    if only_kus is not None:
+        params = {**params, "only_kus": only_kus}
+        window_options = {"only_kus": only_kus}
+    else:
+        window_options = {}
+
+    # Windows of the next files are queued ahead, so that the scheduler can fill its batches across files,
+    # or the files are spread over worker processes when CODEBERT_PROCESSES is set. A client of the model server
+    # is not, as the server already runs the model in its own process.
+    use_processes = bool(CODEBERT_PROCESSES) and not isinstance(model, CodeBERTClient)
+    if CODEBERT_PROCESSES and not use_processes:
+        logging.warning("CODEBERT_PROCESSES is ignored when CodeBERT runs in a model server")
+    if use_processes:
+        scheduler = get_codebert_pool(model, CODEBERT_PROCESSES, CODEBERT_THREADS_PER_PROCESS)
+    else:
+        scheduler = get_scheduler(model)
+
+    # Windows of the repository reuse the probabilities of their scored near-duplicates, if enabled
+    if CODEBERT_NEAR_DUPLICATE_DISTANCE is not None:
+        if use_processes:
+            logging.warning("Near-duplicate windows are not reused when CODEBERT_PROCESSES is set")
+        else:
+            window_options["near_duplicates"] = NearDuplicateIndex(CODEBERT_NEAR_DUPLICATE_DISTANCE)
 
-            # Save results using repo_name
-            save_analysis_to_db(repo_name, file_data)
-
-            # Update progress using repo_name
-            progress = int((analyzed_files_count / total_files) * 100)
-            update_analysis_status(
-                repo_name, "in-progress", start_time=start_time, progress=progress
+    # The binary classifiers screen the windows before CodeBERT, if enabled
+    if CODEBERT_CASCADE:
+        if use_processes:
+            logging.warning("The cascade screen is not applied when CODEBERT_PROCESSES is set")
+        else:
+            classifiers, classifiers_version = registry.get_versioned("binary_classifiers")
+            window_options["screen"] = CascadeScreen(
+                classifiers, model.number_of_kus, CODEBERT_CASCADE_MARGIN, CODEBERT_CASCADE_MARGINS, only_kus,
             )
+            params = {**params, "classifiers_version": classifiers_version}
+
+    # Files whose git blob was already analyzed with the same model and windows reuse its KU scores
+    blob_key = analysis_key(
+        model_version, *window_args, CODEBERT_WINDOW_MODE,
+        CODEBERT_NEAR_DUPLICATE_DISTANCE if "near_duplicates" in window_options else None, CODEBERT_INCREMENTAL,
+        (CODEBERT_CASCADE_MARGIN, sorted(CODEBERT_CASCADE_MARGINS.items())) if "screen" in window_options else None,
+        only_kus,
+    )
+    blob_scores = get_blob_scores([file.blob_sha for file in files.values() if file.blob_sha], blob_key)
+    blob_reuse = scheduler = BlobReuse(scheduler, model.thresholds, blob_scores)
+
+    # In incremental mode, the files of the analysis are analyzed oldest first, so that the next version of a file
+    # can reuse the window scores of the previous one, which otherwise come from earlier analyses
+    keep_window_scores = CODEBERT_STORE_WINDOW_SCORES or CODEBERT_INCREMENTAL
+    if CODEBERT_INCREMENTAL:
+        previous_files = {}
+        previous_blob_shas = [file.previous_blob_sha for file in files.values() if file.previous_blob_sha]
+        for blob_sha, (content, window_scores) in get_blob_windows(previous_blob_shas, blob_key).items():
+            previous_files[blob_sha] = CodeFile(blob_sha, content)
+            previous_files[blob_sha].window_scores = window_scores
+        scheduler = IncrementalAnalysis(scheduler, previous_files)
+        pending_files = iter(sorted(files.values(), key=lambda f: (f.timestamp is None, f.timestamp)))
+    else:
+        pending_files = iter(files.values())
+    # (file, future, submit time, time the future was done at) of the files queued ahead
+    queued_files = deque()
+
+    try:
+        while True:
+            for file in islice(pending_files, CODEBERT_SCHEDULER_LOOKAHEAD - len(queued_files)):
+                submit_time, done_at = time.time(), []
+                file_future = scheduler.submit_file(
+                    file, *window_args,
+                    token_level=CODEBERT_TOKEN_LEVEL_WINDOWS,
+                    window_mode=CODEBERT_WINDOW_MODE,
+                    schedule=CODEBERT_WINDOW_SCHEDULE,
+                    keep_window_scores=keep_window_scores,
+                    **window_options,
+                )
+                file_future.add_done_callback(lambda _, done_at=done_at: done_at.append(time.time()))
+                queued_files.append((file, file_future, submit_time, done_at))
+            if not queued_files:
+                break
+            file, file_future, submit_time, done_at = queued_files.popleft()
+
+            try:
+                logging.debug(f"Analyzing file: {file.filename}")
+                file_future.result()
+                # From the submission of the file to the end of its analysis, which includes the time its windows
+                # waited behind those of the files queued before it
+                elapsed_time = (done_at[0] if done_at else time.time()) - submit_time
+
+                if isinstance(file.timestamp, datetime.datetime):
+                    timestmp = file.timestamp.isoformat()
+                else:
+                    timestmp = file.timestamp
+
+                file_data = {
+                    "filename": file.filename,
+                    "author": file.author,
+                    "timestamp": timestmp,
+                    "sha": file.sha,
+                    "detected_kus": file.ku_results,
+                    "elapsed_time": elapsed_time,
+                    "repoUrl": repo_url,
+                }
+                analysis_results.append(file_data)
+                analyzed_files_count += 1
+
+                logging.info(
+                    f"Successfully analyzed file {analyzed_files_count}/{total_files}: {file.filename}"
+                )
 
-            # Send progress and data update to frontend, including repoUrl
-            yield f"data: {json.dumps({'progress': progress, 'file_data': file_data, 'repoUrl': repo_url})}\n\n"
+                # Save results using repo_name
+                save_analysis_to_db(
+                    repo_name, file_data, ku_scores=file.ku_scores,
+                    window_scores=file.window_scores if CODEBERT_STORE_WINDOW_SCORES else None,
+                    analysis_params=params, model_version=model_version, ku_scores_partial=file.ku_scores_partial,
+                )
+                if file.blob_sha and file.blob_sha not in blob_scores:
+                    save_blob_scores(
+                        file.blob_sha, blob_key, file.ku_scores, file.window_scores, file.ku_scores_partial,
+                    )
+
+                # Update progress using repo_name
+                progress = int((analyzed_files_count / total_files) * 100)
+                update_analysis_status(
+                    repo_name, "in-progress", start_time=start_time, progress=progress
+                )
 
-        except Exception as e:
-            logging.exception(
-                f"Error analyzing file: {file.filename}. Total analyzed before error: {analyzed_files_count}."
-            )
-            update_analysis_status(
-                repo_name,
-                "error",
-                start_time=start_time,
-                end_time=datetime.datetime.now(),
-                error_message=str(e),
-            )
-            yield f"data: {json.dumps({'error': str(e), 'repoUrl': repo_url})}\n\n"
-            return
+                # Send progress and data update to frontend, including repoUrl
+                yield f"data: {json.dumps({'progress': progress, 'file_data': file_data, 'repoUrl': repo_url})}\n\n"
+
+            except Exception as e:
+                logging.exception(
+                    f"Error analyzing file: {file.filename}. Total analyzed before error: {analyzed_files_count}."
+                )
+                update_analysis_status(
+                    repo_name,
+                    "error",
+                    start_time=start_time,
+                    end_time=datetime.datetime.now(),
+                    error_message=str(e),
+                )
+                yield f"data: {json.dumps({'error': str(e), 'repoUrl': repo_url})}\n\n"
+                return
+    finally:
+        # The files queued ahead are dropped if the analysis fails, or if the client disconnects, which closes the
+        # generator
+        for _, queued_future, _, _ in queued_files:
+            queued_future.cancel()
 
     # Final update after all files are processed
     end_time = datetime.datetime.now()
     logging.info(
-        f"Analysis completed for repository: {repo_name}. Total files analyzed: {len(analysis_results)}"
+        f"Analysis completed for repository: {repo_name}. Total files analyzed: {len(analysis_results)}, "
+        f"reused from identical blobs: {blob_reuse.files_reused}"
     )
+    if CODEBERT_INCREMENTAL:
+        logging.info(f"Files analyzed incrementally for {repo_name}: {scheduler.files_incremental}")
+    if "near_duplicates" in window_options:
+        logging.info(f"Near-duplicate windows for {repo_name}: {window_options['near_duplicates'].stats()}")
+    if "screen" in window_options:
+        logging.info(f"Cascade screen for {repo_name}: {window_options['screen'].stats()}")
     update_analysis_status(
         repo_name, "completed", start_time=start_time, end_time=end_time, progress=100
     )
-    yield f"data: {json.dumps({'progress': 100, 'message': 'Analysis completed', 'repoUrl': repo_url})}\n\n"
+    completed = {
+        'progress': 100, 'message': 'Analysis completed', 'repoUrl': repo_url,
+        'analysis_params': params, 'model_version': model_version,
+    }
+    yield f"data: {json.dumps(completed)}\n\n"
 
 
 def init_routes(app):
@@ -296,6 +462,38 @@ def init_routes(app):
             logging.error("No repository URL provided.")
             return jsonify({"error": "Repository URL is required"}), 400
 
+        # Window parameters of the request, defaulting to the configured ones
+        try:
+            window_size = int(request.args.get("window_size", CODEBERT_MIN_WINDOW_SIZE))
+            params = window_params(
+                window_size,
+                int(request.args.get(
+                    "max_window_size", window_size if "window_size" in request.args else CODEBERT_MAX_WINDOW_SIZE
+                )),
+                int(request.args.get("window_growth_step", CODEBERT_WINDOW_GROWTH_STEP)),
+                int(request.args.get("window_stride", CODEBERT_WINDOW_STRIDE)),
+            )
+            target_time = request.args.get("target_time", CODEBERT_TARGET_TIME)
+            target_time = float(target_time) if target_time is not None else None
+        except ValueError:
+            return jsonify({"error": "Window parameters must be numbers"}), 400
+        if min(params.values()) < 1 or params["max_win_size"] < params["min_win_size"]:
+            return jsonify({"error": "Window sizes, growth step and stride must be positive, "
+                                     "and max_window_size at least window_size"}), 400
+        if target_time is not None and target_time <= 0:
+            return jsonify({"error": "target_time must be positive"}), 400
+
+        # Comma-separated KU names to detect, by default all of them
+        only_kus = request.args.get("only_kus")
+        if only_kus is not None:
+            kus = [ku.strip() for ku in only_kus.split(",") if ku.strip()]
+            if not kus:
+                return jsonify({"error": "only_kus must name at least one KU"}), 400
+            try:
+                only_kus = [f"K{i + 1}" for i in ku_indices(registry.get("codebert").number_of_kus, kus)]
+            except ValueError as e:
+                return jsonify({"error": f"Invalid only_kus: {e}"}), 400
+
         repo_name = repo_url.split("/")[-1].replace(".git", "")
         logging.info(f"Starting analysis for repository: {repo_name}")
 
@@ -309,7 +507,8 @@ def init_routes(app):
             files = read_files_from_dict_list(commits)
             logging.info(f"Retrieved {len(files)} files for analysis.")
             return Response(
-                analyze_repository_background(repo_url, files), content_type="text/event-stream"
+                analyze_repository_background(repo_url, files, params, target_time, only_kus),
+                content_type="text/event-stream",
             )
 
         except Exception as e:
@@ -369,6 +568,68 @@ def init_routes(app):
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
+    @app.route("/rethreshold", methods=["POST"])
+    def rethreshold():
+        """
+        Recompute the detected KUs of a repository, or of all repositories, from the stored KU scores. The results
+        with partial scores, of files whose analysis stopped early, are skipped.
+        """
+        data = request.get_json(silent=True) or {}
+        repo_name = data.get("repo_name")
+
+        if not isinstance(data.get("thresholds", {}), dict):
+            return jsonify({"error": "thresholds must map KU names to thresholds"}), 400
+        try:
+            thresholds = ku_thresholds(registry.get("codebert").number_of_kus, data.get("thresholds"))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid thresholds: {e}"}), 400
+        if not all(0 <= threshold <= 1 for threshold in thresholds):
+            return jsonify({"error": "Thresholds must be between 0 and 1"}), 400
+
+        result = rethreshold_analysis(thresholds, repo_name)
+        if result is None:
+            return jsonify({"error": "Failed to update the analysis results"}), 500
+        updated, skipped = result
+        return jsonify({"updated": updated, "skipped": skipped}), 200
+
+    @app.route("/models", methods=["GET"])
+    def list_models():
+        """
+        Get the load status, load time and memory of every model.
+        """
+        return jsonify(registry.stats()), 200
+
+    @app.route("/models/warmup", methods=["POST"])
+    def warmup_models():
+        """
+        Start loading the given models, or all of them, in the background.
+        """
+        data = request.get_json(silent=True) or {}
+        names = data.get("models")
+
+        unknown = [name for name in names or [] if name not in registry.stats()]
+        if unknown:
+            return jsonify({"error": f"Unknown models: {', '.join(unknown)}"}), 400
+
+        registry.warmup(names, background=True)
+        return jsonify({"message": "Warmup started"}), 202
+
+    @app.route("/models/reload", methods=["POST"])
+    def reload_models():
+        """
+        Start loading a new version of the given models, or of all of them, from their files in the background.
+        Running analyses finish on the previous version.
+        """
+        data = request.get_json(silent=True) or {}
+        names = data.get("models")
+
+        unknown = [name for name in names or [] if name not in registry.stats()]
+        if unknown:
+            return jsonify({"error": f"Unknown models: {', '.join(unknown)}"}), 400
+
+        registry.reload(names, background=True)
+        return jsonify({"message": "Reload started"}), 202
+
 
 init_routes(app)  # Call init_routes AFTER defining it
 
@@ -333,7 +333,86 @@ class FlaskAPITests(unittest.TestCase):
         data = json.loads(response.data)
         self.assertEqual(data['error'], 'Repository URL is required')
 
+    @patch('api.routes.registry')
+    @patch('api.routes.analyze_repository_background')
+    @patch('api.routes.get_commits_from_db')
+    @patch('api.routes.read_files_from_dict_list')
+    def test_analyze_window_parameters(self, mock_read_files, mock_get_commits, mock_analyze_background,
+                                       mock_registry):
+        """
+        Title: Testing the window parameters of a repository analysis
+        Description: This test verifies that the /analyze endpoint passes the window size, growth
+        step, stride, target time and KU subset of the request to the background analysis, that a
+        window size alone sets both the minimum and maximum size, and that invalid values are
+        rejected.
+        Related methods: app.analyze_repository_background
+        """
+        mock_get_commits.return_value = [{"commit": "123", "filename": "test_filename.py"}]
+        mock_read_files.return_value = {"test_filename.py": MagicMock()}
+        mock_analyze_background.return_value = iter([b'data: {"progress": 100}\n\n'])
+        mock_registry.get.return_value.number_of_kus = 27
+
+        response = self.client.get(
+            f'/analyze?repo_url={self.sample_repo_url}&window_size=20&window_stride=10&target_time=60')
+        self.assertEqual(response.status_code, 200)
+        args = mock_analyze_background.call_args[0]
+        self.assertEqual(args[2], {"min_win_size": 20, "max_win_size": 20, "win_increase_step": 1, "move_step": 10})
+        self.assertEqual(args[3], 60.0)
+
+        response = self.client.get(f'/analyze?repo_url={self.sample_repo_url}&only_kus=K12, K3,K3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_analyze_background.call_args[0][4], ["K3", "K12"])
+        mock_registry.get.assert_called_with("codebert")
+
+        for query in ['window_size=abc', 'window_size=0', 'window_stride=-5',
+                      'window_size=30&max_window_size=20', 'target_time=0', 'only_kus=K3,K99', 'only_kus=,']:
+            response = self.client.get(f'/analyze?repo_url={self.sample_repo_url}&{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+    @patch('api.routes.save_blob_scores')
+    @patch('api.routes.save_analysis_to_db')
+    @patch('api.routes.get_blob_scores', return_value={})
+    @patch('api.routes.update_analysis_status')
+    @patch('api.routes.get_scheduler')
+    @patch('api.routes.registry')
+    def test_analyze_client_disconnect(self, mock_registry, mock_get_scheduler, mock_update_status,
+                                       mock_get_blob_scores, mock_save_analysis, mock_save_blob_scores):
+        """
+        Title: Testing the end of an analysis whose client disconnects
+        Description: This test verifies that when the client of the /analyze event stream disconnects,
+        which closes the analysis generator, the files queued ahead of the analyzed ones are cancelled and
+        the model is checked back in, and that the elapsed time of a file is measured from its submission.
+        Related methods: app.analyze_repository_background
+        """
+        from concurrent.futures import Future
+        from api.routes import analyze_repository_background
+
+        mock_registry.checkout.return_value = (MagicMock(thresholds=[0.5] * 27, number_of_kus=27), "v1")
+        futures = []
+
+        def submit_file(code_file, *args, **kwargs):
+            futures.append(Future())
+            if len(futures) == 1:
+                code_file.ku_scores, code_file.window_scores, code_file.ku_scores_partial = [0.0] * 27, None, False
+                futures[0].set_result([0] * 27)
+            return futures[-1]
+
+        mock_get_scheduler.return_value.submit_file.side_effect = submit_file
+        files = {
+            f"file{i}.java": MagicMock(filename=f"file{i}.java", author="author", sha="sha", blob_sha=None,
+                                       timestamp=None, ku_results={})
+            for i in range(3)
+        }
+
+        analysis = analyze_repository_background(self.sample_repo_url, files)
+        data = json.loads(next(analysis)[len("data: "):])
+        self.assertEqual(data["file_data"]["filename"], "file0.java")
+        self.assertGreaterEqual(data["file_data"]["elapsed_time"], 0)
+        self.assertEqual(len(futures), 3)
 
+        analysis.close()
+        self.assertTrue(all(future.cancelled() for future in futures[1:]))
+        mock_registry.checkin.assert_called_once_with("codebert", "v1")
 
     @patch('api.routes.get_analysis_status')
     def test_analysis_status_endpoint(self, mock_get_status):
@@ -444,5 +523,88 @@ class FlaskAPITests(unittest.TestCase):
         self.assertEqual(response.status_code, 500)
         mock_get_all_analysis.side_effect = None
 
+    @patch('api.routes.registry')
+    @patch('api.routes.rethreshold_analysis')
+    def test_rethreshold_endpoint(self, mock_rethreshold, mock_registry):
+        """
+        Title: Testing re-thresholding of stored analysis results
+        Description: This test verifies that the /rethreshold endpoint expands the per-KU thresholds
+        of the request (0.5 for the KUs not given) and recomputes the detected KUs of a repository, or of
+        all repositories, from the stored scores, reporting the results skipped for their partial scores.
+        It also tests the validation of the thresholds and the handling of database errors.
+        Related methods: app.rethreshold_analysis
+        """
+        mock_rethreshold.return_value = (3, 2)
+        mock_registry.get.return_value.number_of_kus = 27
+
+        response = self.client.post('/rethreshold', json={"repo_name": self.sample_repo_name, "thresholds": {"K2": 0.8}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data), {"updated": 3, "skipped": 2})
+        expected_thresholds = [0.5] * 27
+        expected_thresholds[1] = 0.8
+        mock_rethreshold.assert_called_once_with(expected_thresholds, self.sample_repo_name)
+
+        # All repositories with the default thresholds
+        mock_rethreshold.reset_mock()
+        response = self.client.post('/rethreshold', json={})
+        self.assertEqual(response.status_code, 200)
+        mock_rethreshold.assert_called_once_with([0.5] * 27, None)
+
+        # Invalid thresholds, including those of KUs the model does not detect
+        mock_registry.get.return_value.number_of_kus = 20
+        for thresholds in ({"K21": 0.5}, {"K99": 0.5}, {"K1": 1.5}, {"K1": "high"}, [0.5]):
+            response = self.client.post('/rethreshold', json={"thresholds": thresholds})
+            self.assertEqual(response.status_code, 400)
+
+        # Database error
+        mock_rethreshold.return_value = None
+        response = self.client.post('/rethreshold', json={})
+        self.assertEqual(response.status_code, 500)
+
+    @patch('api.routes.registry')
+    def test_models_endpoints(self, mock_registry):
+        """
+        Title: Testing model status, warmup and reload endpoints
+        Description: This test verifies that the /models endpoint returns the load status of every
+        model from the model registry, and that the /models/warmup and /models/reload endpoints start
+        a background warmup or reload of the requested models, rejecting unknown model names. It also
+        checks that importing the routes does not load any model.
+        Related methods: registry.stats, registry.warmup, registry.reload
+        """
+        from core.ml_operations.registry import registry
+        self.assertFalse(registry.is_loaded("codebert"))
+
+        stats = {
+            "codebert": {"loaded": True, "load_time": 4.2, "memory": 500000000},
+            "binary_classifiers": {"loaded": False, "load_time": None, "memory": None}
+        }
+        mock_registry.stats.return_value = stats
+
+        response = self.client.get('/models')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data), stats)
+
+        # Warmup of all models
+        response = self.client.post('/models/warmup')
+        self.assertEqual(response.status_code, 202)
+        mock_registry.warmup.assert_called_once_with(None, background=True)
+
+        # Warmup of an unknown model
+        mock_registry.warmup.reset_mock()
+        response = self.client.post('/models/warmup', json={"models": ["unknown"]})
+        self.assertEqual(response.status_code, 400)
+        mock_registry.warmup.assert_not_called()
+
+        # Reload of the CodeBERT model
+        response = self.client.post('/models/reload', json={"models": ["codebert"]})
+        self.assertEqual(response.status_code, 202)
+        mock_registry.reload.assert_called_once_with(["codebert"], background=True)
+
+        # Reload of an unknown model
+        mock_registry.reload.reset_mock()
+        response = self.client.post('/models/reload', json={"models": ["unknown"]})
+        self.assertEqual(response.status_code, 400)
+        mock_registry.reload.assert_not_called()
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
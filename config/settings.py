@@ -5,6 +5,7 @@ TEMP_FILES_BASE_PATH = os.path.normpath(os.path.join(ROOT_DIR, "temp"))
 OUTPUT_FILES_BASE_PATH = os.path.normpath(os.path.join(ROOT_DIR, "output"))
 CLONED_REPO_BASE_PATH = os.path.normpath(os.path.join(ROOT_DIR, "cloned_repos"))
 MODELS_BASE_PATH = os.path.normpath(os.path.join(ROOT_DIR, "models", "binary_classifiers"))
+MODELS_MMAP_PATH = os.path.normpath(os.path.join(ROOT_DIR, "models", "binary_classifiers_mmap"))
 CODEBERT_BASE_PATH = os.path.normpath(os.path.join(ROOT_DIR, "models", "codebert"))
 FILE_TYPE = "java"
 MODELS_TO_LOAD = [
@@ -34,3 +35,61 @@ MODELS_TO_LOAD = [
     "K27",
     "K28",
 ]
+# Number of windows the binary classifiers vectorize and predict at once, across files
+CLASSIFIER_BATCH_SIZE = 256
+# Worker processes of the binary classifiers (None for one per CPU), each loading every classifier once, and the
+# number of files a worker analyzes per task
+CLASSIFIER_PROCESSES = None
+CLASSIFIER_CHUNK_SIZE = 16
+# Line window parameters of the analyses, overridable per /analyze request
+CODEBERT_MIN_WINDOW_SIZE = 35
+CODEBERT_MAX_WINDOW_SIZE = 35
+CODEBERT_WINDOW_GROWTH_STEP = 1
+CODEBERT_WINDOW_STRIDE = 25
+# Target inference time of an analysis in seconds, None to use the window parameters as they are. When set, the
+# window size among CODEBERT_AUTOTUNE_SIZES and the stride are tuned to the throughput measured on the host, keeping
+# at least CODEBERT_MIN_COVERAGE of the lines in a window
+CODEBERT_TARGET_TIME = None
+CODEBERT_AUTOTUNE_SIZES = [20, 35, 50]
+CODEBERT_MIN_COVERAGE = 0.9
+CODEBERT_BATCH_SIZE = 16
+CODEBERT_SCHEDULER_MAX_WAIT = 0.05
+CODEBERT_SCHEDULER_LOOKAHEAD = 32
+CODEBERT_BUCKET_WIDTH = 64
+CODEBERT_TOKEN_LEVEL_WINDOWS = True
+CODEBERT_TOKEN_OVERLAP = 64
+# "lines" for fixed-size line windows, "tokens" for token-budget windows, "methods" for whole Java methods
+CODEBERT_WINDOW_MODE = "lines"
+CODEBERT_WINDOW_SCHEDULE = "coarse_to_fine"
+CODEBERT_COARSE_FACTOR = 4
+CODEBERT_ENGINE = "torch"
+CODEBERT_QUANTIZE = False
+CODEBERT_ONNX_PATH = os.path.normpath(os.path.join(CODEBERT_BASE_PATH, "onnx"))
+# Worker processes of CodeBERT, each loading the model once, 0 to run it in the app; ignored with a model server
+CODEBERT_PROCESSES = 0
+CODEBERT_THREADS_PER_PROCESS = None
+# Path of the Unix socket of the model server (python -m core.ml_operations.model_server), None to load the model
+CODEBERT_SERVER_SOCKET = None
+# Models loaded in the background when the app starts, e.g. ["codebert"]; the others load on first use
+MODELS_TO_WARMUP = []
+# Dummy batches run through a reloaded model (POST /models/reload) before it replaces the previous version
+MODEL_WARMUP_BATCHES = 3
+# Whether the KU probabilities of every window are stored with the analysis results, besides the per-file maximum
+CODEBERT_STORE_WINDOW_SCORES = False
+# Window prediction cache: in-memory LRU entries (0 disables the cache), and SQLite file (None for memory only),
+# e.g. os.path.join(ROOT_DIR, "cache", "codebert_windows.sqlite"). Every worker of CODEBERT_PROCESSES has its own
+# in-memory entries, and shares the SQLite file.
+CODEBERT_CACHE_SIZE = 100000
+CODEBERT_CACHE_PATH = None
+CODEBERT_CACHE_DISK_SIZE = 5000000
+# Windows within this many differing SimHash bits of a window already scored in the same analysis reuse its
+# probabilities instead of running the model, None to score every window
+CODEBERT_NEAR_DUPLICATE_DISTANCE = None
+# Whether a file whose previous version was analyzed reuses the stored scores of the windows with the same lines as
+# one of its previous windows, and only runs the others; implies keeping the window scores of every analyzed blob
+CODEBERT_INCREMENTAL = False
+# Whether the binary classifiers screen the windows, so that CodeBERT only runs the windows where one of them scores
+# above 0.5 - margin, with the margin of every KU overridable in CODEBERT_CASCADE_MARGINS, e.g. {"K3": 0.3}
+CODEBERT_CASCADE = False
+CODEBERT_CASCADE_MARGIN = 0.1
+CODEBERT_CASCADE_MARGINS = {}
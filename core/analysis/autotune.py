@@ -0,0 +1,119 @@
+import logging
+import time
+from collections import Counter
+
+from core.analysis.windows import line_windows
+
+
+def window_params(min_win_size, max_win_size, win_increase_step, move_step):
+    """
+    Returns the line window parameters of an analysis, as recorded with its results.
+    """
+    return {
+        "min_win_size": min_win_size,
+        "max_win_size": max_win_size,
+        "win_increase_step": win_increase_step,
+        "move_step": move_step,
+    }
+
+
+def count_windows(line_counts, params):
+    """
+    Returns the number of windows, and the fraction of lines that at least one window covers, of files with the
+    given numbers of lines.
+    """
+    windows = 0
+    covered_lines = 0
+    for total_lines, files in Counter(line_counts).items():
+        min_win_size = min(params["min_win_size"], total_lines)
+        max_win_size = min(params["max_win_size"], total_lines)
+        move_step = params["move_step"]
+
+        if min_win_size == max_win_size:
+            # Windows of a single size start every move_step lines, and cover move_step lines each but the last
+            file_windows = (total_lines - max_win_size) // move_step + 1
+            file_covered_lines = (file_windows - 1) * min(move_step, max_win_size) + max_win_size
+        else:
+            spans = line_windows(total_lines, min_win_size, max_win_size, params["win_increase_step"], move_step)
+            file_windows = len(spans)
+            covered = [False] * total_lines
+            for start_idx, end_idx in spans:
+                covered[start_idx:end_idx] = [True] * (end_idx - start_idx)
+            file_covered_lines = sum(covered)
+
+        windows += files * file_windows
+        covered_lines += files * file_covered_lines
+
+    total = sum(line_counts)
+    return windows, covered_lines / total if total else 1.0
+
+
+def measure_throughput(model, files, params, batch_size, sample_windows=64):
+    """
+    Measures how many windows per second the model runs on this host, on windows of the given files.
+
+    The windows are run through the model itself, bypassing its prediction cache, so that the measure does not
+    depend on what was analyzed before.
+    """
+    windows = []
+    for f in sorted(files, key=lambda code_file: code_file.total_lines, reverse=True):
+        size = min(params["max_win_size"], f.total_lines)
+        for start_idx in range(0, f.total_lines - size + 1, params["move_step"]):
+            windows.append(f.lines[start_idx:start_idx + size])
+            if len(windows) >= sample_windows:
+                break
+        if len(windows) >= sample_windows:
+            break
+    if not windows:
+        return None
+
+    input_ids = model.encode(windows)
+    # A first batch warms the model up
+    model._forward(input_ids[:batch_size], batch_size)
+    start_time = time.perf_counter()
+    model._forward(input_ids, batch_size)
+    return len(input_ids) / (time.perf_counter() - start_time)
+
+
+def tune_windows(line_counts, windows_per_second, target_time, min_coverage, sizes, default_params):
+    """
+    Picks the window size and stride that run the most windows within a target time, among those that cover at
+    least min_coverage of the lines, or the cheapest ones if none fits in the target time.
+
+        Parameters:
+            line_counts (list): The number of lines of every file to analyze.
+            windows_per_second (float): The throughput of the model, as measured by measure_throughput.
+            target_time (float): The time the inference of all windows should take, in seconds.
+            min_coverage (float): The minimum fraction of lines covered by at least one window.
+            sizes (list): The window sizes to choose from, in lines.
+            default_params (dict): The parameters used if no candidate meets min_coverage.
+
+        Returns:
+            params (dict): The chosen window parameters, with their estimated windows, time and coverage.
+    """
+    candidates = []
+    for size in sizes:
+        # Strides up to twice the window size, which leaves gaps between windows
+        for move_step in range(max(size // 10, 1), 2 * size + 1, max(size // 10, 1)):
+            params = window_params(size, size, 1, move_step)
+            windows, coverage = count_windows(line_counts, params)
+            if coverage >= min_coverage:
+                candidates.append((windows / windows_per_second, windows, coverage, params))
+
+    if not candidates:
+        logging.warning(f"No window parameters cover {min_coverage:.0%} of the lines, using the defaults")
+        windows, coverage = count_windows(line_counts, default_params)
+        candidates = [(windows / windows_per_second, windows, coverage, default_params)]
+
+    within_target = [candidate for candidate in candidates if candidate[0] <= target_time]
+    if within_target:
+        estimated_time, windows, coverage, params = max(within_target, key=lambda candidate: candidate[1:3])
+    else:
+        estimated_time, windows, coverage, params = min(candidates, key=lambda candidate: candidate[0])
+
+    return {
+        **params,
+        "estimated_windows": windows,
+        "estimated_time": estimated_time,
+        "coverage": coverage,
+    }
@@ -0,0 +1,97 @@
+import hashlib
+from concurrent.futures import Future
+
+from core.analysis.scores import apply_thresholds
+
+
+def analysis_key(model_fingerprint, *window_options):
+    """
+    Identifies the model and the window settings of an analysis, which together determine the KU scores of a blob.
+    """
+    return hashlib.sha1(repr((model_fingerprint, window_options)).encode("utf-8")).hexdigest()
+
+
+class BlobReuse:
+    """
+    Wraps an InferenceScheduler or a CodeBERTPool, so that files whose git blob already has KU scores skip inference.
+
+    The scores of a blob come from earlier analyses, of any commit, branch or fork, through known_scores, or from
+    the first file with the same blob submitted in the same analysis, such as an unchanged file that was renamed.
+    known_scores maps blob ids to (KU scores, partial) pairs, partial being whether the scores are partial, as
+    described in FileScores.
+    """
+
+    def __init__(self, scheduler, thresholds, known_scores=None):
+        self.scheduler = scheduler
+        self.thresholds = thresholds
+        self.known_scores = known_scores or {}
+        self.files_reused = 0
+
+        # Blob id -> (file, future) of the first file of the analysis with that blob
+        self._submitted = {}
+
+    def submit_file(self, code_file, *args, **kwargs):
+        """
+        Takes the same parameters as InferenceScheduler.submit_file.
+
+            Returns:
+                future (Future): Resolves to the detected KUs of the file, one 0/1 entry per KU.
+        """
+        blob_sha = code_file.blob_sha
+        if blob_sha is None:
+            return self.scheduler.submit_file(code_file, *args, **kwargs)
+
+        if blob_sha in self.known_scores:
+            self.files_reused += 1
+            future = Future()
+            ku_scores, partial = self.known_scores[blob_sha]
+            future.set_result(self._reuse(code_file, ku_scores, None, kwargs.get("only_kus"), partial))
+            return future
+
+        if blob_sha in self._submitted:
+            self.files_reused += 1
+            first_file, first_future = self._submitted[blob_sha]
+            future = Future()
+
+            def on_first_done(done_future):
+                if future.cancelled():
+                    return
+                if done_future.cancelled() or done_future.exception() is not None:
+                    # Analyze the file on its own if the first one did not complete
+                    chain_future(self.scheduler.submit_file(code_file, *args, **kwargs), future)
+                else:
+                    future.set_result(self._reuse(
+                        code_file, first_file.ku_scores, first_file.window_scores, kwargs.get("only_kus"),
+                        first_file.ku_scores_partial,
+                    ))
+
+            first_future.add_done_callback(on_first_done)
+            return future
+
+        future = self.scheduler.submit_file(code_file, *args, **kwargs)
+        self._submitted[blob_sha] = (code_file, future)
+        return future
+
+    def _reuse(self, code_file, ku_scores, window_scores=None, only_kus=None, partial=False):
+        ku_results = apply_thresholds(ku_scores, self.thresholds, only_kus)
+        for ku_name, result in ku_results.items():
+            code_file.add_ku_result(ku_name, result)
+        code_file.set_ku_scores(ku_scores, window_scores, partial)
+        return list(apply_thresholds(ku_scores, self.thresholds).values())
+
+
+def chain_future(source, target):
+    """
+    Resolves the target future like the source future once it is done, unless the target was cancelled meanwhile.
+    """
+    def on_done(done_future):
+        if target.cancelled():
+            return
+        if done_future.cancelled():
+            target.cancel()
+        elif done_future.exception() is not None:
+            target.set_exception(done_future.exception())
+        else:
+            target.set_result(done_future.result())
+
+    source.add_done_callback(on_done)
@@ -0,0 +1,79 @@
+import re
+import threading
+
+import numpy as np
+
+from core.ml_operations.model import Model
+
+_KU_NAME = re.compile(r"^K(\d+)$")
+
+
+class CascadeScreen:
+    """
+    Screens windows with the sparse binary classifiers, so that CodeBERT only runs the windows where at least one of
+    them detects its KU, or is within a margin of detecting it.
+
+    A margin lowers the decision boundary of a classifier, from a score of 0.5 to 0.5 - margin, trading CodeBERT
+    calls for recall. The KUs without a classifier are not screened: they are only found in windows that pass the
+    screen because of other KUs.
+    """
+
+    def __init__(self, classifiers, number_of_kus, margin=0.1, margins=None, only_kus=None):
+        """
+        Builds the screen from the classifiers of the KUs of the CodeBERT model.
+
+            Parameters:
+                classifiers (list): The binary classifiers, as returned by load_models_from_directory, named by KU.
+                number_of_kus (int): The number of KUs of the CodeBERT model; other classifiers are ignored.
+                margin (float): The margin of every classifier.
+                margins (dict): Margins by KU name overriding margin, e.g. {"K3": 0.3}.
+                only_kus (list): If given, the KU names of the analysis; the classifiers of other KUs are ignored.
+        """
+        margins = margins or {}
+        kus = {f"K{i + 1}" for i in range(number_of_kus)} if only_kus is None else set(only_kus)
+        self.classifiers = []
+        self.boundaries = []
+        for classifier in classifiers:
+            match = _KU_NAME.match(str(classifier))
+            if match and 1 <= int(match.group(1)) <= number_of_kus and str(classifier) in kus:
+                self.classifiers.append(classifier)
+                self.boundaries.append(0.5 - margins.get(str(classifier), margin))
+
+        screened = {str(classifier) for classifier in self.classifiers}
+        self.unscreened_kus = [
+            f"K{i + 1}" for i in range(number_of_kus) if f"K{i + 1}" in kus and f"K{i + 1}" not in screened
+        ]
+        self.windows_screened = 0
+        self.windows_passed = 0
+        self._lock = threading.Lock()
+
+    def passes(self, windows):
+        """
+        Returns whether each window, a list of lines, passes the screen and must be run through CodeBERT.
+        """
+        passed = np.zeros(len(windows), dtype=bool)
+        # The windows are preprocessed once for all the classifiers
+        texts = Model.preprocess(windows) if self.classifiers else []
+        for classifier, boundary in zip(self.classifiers, self.boundaries):
+            passed |= np.asarray(classifier.predict_scores_preprocessed(texts)) > boundary
+
+        with self._lock:
+            self.windows_screened += len(windows)
+            self.windows_passed += int(passed.sum())
+        return passed.tolist()
+
+    def filter(self, code_file, spans):
+        """
+        Returns the spans of the windows of a file that pass the screen.
+        """
+        passed = self.passes([code_file.lines[start_idx:end_idx] for start_idx, end_idx in spans])
+        return [span for span, window_passed in zip(spans, passed) if window_passed]
+
+    def stats(self):
+        screened = self.windows_screened
+        return {
+            "windows_screened": screened,
+            "windows_passed": self.windows_passed,
+            "codebert_calls_avoided": 1 - self.windows_passed / screened if screened else 0,
+            "unscreened_kus": self.unscreened_kus,
+        }
@@ -0,0 +1,129 @@
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from core.analysis.model_worker import model_worker, window_texts
+from core.ml_operations.registry import load_binary_classifiers, binary_classifiers_fingerprint
+from config.settings import CLASSIFIER_BATCH_SIZE, CLASSIFIER_CHUNK_SIZE
+
+# The binary classifiers of a worker process, loaded once when the worker starts
+_worker_models = None
+
+
+class ClassifierPool:
+    """
+    Runs the binary classifiers on chunks of files in persistent worker processes.
+
+    Every worker loads the classifiers once, when it starts, and scores whole chunks of files with all of them,
+    preprocessing each window once. Only the files of a chunk are sent to a worker, and only their results are sent
+    back, so the traffic between the processes does not grow with the number of models. The workers are started
+    with spawn, since the Keras models do not survive a fork of a process that already ran TensorFlow.
+    """
+
+    def __init__(self, load_models=load_binary_classifiers, processes=None, chunk_size=CLASSIFIER_CHUNK_SIZE):
+        self.processes = processes or os.cpu_count()
+        self.chunk_size = chunk_size
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(load_models,),
+        )
+
+    def imap(
+            self,
+            files,
+            min_win_size,
+            max_win_size,
+            win_increase_step,
+            move_step,
+            schedule="linear",
+            coarse_factor=4,
+            only_kus=None,
+            batch_size=CLASSIFIER_BATCH_SIZE,
+    ):
+        """
+        Analyzes files with the binary classifiers, yielding the results of every file as soon as its chunk is done.
+
+            Parameters:
+                files (list): The CodeFiles to analyze.
+                min_win_size, max_win_size, win_increase_step, move_step (int): The line window parameters.
+                schedule (str): The order in which the windows of a file are predicted, "linear" or "coarse_to_fine".
+                coarse_factor (int): The stride of the first pass of the "coarse_to_fine" schedule, in windows.
+                only_kus (list): If given, the KU names whose classifiers run.
+                batch_size (int): The number of windows every classifier predicts at once.
+
+            Yields:
+                code_file (CodeFile): An analyzed file, from files.
+                ku_results (dict): Whether each classifier, by KU name, detects its KU in the file.
+        """
+        files = list(files)
+        if not files:
+            return
+        # Spread small analyses over all the workers, and split large ones into chunks of chunk_size files
+        chunk_size = min(self.chunk_size, math.ceil(len(files) / self.processes))
+        window_options = (min_win_size, max_win_size, win_increase_step, move_step, schedule, coarse_factor)
+
+        futures = {}
+        for chunk_start in range(0, len(files), chunk_size):
+            chunk = files[chunk_start:chunk_start + chunk_size]
+            future = self._executor.submit(_analyze_chunk, chunk, window_options, only_kus, batch_size)
+            futures[future] = chunk
+
+        try:
+            for future in as_completed(futures):
+                for code_file, ku_results in zip(futures[future], future.result()):
+                    yield code_file, ku_results
+        finally:
+            # Drop the chunks not started yet if the caller stops early
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self, wait=True, cancel_futures=True):
+        """
+        Stops the workers, once the chunks already submitted are done unless cancel_futures is set.
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+def _init_worker(load_models):
+    global _worker_models
+    _worker_models = load_models()
+
+
+def _analyze_chunk(files, window_options, only_kus, batch_size):
+    models = [model for model in _worker_models if only_kus is None or str(model) in only_kus]
+    # Every window of the chunk is preprocessed once, for all the models
+    file_texts = {index: window_texts(f, *window_options) for index, f in enumerate(files)}
+
+    results = [{} for _ in files]
+    for model in models:
+        for index, detected in model_worker(model, file_texts, batch_size).items():
+            results[index][str(model)] = detected
+    return results
+
+
+_pool = None
+_pool_fingerprint = None
+_pool_lock = threading.Lock()
+
+
+def get_classifier_pool(processes=None):
+    """
+    Returns the worker pool of the binary classifiers, starting it on first use, or again after their files changed.
+    """
+    global _pool, _pool_fingerprint
+
+    fingerprint = binary_classifiers_fingerprint()
+    with _pool_lock:
+        if _pool is not None and _pool_fingerprint != fingerprint:
+            # The workers of the previous pool finish the chunks already submitted, by analyses still running,
+            # with the previous classifiers, and then exit
+            _pool.shutdown(wait=False, cancel_futures=False)
+            _pool = None
+        if _pool is None:
+            _pool = ClassifierPool(processes=processes)
+            _pool_fingerprint = fingerprint
+        return _pool
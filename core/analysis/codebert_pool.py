@@ -0,0 +1,178 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from core.analysis.codebert_sliding_window import codebert_sliding_window
+from core.ml_operations.model_server import CodeBERTClient
+from core.ml_operations.onnx_engine import OnnxSequenceClassifier
+from core.ml_operations.registry import load_local_codebert
+from config.settings import CODEBERT_BATCH_SIZE, CODEBERT_TOKEN_OVERLAP, CODEBERT_COARSE_FACTOR
+
+# The model of the pool of a worker process, loaded once when the worker starts
+_worker_model = None
+
+
+class CodeBERTPool:
+    """
+    Runs codebert_sliding_window on files in parallel worker processes, one file per task.
+
+    The workers are started with spawn, as forking the threaded server process could leave a worker with a lock
+    held by another thread, or with the torch and tokenizer thread pools of the parent in an unusable state. Every
+    worker loads the model once, with load_model, when it starts: the weights of a model converted to safetensors
+    are memory-mapped, so the workers share them through the page cache instead of holding a copy each. Each one
+    limits torch to threads_per_process intra-op threads so that the processes do not compete for the same cores.
+
+    Every worker looks its windows up in a copy of the prediction cache of the model, with an in-process tier of
+    its own and the SQLite file of the cache, if any, which all the workers and the server process share.
+    """
+
+    def __init__(self, model, processes=None, threads_per_process=None, batch_size=CODEBERT_BATCH_SIZE,
+                 load_model=load_local_codebert):
+        """
+            Parameters:
+                model (CodeBERTModel): The model of the pool, whose files load_model loads in every worker. A client
+                    of the model server is rejected, as the server already runs the model in its own process.
+                processes (int): The number of worker processes, by default the number of CPUs.
+                threads_per_process (int): The torch threads of every worker, by default the CPUs shared out.
+                batch_size (int): The number of windows per forward pass.
+                load_model (callable): Loads the model in a worker; it must be picklable, e.g. a module function.
+        """
+        if isinstance(model, CodeBERTClient):
+            raise ValueError("The CodeBERT worker pool cannot run a client of the model server")
+        self.model = model
+        self.processes = processes or os.cpu_count()
+        self.threads_per_process = threads_per_process or max(1, os.cpu_count() // self.processes)
+        self.batch_size = batch_size
+
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(load_model, model.thresholds, model.cache, self.threads_per_process),
+        )
+
+    def submit_file(
+            self,
+            code_file,
+            min_win_size,
+            max_win_size,
+            win_increase_step,
+            move_step,
+            token_level=False,
+            window_mode="lines",
+            token_overlap=CODEBERT_TOKEN_OVERLAP,
+            schedule="linear",
+            coarse_factor=CODEBERT_COARSE_FACTOR,
+            keep_window_scores=False,
+            previous_file=None,
+            only_kus=None,
+    ):
+        """
+        Queues a file for analysis by a worker process, and stores the detected KUs in the file once it is done.
+        Takes the same parameters as InferenceScheduler.submit_file.
+
+            Returns:
+                future (Future): Resolves to the detected KUs of the file, one 0/1 entry per KU.
+        """
+        file_future = Future()
+        worker_future = self._executor.submit(
+            _analyze_file,
+            code_file,
+            min_win_size,
+            max_win_size,
+            win_increase_step,
+            move_step,
+            dict(
+                batch_size=self.batch_size,
+                token_level=token_level,
+                window_mode=window_mode,
+                token_overlap=token_overlap,
+                schedule=schedule,
+                coarse_factor=coarse_factor,
+                keep_window_scores=keep_window_scores,
+                previous_files={code_file.filename: previous_file} if previous_file is not None else None,
+                only_kus=only_kus,
+            ),
+        )
+
+        def on_worker_done(future):
+            if future.cancelled():
+                file_future.cancel()
+                return
+            if file_future.done():
+                return
+            if future.exception() is not None:
+                file_future.set_exception(future.exception())
+                return
+            # The worker analyzed a copy of the file, so the results are merged back into the original
+            detected_kus, ku_results, ku_scores, window_scores, partial = future.result()
+            for ku_name, result in ku_results.items():
+                code_file.add_ku_result(ku_name, result)
+            code_file.set_ku_scores(ku_scores, window_scores, partial)
+            file_future.set_result(detected_kus)
+
+        def on_file_done(future):
+            if future.cancelled():
+                worker_future.cancel()
+
+        file_future.add_done_callback(on_file_done)
+        worker_future.add_done_callback(on_worker_done)
+        return file_future
+
+    def shutdown(self):
+        self._executor.shutdown(cancel_futures=True)
+
+
+def _init_worker(load_model, thresholds, cache, threads_per_process):
+    # Set before the tokenizer is first used: the workers already run in parallel
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    import torch
+
+    global _worker_model
+    torch.set_num_threads(threads_per_process)
+    _worker_model = load_model()
+    _worker_model.thresholds = thresholds
+    _worker_model.cache = cache
+
+    # The ONNX Runtime session of a worker uses the same number of threads
+    if isinstance(_worker_model.model, OnnxSequenceClassifier):
+        _worker_model.model = OnnxSequenceClassifier(_worker_model.model.path, threads_per_process)
+
+
+def _analyze_file(code_file, min_win_size, max_win_size, win_increase_step, move_step, options):
+    results = codebert_sliding_window(
+        [code_file], min_win_size, max_win_size, win_increase_step, move_step, _worker_model, **options
+    )
+    return (
+        results[code_file.filename], code_file.ku_results, code_file.ku_scores, code_file.window_scores,
+        code_file.ku_scores_partial,
+    )
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_codebert_pool(model, processes=None, threads_per_process=None):
+    """
+    Returns the worker pool of the given model, creating it on first use.
+    """
+    with _pools_lock:
+        pool = _pools.get(id(model))
+        if pool is None or pool.model is not model:
+            pool = CodeBERTPool(model, processes, threads_per_process)
+            _pools[id(model)] = pool
+        return pool
+
+
+def retire_codebert_pool(model):
+    """
+    Shuts down the worker pool of a model that is no longer used, such as a previous version of a reloaded model.
+    """
+    with _pools_lock:
+        pool = _pools.get(id(model))
+        if pool is None or pool.model is not model:
+            return
+        del _pools[id(model)]
+    pool.shutdown()
@@ -1,5 +1,14 @@
+from concurrent.futures import Future
+
 from core.utils.code_file import CodeFile
 from core.ml_operations.model import CodeBERTModel
+from core.analysis.windows import line_windows, token_budget_windows, unit_windows, order_windows
+from core.analysis.java_units import code_file_units
+from core.analysis.scores import FileScores
+from core.analysis.near_duplicates import NearDuplicateIndex
+from core.analysis.incremental import incremental_windows
+from core.analysis.cascade import CascadeScreen
+from config.settings import CODEBERT_BATCH_SIZE, CODEBERT_TOKEN_OVERLAP, CODEBERT_COARSE_FACTOR
 from typing import List
 
 
@@ -10,28 +19,137 @@ def codebert_sliding_window(
         win_increase_step: int,
         move_step: int,
         model: CodeBERTModel,
+        batch_size: int = CODEBERT_BATCH_SIZE,
+        token_level: bool = False,
+        window_mode: str = "lines",
+        token_overlap: int = CODEBERT_TOKEN_OVERLAP,
+        schedule: str = "linear",
+        coarse_factor: int = CODEBERT_COARSE_FACTOR,
+        keep_window_scores: bool = False,
+        near_duplicates: NearDuplicateIndex = None,
+        previous_files: dict = None,
+        screen: CascadeScreen = None,
+        only_kus: List[str] = None,
 ):
     file_results = {}
 
     for f in files:
-        detected_kus = [0] * model.number_of_kus
+        scores = FileScores(model.thresholds, keep_window_scores, only_kus)
         min_win_size = min(min_win_size, f.total_lines)
         max_win_size = min(max_win_size, f.total_lines)
 
-        for win_size in range(min_win_size, max_win_size + 1, win_increase_step):
-            for start_idx in range(0, f.total_lines - win_size + 1, move_step):
-                end_idx = start_idx + win_size
-                window_lines = f.lines[start_idx:end_idx]
+        spans, encode = file_windows(
+            f, min_win_size, max_win_size, win_increase_step, move_step, model,
+            token_level=token_level, window_mode=window_mode, token_overlap=token_overlap,
+        )
+        # Reuse the scores of the windows of the previous version of the file that are unchanged
+        previous_file = (previous_files or {}).get(f.filename)
+        if previous_file is not None:
+            reused, spans = incremental_windows(spans, f.lines, previous_file)
+            for span, window_probabilities in reused:
+                scores.add(span, window_probabilities)
+        # Only run the windows where a sparse classifier detects or nearly detects a KU
+        if screen is not None:
+            spans = screen.filter(f, spans)
+        spans = order_windows(spans, schedule, coarse_factor)
+
+        # Run the windows through the model in batches, until every KU, or every KU of only_kus, is detected
+        for batch_start in range(0, len(spans), batch_size):
+            if scores.all_detected():
+                scores.stop_early()
+                break
+            batch_spans = spans[batch_start:batch_start + batch_size]
+            if near_duplicates is None:
+                probabilities = model.predict_proba_encoded(encode(batch_spans), batch_size=batch_size)
+            else:
+                probabilities = predict_with_near_duplicates(model, encode(batch_spans), batch_size, near_duplicates)
+            for span, window_probabilities in zip(batch_spans, probabilities):
+                scores.add(span, window_probabilities)
 
-                results = model.predict(window_lines)
+        file_results[f.filename] = scores.detected_kus
+        scores.store(f)
+    return file_results
 
-                # If a KU is detected in the window, it counts as being detected in the file
-                for i, result in enumerate(results):
-                    if detected_kus[i] == 0 and result:
-                        detected_kus[i] = 1
 
-        file_results[f.filename] = detected_kus
+def predict_with_near_duplicates(model, input_ids, batch_size, near_duplicates):
+    """
+    Returns the KU probabilities of the given windows, reusing those of their scored near-duplicates, or of their
+    near-duplicates earlier in the same batch, and running the model on the others only, which are added to the index.
+    """
+    probabilities = []
+    unscored = []
+    for i, window_ids in enumerate(input_ids):
+        fingerprint, window_probabilities = near_duplicates.lookup(window_ids)
+        if window_probabilities is None:
+            # Added before it is scored, so that its near-duplicates later in the batch reuse its probabilities
+            window_probabilities = Future()
+            near_duplicates.add_pending(fingerprint, window_probabilities)
+            unscored.append((i, window_probabilities))
+        probabilities.append(window_probabilities)
 
-        for i, result in enumerate(detected_kus):
-            f.add_ku_result(f"K{i + 1}", result)
-    return file_results
+    if unscored:
+        try:
+            results = model.predict_proba_encoded([input_ids[i] for i, _ in unscored], batch_size=batch_size)
+        except Exception as e:
+            for _, future in unscored:
+                future.set_exception(e)
+            raise
+        for (_, future), result in zip(unscored, results):
+            future.set_result(result)
+
+    # The windows waiting for a near-duplicate queued by another analysis that was not scored are run here
+    failed = [i for i, p in enumerate(probabilities) if isinstance(p, Future)
+              and (p.cancelled() or p.exception() is not None)]
+    if failed:
+        results = model.predict_proba_encoded([input_ids[i] for i in failed], batch_size=batch_size)
+        for i, result in zip(failed, results):
+            probabilities[i] = result
+    return [p.result() if isinstance(p, Future) else p for p in probabilities]
+
+
+def file_windows(
+        f: CodeFile,
+        min_win_size: int,
+        max_win_size: int,
+        win_increase_step: int,
+        move_step: int,
+        model: CodeBERTModel,
+        token_level: bool = False,
+        window_mode: str = "lines",
+        token_overlap: int = CODEBERT_TOKEN_OVERLAP,
+):
+    """
+    Computes the windows of a file, and a function that encodes any of them into token ids.
+
+        Parameters:
+            f (CodeFile): The file to split in windows.
+            min_win_size (int): The size of the smallest window, in lines ("lines" mode).
+            max_win_size (int): The size of the largest window, in lines ("lines" mode).
+            win_increase_step (int): The number of lines by which the window size grows ("lines" mode).
+            move_step (int): The number of lines by which a window moves forward ("lines" mode).
+            model (CodeBERTModel): The model whose tokenizer encodes the windows.
+            token_level (bool): Whether to tokenize the file once and slice its windows out of the token ids.
+            window_mode (str): "lines" for fixed-size line windows, "tokens" to pack whole lines up to the
+                maximum sequence length of the model, or "methods" to pack whole methods and the code between
+                them up to that length. The last two imply token_level.
+            token_overlap (int): The maximum number of tokens shared by consecutive windows ("tokens" mode), or
+                by the windows of a method that does not fit in one ("methods" mode).
+
+        Returns:
+            spans (list): The (start, end) line spans of the windows, in file order.
+            encode (function): Maps a list of spans to the token ids of those windows.
+    """
+    if window_mode == "tokens":
+        tokenized_file = model.tokenize_file(f.lines)
+        return token_budget_windows(tokenized_file, token_overlap), tokenized_file.window_ids
+    if window_mode == "methods":
+        tokenized_file = model.tokenize_file(f.lines)
+        return unit_windows(tokenized_file, code_file_units(f), token_overlap), tokenized_file.window_ids
+    if window_mode != "lines":
+        raise ValueError(f"Unknown window mode: {window_mode}")
+
+    spans = line_windows(f.total_lines, min_win_size, max_win_size, win_increase_step, move_step)
+    if token_level:
+        # Tokenize the file once and slice the windows out of its token ids
+        return spans, model.tokenize_file(f.lines).window_ids
+    return spans, lambda window_spans: model.encode([f.lines[start:end] for start, end in window_spans])
@@ -0,0 +1,117 @@
+import difflib
+import threading
+from concurrent.futures import Future
+
+from core.analysis.blob_reuse import chain_future
+
+
+def align_lines(previous_lines, lines):
+    """
+    Maps the unchanged lines of the previous version of a file to their index in the current version.
+
+        Parameters:
+            previous_lines (list): The lines of the previous version, as in CodeFile.lines.
+            lines (list): The lines of the current version.
+
+        Returns:
+            mapping (dict): The index in lines of every unchanged line, by its index in previous_lines.
+    """
+    matcher = difflib.SequenceMatcher(None, previous_lines, lines, autojunk=False)
+    mapping = {}
+    for previous_start, start, size in matcher.get_matching_blocks():
+        for offset in range(size):
+            mapping[previous_start + offset] = start + offset
+    return mapping
+
+
+def incremental_windows(spans, lines, previous_file):
+    """
+    Splits the windows of a file into the windows of its previous version that it still contains unchanged,
+    whose scores are reused, and the windows that must be scored because the previous version had no window
+    with the same lines. The scores are then those of a full scan of the file.
+
+        Parameters:
+            spans (list): The (start, end) line spans of the windows of the current version.
+            lines (list): The lines of the current version.
+            previous_file (CodeFile): The previous version of the file, with the scores of its windows.
+
+        Returns:
+            reused (list): The (span, scores) of the reused windows, with their spans in the current version.
+            spans (list): The spans of the windows to score, in their original order.
+    """
+    mapping = align_lines(previous_file.lines, lines)
+
+    # The scores of the previous windows by their span in the current version
+    previous_scores = {}
+    for start_idx, end_idx, scores in previous_file.window_scores:
+        # A window is reused if its lines are all unchanged and no line was inserted between them
+        if any(line_idx not in mapping for line_idx in range(start_idx, end_idx)):
+            continue
+        new_start_idx = mapping[start_idx]
+        if mapping[end_idx - 1] - new_start_idx != end_idx - 1 - start_idx:
+            continue
+        previous_scores[(new_start_idx, new_start_idx + end_idx - start_idx)] = scores
+
+    # Only a window of the current version with the same lines as a previous one reuses its scores, as a window
+    # over lines that were split across, or overlapped by, several previous windows was never scored as one
+    reused = [(span, previous_scores[span]) for span in spans if span in previous_scores]
+    spans = [span for span in spans if span not in previous_scores]
+    return reused, spans
+
+
+class IncrementalAnalysis:
+    """
+    Wraps an InferenceScheduler, a CodeBERTPool or a BlobReuse, so that every file whose previous version has stored
+    window scores is analyzed incrementally: only the windows over its changed lines run through the model.
+
+    The previous version is looked up by the id of its git blob, first among the files of the analysis, whose results
+    are then awaited, and then in previous_files. The files of an analysis should be submitted oldest first.
+    """
+
+    def __init__(self, scheduler, previous_files=None):
+        self.scheduler = scheduler
+        self.previous_files = previous_files or {}
+        self.files_incremental = 0
+
+        # Blob id -> (file, future) of the files of the analysis
+        self._submitted = {}
+        self._lock = threading.Lock()
+
+    def submit_file(self, code_file, *args, **kwargs):
+        """
+        Takes the same parameters as InferenceScheduler.submit_file, with keep_window_scores set.
+
+            Returns:
+                future (Future): Resolves to the detected KUs of the file, one 0/1 entry per KU.
+        """
+        with self._lock:
+            submitted = self._submitted.get(code_file.previous_blob_sha)
+
+        if submitted is not None:
+            previous_file, previous_future = submitted
+            future = Future()
+
+            def on_previous_done(done_future):
+                if future.cancelled():
+                    return
+                # The previous version is not used if its analysis did not complete
+                usable = not done_future.cancelled() and done_future.exception() is None
+                chain_future(self._submit(code_file, previous_file if usable else None, args, kwargs), future)
+
+            previous_future.add_done_callback(on_previous_done)
+        else:
+            future = self._submit(code_file, None, args, kwargs)
+
+        if code_file.blob_sha is not None:
+            with self._lock:
+                self._submitted.setdefault(code_file.blob_sha, (code_file, future))
+        return future
+
+    def _submit(self, code_file, previous_file, args, kwargs):
+        # A previous version reused from stored KU scores has no window scores of its own
+        if previous_file is None or previous_file.window_scores is None:
+            previous_file = self.previous_files.get(code_file.previous_blob_sha)
+        if previous_file is None:
+            return self.scheduler.submit_file(code_file, *args, **kwargs)
+        self.files_incremental += 1
+        return self.scheduler.submit_file(code_file, *args, previous_file=previous_file, **kwargs)
@@ -0,0 +1,322 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from functools import partial
+
+from core.analysis.codebert_sliding_window import file_windows
+from core.analysis.windows import order_windows
+from core.analysis.scores import FileScores
+from core.analysis.incremental import incremental_windows
+from core.analysis.blob_reuse import chain_future
+from config.settings import (
+    CODEBERT_BATCH_SIZE,
+    CODEBERT_SCHEDULER_MAX_WAIT,
+    CODEBERT_BUCKET_WIDTH,
+    CODEBERT_TOKEN_OVERLAP,
+    CODEBERT_COARSE_FACTOR,
+)
+
+
+class InferenceScheduler:
+    """
+    Pools CodeBERT windows submitted from any number of files and threads into length-bucketed batches.
+
+    Windows are grouped by their token count, so that a batch holds windows of similar length and little
+    compute is spent on padding. A bucket is flushed as soon as it holds batch_size windows, or once its
+    oldest window has waited max_wait seconds, in which case the batch is topped up from the buckets
+    with the closest lengths.
+    """
+
+    def __init__(
+            self,
+            model,
+            batch_size=CODEBERT_BATCH_SIZE,
+            max_wait=CODEBERT_SCHEDULER_MAX_WAIT,
+            bucket_width=CODEBERT_BUCKET_WIDTH,
+    ):
+        self.model = model
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.bucket_width = bucket_width
+        self.batches_run = 0
+        self.windows_run = 0
+        self._closed = False
+
+        # Bucket index -> list of (enqueue time, input ids, future), oldest first
+        self._buckets = {}
+        self._condition = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name=f"{model}-scheduler", daemon=True)
+        self._worker.start()
+
+    def submit(self, input_ids):
+        """
+        Queues one tokenized window for inference.
+
+            Parameters:
+                input_ids (list): The token ids of the window, as returned by CodeBERTModel.encode.
+
+            Returns:
+                future (Future): Resolves to the KU probabilities of the window.
+        """
+        future = Future()
+        with self._condition:
+            bucket = self._buckets.setdefault(len(input_ids) // self.bucket_width, [])
+            bucket.append((time.monotonic(), input_ids, future))
+            self._condition.notify()
+        return future
+
+    def submit_file(
+            self,
+            code_file,
+            min_win_size,
+            max_win_size,
+            win_increase_step,
+            move_step,
+            token_level=False,
+            window_mode="lines",
+            token_overlap=CODEBERT_TOKEN_OVERLAP,
+            schedule="linear",
+            coarse_factor=CODEBERT_COARSE_FACTOR,
+            keep_window_scores=False,
+            near_duplicates=None,
+            previous_file=None,
+            screen=None,
+            only_kus=None,
+    ):
+        """
+        Queues all sliding windows of a file and stores the detected KUs in the file once they are all scored,
+        or as soon as every KU is detected, in which case its windows still in the queue are dropped.
+
+            Parameters:
+                code_file (CodeFile): The file to analyze.
+                min_win_size (int): The size of the smallest window, in lines.
+                max_win_size (int): The size of the largest window, in lines.
+                win_increase_step (int): The number of lines by which the window size grows.
+                move_step (int): The number of lines by which a window moves forward.
+                token_level (bool): Whether to tokenize the file once and slice its windows out of the token ids.
+                window_mode (str): "lines" for fixed-size line windows, "tokens" to pack whole lines up to the
+                    maximum sequence length of the model, or "methods" to pack whole methods up to that length.
+                token_overlap (int): The maximum number of tokens shared by consecutive windows ("tokens" and
+                    "methods" modes).
+                schedule (str): The order in which the windows are queued, "linear" or "coarse_to_fine".
+                coarse_factor (int): The stride of the first pass of the "coarse_to_fine" schedule, in windows.
+                keep_window_scores (bool): Whether to store the KU probabilities of every window in the file.
+                near_duplicates (NearDuplicateIndex): If given, the windows with a near-duplicate in the index, scored
+                    or queued by this file or another one, reuse its probabilities instead of being queued.
+                previous_file (CodeFile): The previous version of the file, with its window scores. The scores of
+                    its windows over unchanged lines are reused, and only the other windows are queued.
+                screen (CascadeScreen): If given, only the windows passing the screen are queued.
+                only_kus (list): If given, the KU names to detect: the file is done as soon as they are all
+                    detected, and only their results are stored in the file.
+
+            Returns:
+                future (Future): Resolves to the detected KUs of the file, one 0/1 entry per KU.
+        """
+        file_future = Future()
+        scores = FileScores(self.model.thresholds, keep_window_scores, only_kus)
+        lock = threading.Lock()
+
+        try:
+            min_win_size = min(min_win_size, code_file.total_lines)
+            max_win_size = min(max_win_size, code_file.total_lines)
+            spans, encode = file_windows(
+                code_file, min_win_size, max_win_size, win_increase_step, move_step, self.model,
+                token_level=token_level, window_mode=window_mode, token_overlap=token_overlap,
+            )
+            if previous_file is not None:
+                reused, spans = incremental_windows(spans, code_file.lines, previous_file)
+                for span, window_probabilities in reused:
+                    scores.add(span, window_probabilities)
+                if scores.all_detected() and spans:
+                    scores.stop_early()
+                    spans = []
+            if screen is not None:
+                spans = screen.filter(code_file, spans)
+            spans = order_windows(spans, schedule, coarse_factor)
+            if near_duplicates is None:
+                window_futures = [self.submit(window_ids) for window_ids in encode(spans)]
+            else:
+                window_futures = [
+                    self._submit_near_duplicate(window_ids, near_duplicates) for window_ids in encode(spans)
+                ]
+        except Exception as e:
+            file_future.set_exception(e)
+            return file_future
+
+        remaining = [len(window_futures)]
+
+        def finish():
+            scores.store(code_file)
+            file_future.set_result(scores.detected_kus)
+
+        def on_window_done(span, window_future):
+            if window_future.cancelled():
+                return
+            with lock:
+                if file_future.done():
+                    return
+                if window_future.exception() is not None:
+                    file_future.set_exception(window_future.exception())
+                    return
+
+                scores.add(span, window_future.result())
+
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    finish()
+                elif scores.all_detected():
+                    # The remaining windows cannot change the result
+                    scores.stop_early()
+                    finish()
+                    for other_future in window_futures:
+                        other_future.cancel()
+
+        def on_file_done(future):
+            # Drop the queued windows of a file whose result is no longer wanted
+            if future.cancelled():
+                for window_future in window_futures:
+                    window_future.cancel()
+
+        file_future.add_done_callback(on_file_done)
+        if not window_futures:
+            finish()
+        for span, window_future in zip(spans, window_futures):
+            window_future.add_done_callback(partial(on_window_done, span))
+        return file_future
+
+    def _submit_near_duplicate(self, input_ids, near_duplicates):
+        fingerprint, probabilities = near_duplicates.lookup(input_ids)
+        if probabilities is None:
+            future = self.submit(input_ids)
+            # Added before it is scored, so that its near-duplicates submitted meanwhile, in the same file or in
+            # other files, wait for it instead of being queued too
+            near_duplicates.add_pending(fingerprint, future)
+            return future
+
+        future = Future()
+        if not isinstance(probabilities, Future):
+            future.set_result(probabilities)
+            return future
+
+        def on_near_duplicate_done(near_duplicate_future):
+            if future.cancelled():
+                return
+            if near_duplicate_future.cancelled() or near_duplicate_future.exception() is not None:
+                # The near-duplicate was not scored, e.g. its file was done early, so the window is looked up
+                # again, and queued itself if no other near-duplicate is left
+                window_future = self._submit_near_duplicate(input_ids, near_duplicates)
+                chain_future(window_future, future)
+
+                def on_future_done(done_future):
+                    # Drop the queued window if its result is no longer wanted
+                    if done_future.cancelled():
+                        window_future.cancel()
+
+                future.add_done_callback(on_future_done)
+            else:
+                future.set_result(near_duplicate_future.result())
+
+        probabilities.add_done_callback(on_near_duplicate_done)
+        return future
+
+    def close(self):
+        """
+        Stops the worker thread once the queued windows are run, so that the scheduler and its model can be freed.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                batch = self._next_batch()
+                while batch is None:
+                    if self._closed and not self._buckets:
+                        return
+                    self._condition.wait(timeout=self._time_to_next_flush())
+                    batch = self._next_batch()
+            self._run_batch(batch)
+
+    def _next_batch(self):
+        # A full bucket is flushed first
+        for key, bucket in self._buckets.items():
+            if len(bucket) >= self.batch_size:
+                return self._take(key, self.batch_size)
+
+        # Otherwise flush the bucket whose oldest window has waited the longest, if it waited long enough
+        now = time.monotonic()
+        expired = [key for key, bucket in self._buckets.items() if now - bucket[0][0] >= self.max_wait]
+        if not expired:
+            return None
+        key = min(expired, key=lambda k: self._buckets[k][0][0])
+        batch = self._take(key, self.batch_size)
+
+        # Top the batch up with the windows of the closest lengths
+        for other_key in sorted(self._buckets, key=lambda k: abs(k - key)):
+            if len(batch) >= self.batch_size:
+                break
+            batch += self._take(other_key, self.batch_size - len(batch))
+        return batch
+
+    def _take(self, key, count):
+        bucket = self._buckets[key]
+        taken, self._buckets[key] = bucket[:count], bucket[count:]
+        if not self._buckets[key]:
+            del self._buckets[key]
+        return taken
+
+    def _time_to_next_flush(self):
+        if not self._buckets:
+            return None
+        oldest = min(bucket[0][0] for bucket in self._buckets.values())
+        return max(0.0, oldest + self.max_wait - time.monotonic())
+
+    def _run_batch(self, batch):
+        # Skip the windows whose results are no longer wanted, and sort the rest by length to minimize padding
+        batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        batch.sort(key=lambda item: len(item[1]))
+
+        try:
+            results = self.model.predict_proba_encoded([input_ids for _, input_ids, _ in batch], batch_size=len(batch))
+        except Exception as e:
+            logging.exception(f"Error running a batch of {len(batch)} windows")
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches_run += 1
+        self.windows_run += len(batch)
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(model):
+    """
+    Returns the scheduler of the given model, creating it on first use, so that all analyses share its batches.
+    """
+    with _schedulers_lock:
+        scheduler = _schedulers.get(id(model))
+        if scheduler is None or scheduler.model is not model:
+            scheduler = InferenceScheduler(model)
+            _schedulers[id(model)] = scheduler
+        return scheduler
+
+
+def retire_scheduler(model):
+    """
+    Closes the scheduler of a model that is no longer used, such as a previous version of a reloaded model.
+    """
+    with _schedulers_lock:
+        scheduler = _schedulers.get(id(model))
+        if scheduler is None or scheduler.model is not model:
+            return
+        del _schedulers[id(model)]
+    scheduler.close()
@@ -0,0 +1,148 @@
+import re
+
+# record is only a keyword before the name and the components of a record, e.g. "record Point<T>(T x, T y)", and
+# may otherwise name a method or a variable
+_TYPE_HEADER = re.compile(r"\b(class|interface|enum)\b|\brecord\s+\w+\s*(<.*>)?\s*\(")
+_ANNOTATION = re.compile(r"@\s*[\w.]+")
+
+
+def java_method_spans(content):
+    """
+    Finds the methods, constructors and initializer blocks of Java code, including those of nested types, with a
+    brace-matching scanner that skips string and character literals. Comments must already be removed.
+
+        Parameters:
+            content (str): The source code, as in CodeFile.content.
+
+        Returns:
+            spans (list): The (first line, last line) of every unit, 0-based and inclusive, in file order. A unit
+            starts at the first line of its declaration, annotations included. Code inside a unit, such as local
+            or anonymous classes, is not split further.
+    """
+    scanner = _Scanner(content)
+    spans = []
+    scanner.parse_body(spans, top_level=True)
+    return sorted(spans)
+
+
+def code_file_units(code_file):
+    """
+    Splits the lines of a CodeFile into consecutive units: one per method, constructor or initializer block, and
+    one per run of lines between them, such as class declarations and fields.
+
+        Returns:
+            units (list): (start, end) spans over code_file.lines, end exclusive, that cover every line once.
+    """
+    # Index of every line of the content in code_file.lines, for the lines CodeFile keeps
+    line_indices = []
+    kept = 0
+    for line in code_file.content.split("\n"):
+        line_indices.append(kept)
+        if line.strip() not in ["", "{", "}"]:
+            kept += 1
+    line_indices.append(kept)
+
+    boundaries = {0, code_file.total_lines}
+    previous_end = -1
+    for first_line, last_line in java_method_spans(code_file.content):
+        # A unit starting on the last line of the previous one starts on the next line
+        first_line = max(first_line, previous_end + 1)
+        if first_line > last_line:
+            continue
+        boundaries.update((line_indices[first_line], line_indices[last_line + 1]))
+        previous_end = last_line
+
+    boundaries = sorted(boundaries)
+    return [(start_idx, end_idx) for start_idx, end_idx in zip(boundaries, boundaries[1:]) if end_idx > start_idx]
+
+
+class _Scanner:
+    def __init__(self, content):
+        self.content = content
+        self.position = 0
+        self.line = 0
+
+    def parse_body(self, spans, top_level=False):
+        # Parses the members of a type body, or of the file, up to the closing brace of the body
+        header = []
+        header_line = None
+        parentheses = 0
+
+        while True:
+            char = self._next()
+            if char is None:
+                return
+            if char.isspace():
+                if header and not parentheses:
+                    header.append(" ")
+                continue
+            if header_line is None:
+                header_line = self.line
+
+            if char == "(":
+                parentheses += 1
+                header.append(char)
+            elif char == ")":
+                parentheses = max(parentheses - 1, 0)
+                header.append(char)
+            elif parentheses:
+                # Braces inside parentheses, e.g. in annotation arguments, do not open blocks
+                continue
+            elif char == ";":
+                header, header_line = [], None
+            elif char == "}":
+                if not top_level:
+                    return
+                header, header_line = [], None
+            elif char == "{":
+                declaration = _ANNOTATION.sub("", "".join(header))
+                if _TYPE_HEADER.search(declaration):
+                    self.parse_body(spans)
+                elif "=" in declaration or "->" in declaration:
+                    # An array initializer or lambda of a field, which goes on until the semicolon
+                    self._skip_block()
+                    continue
+                else:
+                    # A method, constructor, initializer block or enum constant body
+                    self._skip_block()
+                    spans.append((header_line, self.line))
+                header, header_line = [], None
+            else:
+                header.append(char)
+
+    def _skip_block(self):
+        # Skips to the brace closing the block just opened
+        depth = 1
+        while depth:
+            char = self._next()
+            if char is None:
+                return
+            if char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+
+    def _next(self):
+        # Returns the next character outside string and character literals, which are skipped as a single quote
+        content = self.content
+        if self.position >= len(content):
+            return None
+        char = content[self.position]
+        self.position += 1
+
+        if char == "\n":
+            self.line += 1
+        elif char in "\"'":
+            delimiter = char
+            if content.startswith('""', self.position) and char == '"':
+                # Text block
+                delimiter = '"""'
+                self.position += 2
+            while self.position < len(content) and not content.startswith(delimiter, self.position):
+                if content[self.position] == "\\":
+                    self.position += 1
+                elif content[self.position] == "\n":
+                    self.line += 1
+                self.position += 1
+            self.position += len(delimiter)
+        return char
@@ -1,33 +1,42 @@
-def model_worker(
-        model,
-        files,
-        min_win_size,
-        max_win_size,
-        win_increase_step,
-        move_step,
-):
-    file_results = {}
-
-    for filename, f in files.items():
-        min_win_size = min(min_win_size, f.total_lines)
-        max_win_size = min(max_win_size, f.total_lines)
-
-        for win_size in range(min_win_size, max_win_size + 1, win_increase_step):
-            for start_idx in range(0, f.total_lines - win_size + 1, move_step):
-                end_idx = start_idx + win_size
-                window_lines = f.lines[start_idx:end_idx]
-
-                result = model.predict(window_lines)
-                if result is None:
-                    continue
-                # If a result is true, mark KU as detected and move on to the next file
-                if int(result) == 1:
-                    file_results[filename] = True
-                    break
-            else:
-                continue
-            break
-        else:
-            file_results[filename] = False
+from core.analysis.windows import line_windows, order_windows
+from core.ml_operations.model import Model
+from config.settings import CLASSIFIER_BATCH_SIZE
+
+
+def window_texts(f, min_win_size, max_win_size, win_increase_step, move_step, schedule="linear", coarse_factor=4):
+    """
+    Preprocesses the sliding windows of a file, in their scheduled order, for all the binary classifiers.
+
+        Returns:
+            texts (list): The text of every window, as returned by Model.preprocess.
+    """
+    min_win_size = min(min_win_size, f.total_lines)
+    max_win_size = min(max_win_size, f.total_lines)
+
+    spans = line_windows(f.total_lines, min_win_size, max_win_size, win_increase_step, move_step)
+    return Model.preprocess([f.lines[start_idx:end_idx] for start_idx, end_idx in order_windows(
+        spans, schedule, coarse_factor,
+    )])
+
+
+def model_worker(model, file_texts, batch_size=CLASSIFIER_BATCH_SIZE):
+    file_results = {filename: False for filename in file_texts}
+
+    # The windows of all files, file by file
+    windows = [(filename, text) for filename, texts in file_texts.items() for text in texts]
+
+    # Predict the windows in batches, which may span several files
+    for batch_start in range(0, len(windows), batch_size):
+        # The windows of the files where the KU is already detected are skipped
+        batch = [(filename, text) for filename, text in windows[batch_start:batch_start + batch_size]
+                 if not file_results[filename]]
+        if not batch:
+            continue
+
+        results = model.predict_preprocessed([text for _, text in batch])
+        for (filename, _), result in zip(batch, results):
+            # If a result is true, mark KU as detected for the file
+            if result is not None and int(result) == 1:
+                file_results[filename] = True
 
     return file_results
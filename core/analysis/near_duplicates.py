@@ -0,0 +1,131 @@
+import threading
+from functools import partial
+
+import numpy as np
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 3
+
+_BIT_POSITIONS = np.arange(FINGERPRINT_BITS, dtype=np.uint64)
+
+
+def simhash(input_ids, shingle_size=SHINGLE_SIZE):
+    """
+    Computes the 64-bit SimHash of a tokenized window, over the shingles of shingle_size consecutive token ids.
+
+    The token ids are a function of the normalized window text, and windows that share most of their shingles,
+    such as getters and setters that differ by a field name, get fingerprints a few bits apart.
+    """
+    ids = np.asarray(input_ids, dtype=np.uint64)
+    count = max(len(ids) - shingle_size + 1, 1)
+
+    # Hash every shingle with a polynomial of its token ids, mixed by the SplitMix64 finalizer
+    with np.errstate(over="ignore"):
+        hashes = np.zeros(count, dtype=np.uint64)
+        for offset in range(min(shingle_size, len(ids))):
+            hashes = hashes * np.uint64(1000003) + ids[offset:offset + count]
+        hashes ^= hashes >> np.uint64(30)
+        hashes *= np.uint64(0xBF58476D1CE4E5B9)
+        hashes ^= hashes >> np.uint64(27)
+        hashes *= np.uint64(0x94D049BB133111EB)
+        hashes ^= hashes >> np.uint64(31)
+
+    # Each bit of the fingerprint is the majority vote of that bit over the shingle hashes
+    votes = ((hashes[:, None] >> _BIT_POSITIONS) & np.uint64(1)).sum(axis=0)
+    bits = (2 * votes > count).astype(np.uint64)
+    return int((bits << _BIT_POSITIONS).sum())
+
+
+class NearDuplicateIndex:
+    """
+    Remembers the KU probabilities of the windows scored during an analysis, by SimHash fingerprint, and finds
+    the scored window closest to a new one within max_distance differing bits. The windows still queued for
+    scoring can be added with their future, so that their near-duplicates wait for them instead of being queued.
+
+    Fingerprints are split into max_distance + 1 bands: two fingerprints at most max_distance bits apart agree
+    on at least one whole band, so only the windows sharing a band with the new one are compared.
+    """
+
+    def __init__(self, max_distance=3):
+        if not 0 <= max_distance < FINGERPRINT_BITS:
+            raise ValueError(f"The distance must be between 0 and {FINGERPRINT_BITS - 1}")
+        self.max_distance = max_distance
+        self.lookups = 0
+        self.inferences_saved = 0
+
+        bands = max_distance + 1
+        self._band_masks = []
+        for band in range(bands):
+            start, end = band * FINGERPRINT_BITS // bands, (band + 1) * FINGERPRINT_BITS // bands
+            self._band_masks.append(((1 << (end - start)) - 1) << start)
+        # One dict per band, from the band bits to the fingerprints having them
+        self._bands = [{} for _ in range(bands)]
+        self._probabilities = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, input_ids):
+        """
+        Fingerprints a window and looks for a scored near-duplicate of it.
+
+            Parameters:
+                input_ids (list): The token ids of the window.
+
+            Returns:
+                fingerprint (int): The fingerprint of the window, to add its probabilities once it is scored.
+                probabilities (list): The probabilities of the closest near-duplicate, or its Future if it was added
+                    with add_pending and is not scored yet, None if there is none.
+        """
+        fingerprint = simhash(input_ids)
+        with self._lock:
+            self.lookups += 1
+            closest, closest_distance = None, self.max_distance + 1
+            for mask, band in zip(self._band_masks, self._bands):
+                for candidate in band.get(fingerprint & mask, ()):
+                    distance = (candidate ^ fingerprint).bit_count()
+                    if distance < closest_distance:
+                        closest, closest_distance = candidate, distance
+            if closest is None:
+                return fingerprint, None
+            self.inferences_saved += 1
+            return fingerprint, self._probabilities[closest]
+
+    def add(self, fingerprint, probabilities):
+        with self._lock:
+            if fingerprint in self._probabilities:
+                return
+            self._probabilities[fingerprint] = probabilities
+            for mask, band in zip(self._band_masks, self._bands):
+                band.setdefault(fingerprint & mask, []).append(fingerprint)
+
+    def add_pending(self, fingerprint, future):
+        """
+        Adds a window queued for scoring: lookup returns its future until it is scored, and then its probabilities.
+        The window is dropped if its future is cancelled or fails.
+        """
+        with self._lock:
+            if fingerprint in self._probabilities:
+                return
+            self._probabilities[fingerprint] = future
+            for mask, band in zip(self._band_masks, self._bands):
+                band.setdefault(fingerprint & mask, []).append(fingerprint)
+        future.add_done_callback(partial(self._on_scored, fingerprint))
+
+    def _on_scored(self, fingerprint, future):
+        with self._lock:
+            if self._probabilities.get(fingerprint) is not future:
+                return
+            if not future.cancelled() and future.exception() is None:
+                self._probabilities[fingerprint] = future.result()
+                return
+            del self._probabilities[fingerprint]
+            for mask, band in zip(self._band_masks, self._bands):
+                band[fingerprint & mask].remove(fingerprint)
+                if not band[fingerprint & mask]:
+                    del band[fingerprint & mask]
+
+    def stats(self):
+        return {
+            "lookups": self.lookups,
+            "inferences_saved": self.inferences_saved,
+            "windows": len(self._probabilities),
+        }
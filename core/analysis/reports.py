@@ -0,0 +1,349 @@
+import sys
+import time
+
+from core.analysis.windows import line_windows, token_budget_windows
+from core.analysis.codebert_sliding_window import file_windows
+from core.analysis.scores import FileScores
+from config.settings import CODEBERT_BASE_PATH, CODEBERT_BATCH_SIZE, CODEBERT_ONNX_PATH, CODEBERT_TOKEN_OVERLAP
+
+
+def window_packing_report(
+        files,
+        model,
+        min_win_size=35,
+        max_win_size=35,
+        win_increase_step=1,
+        move_step=25,
+        token_overlap=CODEBERT_TOKEN_OVERLAP,
+):
+    """
+    Compares the fixed-size line windows with the token-budget windows of every file.
+
+        Parameters:
+            files (list): The CodeFile objects to compare the window modes on.
+            model (CodeBERTModel): The model whose tokenizer and maximum sequence length are used.
+            min_win_size, max_win_size, win_increase_step, move_step (int): The parameters of the line windows.
+            token_overlap (int): The maximum number of tokens shared by consecutive token-budget windows.
+
+        Returns:
+            report (list): One dictionary per file, with the window statistics of both modes.
+    """
+    report = []
+
+    for f in files:
+        tokenized_file = model.tokenize_file(f.lines)
+        line_spans = line_windows(
+            f.total_lines,
+            min(min_win_size, f.total_lines),
+            min(max_win_size, f.total_lines),
+            win_increase_step,
+            move_step,
+        )
+        token_spans = token_budget_windows(tokenized_file, token_overlap)
+
+        report.append({
+            "filename": f.filename,
+            "lines": f.total_lines,
+            "tokens": len(tokenized_file.token_ids),
+            "lines_mode": _window_statistics(tokenized_file, line_spans),
+            "tokens_mode": _window_statistics(tokenized_file, token_spans),
+        })
+
+    return report
+
+
+def _window_statistics(tokenized_file, spans):
+    max_tokens = tokenized_file.max_tokens
+    seen_lines = set()
+    tokens_processed = 0
+    tokens_truncated = 0
+
+    for start_idx, end_idx in spans:
+        window_length = tokenized_file.window_length(start_idx, end_idx)
+        tokens_processed += min(window_length, max_tokens)
+        tokens_truncated += max(window_length - max_tokens, 0)
+
+        # A line is seen by the model only if none of its tokens was truncated
+        for line_idx in range(start_idx, end_idx):
+            if tokenized_file.window_length(start_idx, line_idx + 1) > max_tokens:
+                break
+            seen_lines.add(line_idx)
+
+    return {
+        "windows": len(spans),
+        "tokens_processed": tokens_processed,
+        "tokens_truncated": tokens_truncated,
+        "unseen_lines": len(tokenized_file.lines) - len(seen_lines),
+    }
+
+
+def print_window_packing_report(report):
+    header = f"{'file':<40} {'lines':>6} {'tokens':>7} | {'windows':>7} {'processed':>9} {'truncated':>9} {'unseen':>6}"
+    print(header)
+    print("-" * len(header))
+
+    totals = {"lines_mode": {}, "tokens_mode": {}}
+    for row in report:
+        for mode in totals:
+            label = row["filename"] if mode == "lines_mode" else "  (token budget)"
+            stats = row[mode]
+            print(
+                f"{label[:40]:<40} {row['lines'] if mode == 'lines_mode' else '':>6} "
+                f"{row['tokens'] if mode == 'lines_mode' else '':>7} | {stats['windows']:>7} "
+                f"{stats['tokens_processed']:>9} {stats['tokens_truncated']:>9} {stats['unseen_lines']:>6}"
+            )
+            for key, value in stats.items():
+                totals[mode][key] = totals[mode].get(key, 0) + value
+
+    print("-" * len(header))
+    for mode, stats in totals.items():
+        if stats:
+            print(f"{'total ' + mode:<40} {'':>6} {'':>7} | {stats['windows']:>7} {stats['tokens_processed']:>9} "
+                  f"{stats['tokens_truncated']:>9} {stats['unseen_lines']:>6}")
+
+
+def engine_parity_report(
+        files,
+        reference_model,
+        candidate_model,
+        min_win_size=35,
+        max_win_size=35,
+        win_increase_step=1,
+        move_step=25,
+        batch_size=CODEBERT_BATCH_SIZE,
+):
+    """
+    Counts how often two CodeBERT engines, e.g. PyTorch and quantized ONNX Runtime, disagree on the same windows.
+
+        Parameters:
+            files (list): The CodeFile objects to compare the engines on.
+            reference_model (CodeBERTModel): The engine whose predictions are taken as correct.
+            candidate_model (CodeBERTModel): The engine under test.
+            min_win_size, max_win_size, win_increase_step, move_step (int): The parameters of the line windows.
+            batch_size (int): The number of windows per forward pass.
+
+        Returns:
+            report (dict): The number of windows, KU predictions and file results compared and in disagreement,
+            with the disagreements per KU.
+    """
+    report = {
+        "windows": 0,
+        "windows_disagreeing": 0,
+        "predictions": 0,
+        "predictions_disagreeing": 0,
+        "files": 0,
+        "files_disagreeing": 0,
+        "disagreements_per_ku": [0] * reference_model.number_of_kus,
+    }
+
+    for f in files:
+        spans = line_windows(
+            f.total_lines,
+            min(min_win_size, f.total_lines),
+            min(max_win_size, f.total_lines),
+            win_increase_step,
+            move_step,
+        )
+        input_ids = reference_model.encode([f.lines[start_idx:end_idx] for start_idx, end_idx in spans])
+        reference = [[int(r) for r in w] for w in reference_model.predict_encoded(input_ids, batch_size)]
+        candidate = [[int(r) for r in w] for w in candidate_model.predict_encoded(input_ids, batch_size)]
+
+        for reference_window, candidate_window in zip(reference, candidate):
+            report["windows"] += 1
+            report["predictions"] += len(reference_window)
+            report["windows_disagreeing"] += reference_window != candidate_window
+            for i, (r, c) in enumerate(zip(reference_window, candidate_window)):
+                if r != c:
+                    report["predictions_disagreeing"] += 1
+                    report["disagreements_per_ku"][i] += 1
+
+        report["files"] += 1
+        report["files_disagreeing"] += _file_result(reference) != _file_result(candidate)
+
+    return report
+
+
+def _file_result(window_results):
+    # A KU detected in any window counts as being detected in the file
+    return [int(any(column)) for column in zip(*window_results)]
+
+
+def print_engine_parity_report(report):
+    for unit in ("windows", "predictions", "files"):
+        total = report[unit]
+        disagreeing = report[f"{unit}_disagreeing"]
+        rate = disagreeing / total if total else 0
+        print(f"{unit:<12} {total:>8} compared, {disagreeing:>6} disagreeing ({rate:.2%})")
+    for i, count in enumerate(report["disagreements_per_ku"]):
+        if count:
+            print(f"  K{i + 1}: {count} window predictions disagree")
+
+
+def segmentation_report(
+        files,
+        model,
+        min_win_size=35,
+        max_win_size=35,
+        win_increase_step=1,
+        move_step=25,
+        batch_size=CODEBERT_BATCH_SIZE,
+        window_modes=("lines", "methods"),
+):
+    """
+    Compares window modes, e.g. fixed-size line windows and method units, by the number of windows they run through
+    the model, their throughput and the KUs they detect. Every window of every file is run, without early exit.
+
+        Parameters:
+            files (list): The CodeFile objects to compare the window modes on.
+            model (CodeBERTModel): The model to run the windows through.
+            min_win_size, max_win_size, win_increase_step, move_step (int): The parameters of the line windows.
+            batch_size (int): The number of windows per forward pass.
+            window_modes (tuple): The window modes to compare, the first one being the reference.
+
+        Returns:
+            report (dict): For every window mode, the number of windows, the time spent in seconds, the windows
+            per second and the files whose detected KUs differ from those of the reference mode.
+    """
+    report = {mode: {"windows": 0, "time": 0.0, "files_disagreeing": 0} for mode in window_modes}
+
+    for f in files:
+        results = {}
+        for mode in window_modes:
+            start_time = time.perf_counter()
+            spans, encode = file_windows(
+                f, min(min_win_size, f.total_lines), min(max_win_size, f.total_lines), win_increase_step,
+                move_step, model, token_level=True, window_mode=mode,
+            )
+            scores = FileScores(model.thresholds)
+            for span, probabilities in zip(spans, model.predict_proba_encoded(encode(spans), batch_size)):
+                scores.add(span, probabilities)
+
+            report[mode]["windows"] += len(spans)
+            report[mode]["time"] += time.perf_counter() - start_time
+            results[mode] = scores.detected_kus
+
+        for mode in window_modes:
+            report[mode]["files_disagreeing"] += results[mode] != results[window_modes[0]]
+
+    for stats in report.values():
+        stats["windows_per_second"] = stats["windows"] / stats["time"] if stats["time"] else 0
+        stats["files"] = len(files)
+    return report
+
+
+def print_segmentation_report(report):
+    print(f"{'mode':<10} {'windows':>8} {'time (s)':>9} {'windows/s':>10} {'files disagreeing':>18}")
+    for mode, stats in report.items():
+        print(
+            f"{mode:<10} {stats['windows']:>8} {stats['time']:>9.2f} {stats['windows_per_second']:>10.1f} "
+            f"{stats['files_disagreeing']:>10}/{stats['files']}"
+        )
+
+
+def cascade_report(
+        files,
+        model,
+        screen,
+        min_win_size=35,
+        max_win_size=35,
+        win_increase_step=1,
+        move_step=25,
+        batch_size=CODEBERT_BATCH_SIZE,
+):
+    """
+    Measures how many CodeBERT calls a cascade screen avoids, and how the KUs it detects differ from those detected
+    by running CodeBERT on every window.
+
+        Parameters:
+            files (list): The CodeFile objects to run the cascade on.
+            model (CodeBERTModel): The CodeBERT model.
+            screen (CascadeScreen): The screen of the sparse binary classifiers.
+            min_win_size, max_win_size, win_increase_step, move_step (int): The parameters of the line windows.
+            batch_size (int): The number of windows per forward pass.
+
+        Returns:
+            report (dict): The number of windows and of windows passing the screen, the fraction of CodeBERT calls
+            avoided, the number of files and KU predictions compared and in disagreement, with the detections
+            lost per KU.
+    """
+    report = {
+        "windows": 0,
+        "windows_passed": 0,
+        "files": 0,
+        "files_disagreeing": 0,
+        "predictions": 0,
+        "predictions_disagreeing": 0,
+        "detections_lost_per_ku": [0] * model.number_of_kus,
+    }
+
+    for f in files:
+        spans, encode = file_windows(
+            f, min(min_win_size, f.total_lines), min(max_win_size, f.total_lines), win_increase_step, move_step,
+            model, token_level=True,
+        )
+        passed = screen.passes([f.lines[start_idx:end_idx] for start_idx, end_idx in spans])
+
+        reference, cascade = FileScores(model.thresholds), FileScores(model.thresholds)
+        for span, window_passed, probabilities in zip(
+                spans, passed, model.predict_proba_encoded(encode(spans), batch_size)):
+            reference.add(span, probabilities)
+            if window_passed:
+                cascade.add(span, probabilities)
+
+        report["windows"] += len(spans)
+        report["windows_passed"] += sum(passed)
+        report["files"] += 1
+        report["files_disagreeing"] += reference.detected_kus != cascade.detected_kus
+        for i, (r, c) in enumerate(zip(reference.detected_kus, cascade.detected_kus)):
+            report["predictions"] += 1
+            if r != c:
+                report["predictions_disagreeing"] += 1
+                report["detections_lost_per_ku"][i] += r
+
+    report["codebert_calls_avoided"] = 1 - report["windows_passed"] / report["windows"] if report["windows"] else 0
+    return report
+
+
+def print_cascade_report(report):
+    print(f"windows      {report['windows']:>8} screened, {report['windows_passed']:>6} run through CodeBERT "
+          f"({report['codebert_calls_avoided']:.2%} of the calls avoided)")
+    for unit in ("files", "predictions"):
+        total = report[unit]
+        disagreeing = report[f"{unit}_disagreeing"]
+        rate = disagreeing / total if total else 0
+        print(f"{unit:<12} {total:>8} compared, {disagreeing:>6} disagreeing ({rate:.2%})")
+    for i, count in enumerate(report["detections_lost_per_ku"]):
+        if count:
+            print(f"  K{i + 1}: detection lost in {count} files")
+
+
+if __name__ == "__main__":
+    # Usage: python -m core.analysis.reports packing <directory with .java files>
+    #        python -m core.analysis.reports parity <directory with .java files> [--quantize]
+    #        python -m core.analysis.reports segmentation <directory with .java files>
+    #        python -m core.analysis.reports cascade <directory with .java files> [margin]
+    from core.ml_operations.loader import load_codebert_model
+    from core.utils.code_files_loader import read_files_from_directory
+
+    report_name, directory = sys.argv[1], sys.argv[2]
+    code_files = read_files_from_directory(directory).values()
+    codebert = load_codebert_model(CODEBERT_BASE_PATH, 27)
+
+    if report_name == "packing":
+        print_window_packing_report(window_packing_report(code_files, codebert))
+    elif report_name == "parity":
+        onnx_codebert = load_codebert_model(
+            CODEBERT_BASE_PATH, 27, engine="onnx", quantize="--quantize" in sys.argv, onnx_directory=CODEBERT_ONNX_PATH
+        )
+        print_engine_parity_report(engine_parity_report(code_files, codebert, onnx_codebert))
+    elif report_name == "segmentation":
+        print_segmentation_report(segmentation_report(list(code_files), codebert))
+    elif report_name == "cascade":
+        from core.analysis.cascade import CascadeScreen
+        from core.ml_operations.registry import get_binary_classifiers
+
+        margin = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+        cascade_screen = CascadeScreen(get_binary_classifiers(), codebert.number_of_kus, margin)
+        print_cascade_report(cascade_report(code_files, codebert, cascade_screen))
+    else:
+        raise ValueError(f"Unknown report: {report_name}")
@@ -0,0 +1,122 @@
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.5
+
+
+def ku_thresholds(number_of_kus, thresholds=None):
+    """
+    Expands per-KU threshold overrides into one threshold per KU.
+
+        Parameters:
+            number_of_kus (int): The number of KUs.
+            thresholds (dict): Thresholds by KU name, e.g. {"K3": 0.7}; the other KUs use DEFAULT_THRESHOLD.
+
+        Returns:
+            thresholds (list): The threshold of every KU, in KU order.
+    """
+    thresholds = thresholds or {}
+    unknown = set(thresholds) - {f"K{i + 1}" for i in range(number_of_kus)}
+    if unknown:
+        raise ValueError(f"Unknown KUs: {', '.join(sorted(unknown))}")
+    return [float(thresholds.get(f"K{i + 1}", DEFAULT_THRESHOLD)) for i in range(number_of_kus)]
+
+
+def ku_indices(number_of_kus, kus=None):
+    """
+    Returns the indices of the given KU names, e.g. ["K3"] -> [2], or of every KU if kus is None.
+    """
+    if kus is None:
+        return list(range(number_of_kus))
+    unknown = set(kus) - {f"K{i + 1}" for i in range(number_of_kus)}
+    if unknown:
+        raise ValueError(f"Unknown KUs: {', '.join(sorted(unknown))}")
+    return sorted({int(ku[1:]) - 1 for ku in kus})
+
+
+def apply_thresholds(scores, thresholds, only_kus=None):
+    """
+    Returns the detected KUs of a file, as stored in analysis_results.detected_kus, from its per-KU scores,
+    restricted to the KU names in only_kus if given.
+    """
+    return {
+        f"K{i + 1}": int(scores[i] > thresholds[i])
+        for i in ku_indices(min(len(scores), len(thresholds)), only_kus)
+    }
+
+
+def pack_ku_scores(scores):
+    # One float32 per KU
+    return np.asarray(scores, dtype="<f4").tobytes()
+
+
+def unpack_ku_scores(data):
+    return np.frombuffer(bytes(data), dtype="<f4").tolist()
+
+
+def _window_dtype(number_of_kus):
+    # The scores are as precise as the per-KU scores, so that a reused window is detected as in the original run
+    return np.dtype([("start", "<u4"), ("end", "<u4"), ("scores", "<f4", (number_of_kus,))])
+
+
+def pack_window_scores(window_scores, number_of_kus):
+    """
+    Packs the scores of every window of a file as (start line, end line, one float32 per KU) records.
+
+        Parameters:
+            window_scores (list): (start, end, scores) tuples, one per scored window.
+            number_of_kus (int): The number of scores per window.
+
+        Returns:
+            data (bytes): The packed records.
+    """
+    records = np.zeros(len(window_scores), dtype=_window_dtype(number_of_kus))
+    for record, (start_idx, end_idx, scores) in zip(records, window_scores):
+        record["start"], record["end"], record["scores"] = start_idx, end_idx, scores
+    return records.tobytes()
+
+
+def unpack_window_scores(data, number_of_kus):
+    records = np.frombuffer(bytes(data), dtype=_window_dtype(number_of_kus))
+    return [(int(r["start"]), int(r["end"]), r["scores"].astype(float).tolist()) for r in records]
+
+
+class FileScores:
+    """
+    Accumulates the window probabilities of a file into the maximum probability and the detection of every KU.
+
+    With only_kus, a list of KU names, the file is done as soon as those KUs are detected, and only their results
+    are stored in the file. The scores of the other KUs are still kept, but only cover the windows scored until then.
+
+    A file whose windows are not all scored, because it was done early, has partial scores: they are the maximum of
+    the scored windows only, so they cannot be re-thresholded as if they covered the whole file.
+    """
+
+    def __init__(self, thresholds, keep_window_scores=False, only_kus=None):
+        self.thresholds = thresholds
+        self.max_scores = [0.0] * len(thresholds)
+        self.detected_kus = [0] * len(thresholds)
+        self.window_scores = [] if keep_window_scores else None
+        self.kus = ku_indices(len(thresholds), only_kus)
+        self.partial = False
+
+    def add(self, span, probabilities):
+        # A KU detected in any window counts as detected in the file
+        for i, probability in enumerate(probabilities):
+            if probability > self.max_scores[i]:
+                self.max_scores[i] = probability
+                if probability > self.thresholds[i]:
+                    self.detected_kus[i] = 1
+        if self.window_scores is not None:
+            self.window_scores.append((span[0], span[1], list(probabilities)))
+
+    def all_detected(self):
+        return all(self.detected_kus[i] for i in self.kus)
+
+    def stop_early(self):
+        # Called when the remaining windows of the file are skipped
+        self.partial = True
+
+    def store(self, code_file):
+        for i in self.kus:
+            code_file.add_ku_result(f"K{i + 1}", self.detected_kus[i])
+        code_file.set_ku_scores(self.max_scores, self.window_scores, self.partial)
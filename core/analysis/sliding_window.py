@@ -1,5 +1,5 @@
-import concurrent.futures
-from .model_worker import model_worker
+from core.analysis.classifier_pool import get_classifier_pool
+from config.settings import CLASSIFIER_BATCH_SIZE, CLASSIFIER_PROCESSES
 
 
 def sliding_window(
@@ -8,31 +8,43 @@ def sliding_window(
         max_win_size,
         win_increase_step,
         move_step,
-        models,
+        models=None,
+        schedule="linear",
+        coarse_factor=4,
+        only_kus=None,
+        batch_size=CLASSIFIER_BATCH_SIZE,
+        pool=None,
 ):
+    """
+    Analyzes files with the binary classifiers, in the persistent worker pool of the classifiers unless a
+    ClassifierPool is given, and stores the result of every classifier in the files.
+
+    The workers run the classifiers they loaded themselves: models, a list of binary classifiers or of their KU
+    names, selects which of them run, and does not pass the models to the workers. A ValueError is raised if one of
+    them is not among the classifiers of the pool.
+
+        Returns:
+            model_results (dict): The result of every file, by file name, for every classifier, by KU name.
+    """
     # Initialize the data structure for results
     model_results = {}
 
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        futures = {
-            executor.submit(
-                model_worker,
-                model,
-                files,
-                min_win_size,
-                max_win_size,
-                win_increase_step,
-                move_step,
-            ): model
-            for model in models
-        }
-
-        for future in concurrent.futures.as_completed(futures):
-            model = futures[future]
-            file_results = future.result()
-            model_results[str(model)] = file_results
+    # Only the models given, of the requested KUs, run
+    kus = only_kus
+    if models is not None:
+        kus = [str(model) for model in models if only_kus is None or str(model) in only_kus]
 
-            for code_file in files.values():
-                code_file.add_ku_result(str(model), file_results[code_file.filename])
+    pool = pool or get_classifier_pool(CLASSIFIER_PROCESSES)
+    results = pool.imap(
+        files.values(), min_win_size, max_win_size, win_increase_step, move_step,
+        schedule=schedule, coarse_factor=coarse_factor, only_kus=kus, batch_size=batch_size,
+    )
+    for code_file, ku_results in results:
+        for model_name, detected in ku_results.items():
+            model_results.setdefault(model_name, {})[code_file.filename] = detected
+            code_file.add_ku_result(model_name, detected)
 
+    missing = set(kus or []) - set(model_results) if files and models is not None else set()
+    if missing:
+        raise ValueError(f"Binary classifiers not loaded by the worker pool: {', '.join(sorted(missing))}")
     return model_results
@@ -0,0 +1,54 @@
+import unittest
+
+from core.analysis.autotune import count_windows, tune_windows, window_params
+from core.analysis.windows import line_windows
+
+
+class AutotuneTests(unittest.TestCase):
+
+    def test_count_windows(self):
+        """
+        Title: Testing the window count estimate
+        Description: This test verifies that count_windows returns the number of windows that
+        line_windows creates for files of various lengths, with the window sizes clamped to the
+        length of every file as in the analysis, for single and growing window sizes.
+        Related methods: count_windows, line_windows
+        """
+        line_counts = [0, 1, 7, 20, 34, 35, 36, 100, 257]
+        for params in [window_params(35, 35, 1, 25), window_params(20, 20, 1, 30), window_params(10, 30, 5, 8)]:
+            windows, coverage = count_windows(line_counts, params)
+            expected = sum(
+                len(line_windows(
+                    total_lines, min(params["min_win_size"], total_lines), min(params["max_win_size"], total_lines),
+                    params["win_increase_step"], params["move_step"],
+                ))
+                for total_lines in line_counts
+            )
+            self.assertEqual(windows, expected)
+            self.assertLessEqual(coverage, 1.0)
+
+    def test_tune_windows(self):
+        """
+        Title: Testing the window parameter tuning
+        Description: This test verifies that tune_windows picks parameters whose estimated time is
+        within the target time and whose coverage meets the minimum, running more windows when
+        the target time is longer, and the cheapest parameters when none fits the target time.
+        Related methods: tune_windows
+        """
+        line_counts = [120, 300, 45, 80]
+        defaults = window_params(35, 35, 1, 25)
+
+        short = tune_windows(line_counts, 10, 2, 0.9, [20, 35, 50], defaults)
+        long = tune_windows(line_counts, 10, 20, 0.9, [20, 35, 50], defaults)
+        for tuned, target_time in [(short, 2), (long, 20)]:
+            self.assertLessEqual(tuned["estimated_time"], target_time)
+            self.assertGreaterEqual(tuned["coverage"], 0.9)
+        self.assertGreater(long["estimated_windows"], short["estimated_windows"])
+
+        cheapest = tune_windows(line_counts, 10, 0.01, 0.9, [20, 35, 50], defaults)
+        self.assertGreater(cheapest["estimated_time"], 0.01)
+        self.assertLessEqual(cheapest["estimated_windows"], short["estimated_windows"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+
+from core.analysis.classifier_pool import ClassifierPool
+from core.analysis.sliding_window import sliding_window
+from core.analysis.test_codebert_sliding_window import make_file
+
+
+class FakeBinaryModel:
+    """
+    Stand-in for a binary classifier Model of KU name, detecting its KU in the windows that contain marker.
+    """
+
+    def __init__(self, name, marker):
+        self.name = name
+        self.marker = marker
+
+    def __str__(self):
+        return self.name
+
+    def predict_preprocessed(self, texts):
+        return [int(self.marker in text) for text in texts]
+
+
+def load_fake_models():
+    # Loaded by every worker process, which imports this module
+    return [FakeBinaryModel("K1", "ku0"), FakeBinaryModel("K2", "ku1")]
+
+
+class ClassifierPoolTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = ClassifierPool(load_models=load_fake_models, processes=2, chunk_size=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    def make_files(self):
+        return {
+            "First": make_file("First", {3: "ku0"}, total_lines=100),
+            "Second": make_file("Second", {60: "ku1"}, total_lines=100),
+            "Third": make_file("Third", {}, total_lines=40),
+        }
+
+    def test_results_per_file_and_ku(self):
+        """
+        Title: Testing the worker pool of the binary classifiers
+        Description: This test verifies that the ClassifierPool runs every classifier its workers loaded
+        on the windows of every file, spread over several chunks, and that sliding_window stores the
+        result of every classifier in every file.
+        Related methods: ClassifierPool.imap, sliding_window
+        """
+        files = self.make_files()
+
+        results = {code_file.filename: ku_results
+                   for code_file, ku_results in self.pool.imap(files.values(), 35, 35, 1, 25)}
+        self.assertEqual(results, {
+            "First": {"K1": True, "K2": False},
+            "Second": {"K1": False, "K2": True},
+            "Third": {"K1": False, "K2": False},
+        })
+
+        model_results = sliding_window(files, 35, 35, 1, 25, pool=self.pool)
+        self.assertEqual(model_results, {
+            "K1": {"First": True, "Second": False, "Third": False},
+            "K2": {"First": False, "Second": True, "Third": False},
+        })
+        self.assertEqual(files["Second"].ku_results, {"K1": False, "K2": True})
+
+    def test_selected_classifiers(self):
+        """
+        Title: Testing the selection of the binary classifiers of the pool
+        Description: This test verifies that only the classifiers of the KUs in only_kus, or of the models
+        given to sliding_window, run in the workers, and that sliding_window rejects models that the
+        workers did not load.
+        Related methods: ClassifierPool.imap, sliding_window
+        """
+        files = self.make_files()
+
+        results = {code_file.filename: ku_results
+                   for code_file, ku_results in self.pool.imap(files.values(), 35, 35, 1, 25, only_kus=["K2"])}
+        self.assertEqual(results, {"First": {"K2": False}, "Second": {"K2": True}, "Third": {"K2": False}})
+
+        model_results = sliding_window(files, 35, 35, 1, 25, [FakeBinaryModel("K1", "ku0")], pool=self.pool)
+        self.assertEqual(model_results, {"K1": {"First": True, "Second": False, "Third": False}})
+
+        with self.assertRaises(ValueError):
+            sliding_window(files, 35, 35, 1, 25, ["K1", "K9"], pool=self.pool)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+from functools import partial
+
+import numpy as np
+
+from core.analysis.codebert_pool import CodeBERTPool
+from core.analysis.codebert_sliding_window import codebert_sliding_window
+from core.ml_operations.loader import load_codebert_model
+from core.ml_operations.prediction_cache import PredictionCache
+from core.ml_operations.test_model import HAS_TORCH, build_tiny_codebert, random_lines
+from core.utils.code_file import CodeFile
+
+
+@unittest.skipUnless(HAS_TORCH, "torch, tokenizers and transformers are not installed")
+class CodeBERTPoolTests(unittest.TestCase):
+
+    def test_pool_matches_sliding_window(self):
+        """
+        Title: Testing the worker processes of CodeBERT
+        Description: This test verifies that a CodeBERTPool, whose spawned workers load the model with the
+        given loader, stores in every file the same detected KUs, KU scores and window scores as
+        codebert_sliding_window run in the process itself, and that the workers store the window probabilities in
+        the SQLite file of the prediction cache of the model.
+        Related methods: CodeBERTPool.submit_file, codebert_sliding_window, PredictionCache.put_many
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            build_tiny_codebert(directory)
+            model = load_codebert_model(directory, 4)
+            contents = ["\n".join(random_lines(size, seed)) for seed, size in enumerate((10, 45, 80))]
+
+            # One file per call, as every task of the pool
+            expected_files = [CodeFile(f"File{i}", content) for i, content in enumerate(contents)]
+            expected = {}
+            for code_file in expected_files:
+                expected.update(codebert_sliding_window([code_file], 20, 20, 1, 10, model, keep_window_scores=True))
+
+            model.cache = PredictionCache("tiny-codebert", path=os.path.join(directory, "cache.sqlite"))
+            pool = CodeBERTPool(model, 2, 1, load_model=partial(load_codebert_model, directory, 4))
+            self.addCleanup(pool.shutdown)
+            files = [CodeFile(f"File{i}", content) for i, content in enumerate(contents)]
+            futures = [pool.submit_file(code_file, 20, 20, 1, 10, keep_window_scores=True) for code_file in files]
+
+            for code_file, expected_file, future in zip(files, expected_files, futures):
+                self.assertEqual(future.result(timeout=120), expected[code_file.filename])
+                self.assertEqual(code_file.ku_results, expected_file.ku_results)
+                np.testing.assert_allclose(code_file.ku_scores, expected_file.ku_scores, atol=1e-5)
+                self.assertEqual([span for *span, _ in code_file.window_scores],
+                                 [span for *span, _ in expected_file.window_scores])
+
+            # The windows scored by the workers are read back from the SQLite file by the server process
+            keys = [model.cache.key(window_ids) for window_ids in model.encode(
+                [code_file.lines[start:end] for code_file in files for start, end, _ in code_file.window_scores]
+            )]
+            self.assertNotIn(None, model.cache.get_many(keys))
+            self.assertEqual(model.cache.stats()["disk_hits"], len(keys))
+
+
+if __name__ == '__main__':
+    unittest.main()
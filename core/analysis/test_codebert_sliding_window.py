@@ -0,0 +1,378 @@
+import unittest
+
+from core.analysis.codebert_sliding_window import codebert_sliding_window
+from core.analysis.inference_scheduler import InferenceScheduler
+from core.analysis.blob_reuse import BlobReuse
+from core.analysis.cascade import CascadeScreen
+from core.analysis.near_duplicates import NearDuplicateIndex
+from core.utils.code_file import CodeFile
+
+
+class FakeCodeBERTModel:
+    """
+    Stand-in for CodeBERTModel: KU i is detected in a window when the window contains the marker "ku<i>".
+    """
+
+    def __init__(self, number_of_kus=4):
+        self.number_of_kus = number_of_kus
+        self.thresholds = [0.5] * number_of_kus
+        self.batch_sizes = []
+
+    def predict(self, code):
+        return [int(any(f"ku{i}" in line for line in code)) for i in range(self.number_of_kus)]
+
+    def encode(self, windows):
+        # The lines of a window stand in for its token ids
+        return [list(code) for code in windows]
+
+    def predict_encoded(self, input_ids, batch_size=16):
+        return self.predict_batch(input_ids, batch_size=batch_size)
+
+    def predict_proba_encoded(self, input_ids, batch_size=16):
+        return [[float(r) for r in results] for results in self.predict_batch(input_ids, batch_size=batch_size)]
+
+    def predict_batch(self, windows, batch_size=16):
+        results = []
+        for batch_start in range(0, len(windows), batch_size):
+            batch = windows[batch_start:batch_start + batch_size]
+            self.batch_sizes.append(len(batch))
+            results.extend(self.predict(code) for code in batch)
+        return results
+
+
+class FakeClassifier:
+    """
+    Stand-in for a binary classifier of KU name, scoring 0.9 the windows containing marker and 0.45 the others.
+    """
+
+    def __init__(self, name, marker):
+        self.name = name
+        self.marker = marker
+
+    def __str__(self):
+        return self.name
+
+    def predict_scores_preprocessed(self, texts):
+        return [0.9 if self.marker in text else 0.45 for text in texts]
+
+
+class FakeContextModel(FakeCodeBERTModel):
+    """
+    Stand-in for CodeBERTModel whose last KU is only detected in the windows containing both "ku0" and "ku1",
+    so that a window is scored on its whole context rather than line by line.
+    """
+
+    def predict(self, code):
+        results = super().predict(code)
+        results[-1] = int(results[0] and results[1])
+        return results
+
+
+class FakeTokenIdsModel(FakeCodeBERTModel):
+    """
+    Stand-in for CodeBERTModel whose token ids are integers, one per distinct line, as NearDuplicateIndex needs.
+    """
+
+    def __init__(self, number_of_kus=4):
+        super().__init__(number_of_kus)
+        self.line_ids = {}
+
+    def encode(self, windows):
+        return [[self.line_ids.setdefault(line, len(self.line_ids)) for line in code] for code in windows]
+
+    def predict(self, code):
+        lines = {line_id: line for line, line_id in self.line_ids.items()}
+        return super().predict([lines[line_id] for line_id in code])
+
+
+def make_repeated_file(filename, repeats=2):
+    # The same 35 lines, with a KU marker, repeated
+    return CodeFile(filename, "\n".join(
+        f"int x{i} = {'ku0' if i == 3 else f'y{i}'};" for _ in range(repeats) for i in range(35)
+    ))
+
+
+def make_file(filename, markers, total_lines=100):
+    lines = []
+    for i in range(total_lines):
+        marker = markers.get(i)
+        lines.append(f"int x{i} = {marker};" if marker else f"int x{i} = y{i};")
+    return CodeFile(filename, "\n".join(lines))
+
+
+class CodeBERTSlidingWindowTests(unittest.TestCase):
+
+    def test_batched_windows(self):
+        """
+        Title: Testing batched window inference
+        Description: This test verifies that codebert_sliding_window collects all windows of a file,
+        runs them through the model in batches of the requested size, and ORs the per-window KU
+        predictions into the file result.
+        Related methods: codebert_sliding_window, CodeBERTModel.predict_batch
+        """
+        model = FakeCodeBERTModel()
+        code_file = make_file("Sample", {3: "ku0", 80: "ku2"})
+
+        results = codebert_sliding_window([code_file], 35, 35, 1, 25, model, batch_size=2)
+
+        self.assertEqual(results["Sample"], [1, 0, 1, 0])
+        self.assertEqual(code_file.ku_results, {"K1": 1, "K2": 0, "K3": 1, "K4": 0})
+        self.assertEqual(code_file.ku_scores, [1.0, 0.0, 1.0, 0.0])
+        # Windows start at lines 0, 25, 50 with a 35-line window over 100 lines
+        self.assertEqual(model.batch_sizes, [2, 1])
+
+    def test_coarse_to_fine_early_exit(self):
+        """
+        Title: Testing coarse-to-fine scheduling with early exit
+        Description: This test verifies that the "coarse_to_fine" schedule visits windows at a coarse stride
+        first, and that codebert_sliding_window stops running windows once every KU is detected.
+        Related methods: codebert_sliding_window, coarse_to_fine
+        """
+        model = FakeCodeBERTModel(number_of_kus=2)
+        # Windows start every 5 lines; both markers are found by the first coarse pass (windows 0 and 8)
+        code_file = make_file("Sample", {2: "ku0", 41: "ku1"}, total_lines=200)
+
+        results = codebert_sliding_window(
+            [code_file], 10, 10, 1, 5, model, batch_size=2, schedule="coarse_to_fine", coarse_factor=8,
+        )
+
+        self.assertEqual(results["Sample"], [1, 1])
+        self.assertEqual(sum(model.batch_sizes), 2)
+
+    def test_early_exit_partial_scores(self):
+        """
+        Title: Testing the partial scores of early-exited files
+        Description: This test verifies that the KU scores of a file whose windows were not all run,
+        because every KU was detected early, are flagged as partial by codebert_sliding_window and the
+        InferenceScheduler, and that those of a file whose windows were all run are not.
+        Related methods: codebert_sliding_window, InferenceScheduler.submit_file, FileScores.stop_early
+        """
+        model = FakeCodeBERTModel(number_of_kus=2)
+        early_exited = make_file("EarlyExited", {2: "ku0", 41: "ku1"}, total_lines=200)
+        complete = make_file("Complete", {2: "ku0"}, total_lines=200)
+
+        codebert_sliding_window(
+            [early_exited, complete], 10, 10, 1, 5, model, batch_size=2, schedule="coarse_to_fine", coarse_factor=8,
+        )
+        self.assertTrue(early_exited.ku_scores_partial)
+        self.assertFalse(complete.ku_scores_partial)
+
+        scheduler = InferenceScheduler(model, batch_size=1, max_wait=0.05, bucket_width=1000)
+        early_exited = make_file("EarlyExited", {2: "ku0", 3: "ku1"}, total_lines=200)
+        complete = make_file("Complete", {2: "ku0"}, total_lines=200)
+        for code_file in (early_exited, complete):
+            scheduler.submit_file(code_file, 10, 10, 1, 5).result(timeout=5)
+        self.assertTrue(early_exited.ku_scores_partial)
+        self.assertFalse(complete.ku_scores_partial)
+
+    def test_only_kus(self):
+        """
+        Title: Testing the analysis of a subset of KUs
+        Description: This test verifies that, with only_kus, codebert_sliding_window stops running the
+        windows of a file once the requested KUs are detected, even though others are not, and only
+        stores the results of the requested KUs in the file.
+        Related methods: codebert_sliding_window, FileScores
+        """
+        model = FakeCodeBERTModel()
+        code_file = make_file("Sample", {3: "ku1", 180: "ku0"}, total_lines=200)
+
+        results = codebert_sliding_window([code_file], 35, 35, 1, 25, model, batch_size=1, only_kus=["K2"])
+
+        self.assertEqual(results["Sample"][1], 1)
+        self.assertEqual(code_file.ku_results, {"K2": 1})
+        # The first window detects K2, so the window containing ku0 is never run
+        self.assertEqual(sum(model.batch_sizes), 1)
+
+        with self.assertRaises(ValueError):
+            codebert_sliding_window([code_file], 35, 35, 1, 25, model, only_kus=["K9"])
+
+    def test_incremental_windows(self):
+        """
+        Title: Testing incremental analysis of a new file version
+        Description: This test verifies that, given the previous version of a file with its window scores,
+        codebert_sliding_window reuses the scores of the windows whose lines are unchanged, only runs the
+        windows covering the changed line, and detects the KUs of both.
+        Related methods: codebert_sliding_window, incremental_windows
+        """
+        model = FakeCodeBERTModel()
+        previous_file = make_file("Sample", {3: "ku0"}, total_lines=200)
+        codebert_sliding_window([previous_file], 35, 35, 1, 25, model, keep_window_scores=True)
+        self.assertEqual(sum(model.batch_sizes), 7)
+
+        model.batch_sizes = []
+        code_file = make_file("Sample", {3: "ku0", 100: "ku1"}, total_lines=200)
+        results = codebert_sliding_window(
+            [code_file], 35, 35, 1, 25, model, keep_window_scores=True, previous_files={"Sample": previous_file},
+        )
+
+        self.assertEqual(results["Sample"], [1, 1, 0, 0])
+        # Only the windows starting at lines 75 and 100 contain the changed line
+        self.assertEqual(sum(model.batch_sizes), 2)
+        self.assertEqual(len(code_file.window_scores), 7)
+
+    def test_incremental_matches_full_scan(self):
+        """
+        Title: Testing that incremental analysis gives the results of a full scan
+        Description: This test verifies that, after lines are inserted in the middle of a file, the windows of
+        the new version whose lines were split across several windows of the previous version are scored,
+        so that the incremental analysis detects the same KUs as a full scan of the new version.
+        Related methods: codebert_sliding_window, incremental_windows
+        """
+        model = FakeContextModel()
+        previous_file = make_file("Sample", {40: "ku0", 70: "ku1"}, total_lines=200)
+        codebert_sliding_window([previous_file], 35, 35, 1, 25, model, keep_window_scores=True)
+        self.assertEqual(previous_file.ku_results, {"K1": 1, "K2": 1, "K3": 0, "K4": 0})
+
+        # The 11 inserted lines shift the markers into the window of lines 50 to 85
+        lines = previous_file.lines
+        content = "\n".join(lines[:20] + [f"int z{i} = 0;" for i in range(11)] + lines[20:])
+        code_file = CodeFile("Sample", content)
+        full_scan_file = CodeFile("Sample", content)
+
+        results = codebert_sliding_window(
+            [code_file], 35, 35, 1, 25, model, keep_window_scores=True, previous_files={"Sample": previous_file},
+        )
+        full_scan_results = codebert_sliding_window([full_scan_file], 35, 35, 1, 25, model)
+
+        self.assertEqual(results, full_scan_results)
+        self.assertEqual(results["Sample"], [1, 1, 0, 1])
+        self.assertEqual(code_file.ku_scores, full_scan_file.ku_scores)
+
+    def test_near_duplicates_in_a_batch(self):
+        """
+        Title: Testing near-duplicate window reuse within a batch
+        Description: This test verifies that codebert_sliding_window runs the model once for windows that are
+        near-duplicates of each other in the same batch, and reuses the probabilities for the others.
+        Related methods: codebert_sliding_window, predict_with_near_duplicates
+        """
+        model = FakeTokenIdsModel()
+        near_duplicates = NearDuplicateIndex(max_distance=3)
+        results = codebert_sliding_window(
+            [make_repeated_file("Repeated", 3)], 35, 35, 1, 35, model, near_duplicates=near_duplicates,
+        )
+
+        self.assertEqual(results["Repeated"], [1, 0, 0, 0])
+        self.assertEqual(model.batch_sizes, [1])
+        self.assertEqual(near_duplicates.stats()["inferences_saved"], 2)
+
+    def test_cascade_screen(self):
+        """
+        Title: Testing the cascade screen of the binary classifiers
+        Description: This test verifies that codebert_sliding_window only runs the windows passing the
+        CascadeScreen through CodeBERT, that a margin lets uncertain windows through, and that the screen
+        counts the windows it avoided.
+        Related methods: codebert_sliding_window, CascadeScreen.filter
+        """
+        code_file = make_file("Sample", {3: "ku0", 80: "ku2"})
+        classifiers = [FakeClassifier("K1", "ku0"), FakeClassifier("K3", "ku2"), FakeClassifier("K99", "x")]
+
+        model = FakeCodeBERTModel()
+        screen = CascadeScreen(classifiers, model.number_of_kus, margin=0.0)
+        results = codebert_sliding_window([code_file], 35, 35, 1, 25, model, screen=screen)
+
+        self.assertEqual(results["Sample"], [1, 0, 1, 0])
+        # The windows starting at lines 0 and 50 pass, the one starting at line 25 does not
+        self.assertEqual(sum(model.batch_sizes), 2)
+        self.assertEqual(screen.stats()["windows_passed"], 2)
+        self.assertEqual(screen.unscreened_kus, ["K2", "K4"])
+
+        model = FakeCodeBERTModel()
+        screen = CascadeScreen(classifiers, model.number_of_kus, margin=0.1)
+        codebert_sliding_window([code_file], 35, 35, 1, 25, model, screen=screen)
+        self.assertEqual(sum(model.batch_sizes), 3)
+
+
+class InferenceSchedulerTests(unittest.TestCase):
+
+    def test_files_share_batches(self):
+        """
+        Title: Testing cross-file micro-batching
+        Description: This test verifies that the InferenceScheduler pools the windows of several files
+        into shared batches, and routes every window result back to its own file, giving the same
+        detected KUs as codebert_sliding_window.
+        Related methods: InferenceScheduler.submit_file, codebert_sliding_window
+        """
+        model = FakeCodeBERTModel()
+        scheduler = InferenceScheduler(model, batch_size=4, max_wait=0.2, bucket_width=1000)
+        files = [
+            make_file("First", {3: "ku0"}, total_lines=60),
+            make_file("Second", {40: "ku1"}, total_lines=60),
+            make_file("Third", {}, total_lines=10),
+        ]
+
+        futures = [scheduler.submit_file(code_file, 35, 35, 1, 25) for code_file in files]
+        results = [future.result(timeout=5) for future in futures]
+
+        self.assertEqual(results, [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 0, 0]])
+        self.assertEqual(files[1].ku_results["K2"], 1)
+        self.assertEqual(scheduler.windows_run, 5)
+        self.assertLess(scheduler.batches_run, len(files))
+
+
+    def test_near_duplicates_of_queued_windows(self):
+        """
+        Title: Testing near-duplicate window reuse across queued files
+        Description: This test verifies that the InferenceScheduler runs the model once for near-duplicate
+        windows that are queued together, from the same file or from several files, the others waiting for
+        the probabilities of the first one, and that a window whose near-duplicate is cancelled with the
+        rest of its file is queued itself.
+        Related methods: InferenceScheduler.submit_file, NearDuplicateIndex.add_pending
+        """
+        model = FakeTokenIdsModel()
+        scheduler = InferenceScheduler(model, batch_size=4, max_wait=0.2, bucket_width=1000)
+        near_duplicates = NearDuplicateIndex(max_distance=3)
+        files = [make_repeated_file("Repeated"), make_repeated_file("Copy")]
+
+        futures = [
+            scheduler.submit_file(code_file, 35, 35, 1, 35, near_duplicates=near_duplicates) for code_file in files
+        ]
+        self.assertEqual([future.result(timeout=5) for future in futures], [[1, 0, 0, 0], [1, 0, 0, 0]])
+        self.assertEqual(scheduler.windows_run, 1)
+        self.assertEqual(near_duplicates.stats(), {"lookups": 4, "inferences_saved": 3, "windows": 1})
+
+        # The windows of Cancelled are queued first, and dropped with the file before they run
+        near_duplicates = NearDuplicateIndex(max_distance=3)
+        scheduler = InferenceScheduler(model, batch_size=4, max_wait=0.2, bucket_width=1000)
+        cancelled = scheduler.submit_file(make_file("Cancelled", {}, 35), 35, 35, 1, 35,
+                                          near_duplicates=near_duplicates)
+        future = scheduler.submit_file(make_file("Kept", {}, 35), 35, 35, 1, 35, near_duplicates=near_duplicates)
+        self.assertTrue(cancelled.cancel())
+        self.assertEqual(future.result(timeout=5), [0, 0, 0, 0])
+        self.assertEqual(scheduler.windows_run, 1)
+        self.assertEqual(near_duplicates.stats()["windows"], 1)
+
+
+class BlobReuseTests(unittest.TestCase):
+
+    def test_identical_blobs_skip_inference(self):
+        """
+        Title: Testing file result reuse by git blob
+        Description: This test verifies that BlobReuse resolves a file whose blob has stored KU scores
+        without running its windows, and runs the windows of a blob submitted twice in the same analysis
+        only once, giving both files the same results.
+        Related methods: BlobReuse.submit_file
+        """
+        model = FakeCodeBERTModel()
+        scheduler = InferenceScheduler(model, batch_size=4, max_wait=0.05, bucket_width=1000)
+        blob_reuse = BlobReuse(scheduler, model.thresholds, {"known": ([0.9, 0.1, 0.0, 0.7], True)})
+
+        known = make_file("Known", {3: "ku0"}, total_lines=60)
+        known.blob_sha = "known"
+        first = make_file("First", {40: "ku1"}, total_lines=60)
+        renamed = make_file("Renamed", {40: "ku1"}, total_lines=60)
+        first.blob_sha = renamed.blob_sha = "new"
+
+        futures = [blob_reuse.submit_file(code_file, 35, 35, 1, 25) for code_file in (known, first, renamed)]
+        results = [future.result(timeout=5) for future in futures]
+
+        self.assertEqual(results, [[1, 0, 0, 1], [0, 1, 0, 0], [0, 1, 0, 0]])
+        self.assertEqual(renamed.ku_scores, first.ku_scores)
+        # The stored scores of Known were partial, those of First cover all its windows
+        self.assertEqual([f.ku_scores_partial for f in (known, first, renamed)], [True, False, False])
+        self.assertEqual(blob_reuse.files_reused, 2)
+        # Only the two windows of First were run
+        self.assertEqual(scheduler.windows_run, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
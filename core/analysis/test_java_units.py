@@ -0,0 +1,88 @@
+import unittest
+
+from core.analysis.java_units import code_file_units, java_method_spans
+from core.utils.code_file import CodeFile
+
+SAMPLE = '''package sample;
+import java.util.List;
+
+@Entity(tags = {"a", "b"})
+public class Sample {
+    private int[] values = {1, 2, 3};
+
+    public Sample() {
+        String brace = "{";
+    }
+
+    @Override
+    public String toString() {
+        return new Object() {
+            public String toString() { return "}"; }
+        }.toString();
+    }
+
+    static class Inner {
+        void run() {
+            System.out.println('}');
+        }
+    }
+}
+'''
+
+
+class JavaUnitsTests(unittest.TestCase):
+
+    def test_method_units(self):
+        """
+        Title: Testing Java method segmentation
+        Description: This test verifies that code_file_units splits a Java file into one unit per method
+        or constructor, including the methods of nested classes, and units for the code between them,
+        ignoring braces in string and character literals, annotations, array initializers and anonymous
+        classes.
+        Related methods: code_file_units, java_method_spans
+        """
+        code_file = CodeFile("Sample", SAMPLE)
+        units = code_file_units(code_file)
+
+        self.assertEqual(
+            [code_file.lines[start_idx:end_idx] for start_idx, end_idx in units],
+            [
+                code_file.lines[0:3],
+                ["    public Sample() {", '        String brace = "{";'],
+                ["    @Override", "    public String toString() {", "        return new Object() {",
+                 '            public String toString() { return "}"; }', "        }.toString();"],
+                ["    static class Inner {"],
+                ["        void run() {", "            System.out.println('}');"],
+            ],
+        )
+
+    def test_records_and_methods_named_record(self):
+        """
+        Title: Testing Java records and methods named record
+        Description: This test verifies that java_method_spans splits a record declaration into the units
+        of its compact constructor and methods, and keeps a method named record, which is not a type
+        declaration, as a single unit.
+        Related methods: java_method_spans
+        """
+        content = "\n".join([
+            "class Counter {",
+            "    public void record(int v) {",
+            "        if (v > 0) {",
+            "            x = v;",
+            "        }",
+            "        x++;",
+            "    }",
+            "    record Point<T>(T x, T y) {",
+            "        Point {",
+            "            check(x);",
+            "        }",
+            "        T first() { return x; }",
+            "    }",
+            "}",
+        ])
+
+        self.assertEqual(java_method_spans(content), [(1, 6), (8, 10), (11, 11)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from core.analysis.model_worker import model_worker, window_texts
+from core.analysis.test_codebert_sliding_window import make_file
+
+
+class FakeBinaryModel:
+    """
+    Stand-in for a binary classifier Model, detecting its KU in the windows that contain the marker "ku0".
+    """
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict_preprocessed(self, texts):
+        self.batch_sizes.append(len(texts))
+        return [int("ku0" in text) for text in texts]
+
+
+class ModelWorkerTests(unittest.TestCase):
+
+    def test_batches_across_files(self):
+        """
+        Title: Testing batched binary classifier predictions
+        Description: This test verifies that model_worker predicts the preprocessed windows of several
+        files in batches spanning files, detects the KU in a file if any of its windows is positive, and
+        skips the windows of a file in later batches once the KU is detected in it.
+        Related methods: model_worker, window_texts, Model.predict_preprocessed
+        """
+        model = FakeBinaryModel()
+        files = {
+            "First": make_file("First", {3: "ku0"}, total_lines=200),
+            "Second": make_file("Second", {}, total_lines=100),
+            "Third": make_file("Third", {30: "ku0"}, total_lines=100),
+        }
+
+        file_texts = {filename: window_texts(f, 35, 35, 1, 25) for filename, f in files.items()}
+        results = model_worker(model, file_texts, batch_size=4)
+
+        self.assertEqual(results, {"First": True, "Second": False, "Third": True})
+        # 7 + 3 + 3 windows: the last 3 windows of the first file, and the last one of the third, are skipped
+        self.assertEqual(model.batch_sizes, [4, 1, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import random
+import unittest
+from concurrent.futures import Future
+
+from core.analysis.near_duplicates import NearDuplicateIndex, simhash
+
+
+class NearDuplicateIndexTests(unittest.TestCase):
+
+    def test_reuses_near_duplicates(self):
+        """
+        Title: Testing near-duplicate window reuse
+        Description: This test verifies that NearDuplicateIndex returns the probabilities of a scored window
+        for a window differing from it by one token, not for an unrelated window, and counts the inferences
+        it saved.
+        Related methods: NearDuplicateIndex.lookup, NearDuplicateIndex.add, simhash
+        """
+        rng = random.Random(0)
+        window = [rng.randrange(50000) for _ in range(400)]
+        near_duplicate = window[:200] + [7] + window[201:]
+        unrelated = [rng.randrange(50000) for _ in range(400)]
+
+        self.assertLessEqual((simhash(window) ^ simhash(near_duplicate)).bit_count(), 3)
+
+        index = NearDuplicateIndex(max_distance=3)
+        fingerprint, probabilities = index.lookup(window)
+        self.assertIsNone(probabilities)
+        index.add(fingerprint, [0.9, 0.1])
+
+        self.assertEqual(index.lookup(near_duplicate)[1], [0.9, 0.1])
+        self.assertIsNone(index.lookup(unrelated)[1])
+        self.assertEqual(index.stats(), {"lookups": 3, "inferences_saved": 1, "windows": 1})
+
+    def test_pending_windows(self):
+        """
+        Title: Testing near-duplicate reuse of queued windows
+        Description: This test verifies that NearDuplicateIndex returns the future of a window added while it is
+        queued, then its probabilities once it is scored, and that a window whose future is cancelled is dropped.
+        Related methods: NearDuplicateIndex.add_pending, NearDuplicateIndex.lookup
+        """
+        rng = random.Random(1)
+        scored, cancelled = ([rng.randrange(50000) for _ in range(400)] for _ in range(2))
+
+        index = NearDuplicateIndex(max_distance=3)
+        futures = [Future(), Future()]
+        for window, future in zip((scored, cancelled), futures):
+            index.add_pending(index.lookup(window)[0], future)
+            self.assertIs(index.lookup(window)[1], future)
+
+        futures[0].set_result([0.9, 0.1])
+        futures[1].cancel()
+        self.assertEqual(index.lookup(scored)[1], [0.9, 0.1])
+        self.assertIsNone(index.lookup(cancelled)[1])
+        self.assertEqual(index.stats()["windows"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from core.analysis.scores import (
+    apply_thresholds,
+    pack_ku_scores,
+    pack_window_scores,
+    unpack_ku_scores,
+    unpack_window_scores,
+)
+
+
+class ScoresTests(unittest.TestCase):
+
+    def test_packed_scores_keep_detections(self):
+        """
+        Title: Testing the stored precision of the KU scores
+        Description: This test verifies that the packed per-KU and per-window scores of a file, as stored in the
+        database, keep the windows and the KUs detected with their thresholds, including for probabilities just
+        above a threshold.
+        Related methods: pack_window_scores, unpack_window_scores, pack_ku_scores, unpack_ku_scores
+        """
+        thresholds = [0.5, 0.5, 0.7]
+        window_scores = [(0, 35, [0.50001, 0.49999, 0.7]), (25, 60, [0.1, 0.7001, 0.69999])]
+
+        unpacked = unpack_window_scores(pack_window_scores(window_scores, len(thresholds)), len(thresholds))
+        self.assertEqual([(start_idx, end_idx) for start_idx, end_idx, _ in unpacked], [(0, 35), (25, 60)])
+        for (_, _, scores), (_, _, stored_scores) in zip(window_scores, unpacked):
+            self.assertEqual(apply_thresholds(stored_scores, thresholds), apply_thresholds(scores, thresholds))
+
+        ku_scores = [0.50001, 0.7001, 0.69999]
+        self.assertEqual(
+            apply_thresholds(unpack_ku_scores(pack_ku_scores(ku_scores)), thresholds),
+            {"K1": 1, "K2": 1, "K3": 0},
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+def line_windows(total_lines, min_win_size, max_win_size, win_increase_step, move_step):
+    """
+    Computes the line spans of the sliding windows over a file.
+
+        Parameters:
+            total_lines (int): The number of lines of the file.
+            min_win_size (int): The size of the smallest window, in lines.
+            max_win_size (int): The size of the largest window, in lines.
+            win_increase_step (int): The number of lines by which the window size grows.
+            move_step (int): The number of lines by which a window moves forward.
+
+        Returns:
+            windows (list): A list of (start, end) line spans, end exclusive.
+    """
+    windows = []
+    for win_size in range(min_win_size, max_win_size + 1, win_increase_step):
+        for start_idx in range(0, total_lines - win_size + 1, move_step):
+            windows.append((start_idx, start_idx + win_size))
+    return windows
+
+
+def token_budget_windows(tokenized_file, token_overlap=0, start_idx=0, end_idx=None):
+    """
+    Packs whole lines into windows that fill the maximum sequence length of the model without being truncated.
+
+        Parameters:
+            tokenized_file (TokenizedFile): The token ids of the file, as returned by CodeBERTModel.tokenize_file.
+            token_overlap (int): The maximum number of tokens a window repeats from the end of the previous one.
+            start_idx, end_idx (int): The range of lines to pack, by default the whole file.
+
+        Returns:
+            windows (list): A list of (start, end) line spans, end exclusive. A line that does not fit in a window
+            on its own gets a window of its own, which is the only case of truncation.
+    """
+    windows = []
+    total_lines = len(tokenized_file.lines) if end_idx is None else end_idx
+    max_tokens = tokenized_file.max_tokens
+
+    while start_idx < total_lines:
+        end_idx = start_idx + 1
+        while end_idx < total_lines and tokenized_file.window_length(start_idx, end_idx + 1) <= max_tokens:
+            end_idx += 1
+        windows.append((start_idx, end_idx))
+        if end_idx == total_lines:
+            break
+
+        # Start the next window on the last lines of this one that fit in the overlap, always moving forward
+        next_start_idx = end_idx
+        overlap = 0
+        while next_start_idx - 1 > start_idx:
+            overlap += tokenized_file.line_length(next_start_idx - 1)
+            if overlap > token_overlap:
+                break
+            next_start_idx -= 1
+        start_idx = next_start_idx
+
+    return windows
+
+
+def unit_windows(tokenized_file, units, token_overlap=0):
+    """
+    Packs consecutive code units, such as the methods of a file, into windows of whole units that fit in the maximum
+    sequence length of the model. A unit that does not fit in a window on its own is split into token-budget windows.
+
+        Parameters:
+            tokenized_file (TokenizedFile): The token ids of the file, as returned by CodeBERTModel.tokenize_file.
+            units (list): (start, end) line spans that cover the file in order, as returned by code_file_units.
+            token_overlap (int): The maximum number of tokens shared by the windows of a split unit.
+
+        Returns:
+            windows (list): A list of (start, end) line spans, end exclusive.
+    """
+    windows = []
+    max_tokens = tokenized_file.max_tokens
+    group = None
+
+    for start_idx, end_idx in units:
+        if group is not None and tokenized_file.window_length(group[0], end_idx) <= max_tokens:
+            group = (group[0], end_idx)
+            continue
+        if group is not None:
+            windows.append(group)
+
+        if tokenized_file.window_length(start_idx, end_idx) <= max_tokens:
+            group = (start_idx, end_idx)
+        else:
+            windows.extend(token_budget_windows(tokenized_file, token_overlap, start_idx, end_idx))
+            group = None
+
+    if group is not None:
+        windows.append(group)
+    return windows
+
+
+def coarse_to_fine(windows, coarse_factor):
+    """
+    Orders windows so that every coarse_factor-th window comes first, followed by the windows in between at
+    halving strides, so that the whole file is sampled early on.
+
+        Parameters:
+            windows (list): The windows in file order.
+            coarse_factor (int): The stride of the first pass, in windows.
+
+        Returns:
+            windows (list): The same windows, in visiting order.
+    """
+    ordered = []
+    visited = [False] * len(windows)
+    stride = max(coarse_factor, 1)
+
+    while stride >= 1:
+        for i in range(0, len(windows), stride):
+            if not visited[i]:
+                visited[i] = True
+                ordered.append(windows[i])
+        stride //= 2
+
+    return ordered
+
+
+def order_windows(windows, schedule="linear", coarse_factor=4):
+    """
+    Orders windows according to a scheduling mode: "linear" keeps the file order, "coarse_to_fine" uses coarse_to_fine.
+    """
+    if schedule == "linear":
+        return windows
+    if schedule == "coarse_to_fine":
+        return coarse_to_fine(windows, coarse_factor)
+    raise ValueError(f"Unknown window schedule: {schedule}")
@@ -87,6 +87,8 @@ def get_contributions_from_diffs(commit, diffs):
                             commit.committed_date
                         ).isoformat(),
                         "sha": commit.hexsha,
+                        "blob_sha": file_content.hexsha,
+                        "previous_blob_sha": diff.a_blob.hexsha if commit.parents and diff.a_blob else None,
                     }
                 )
 
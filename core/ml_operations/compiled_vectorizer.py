@@ -0,0 +1,124 @@
+import numpy as np
+
+from .preprocessed_text import PreprocessedText
+
+# scipy and scikit-learn are imported by the methods that need them, as the API imports this module at startup
+
+# The parameters of a TfidfVectorizer that define how it splits a text into n-grams
+_ANALYZER_PARAMS = ("analyzer", "lowercase", "ngram_range", "strip_accents", "token_pattern", "stop_words")
+
+
+class CompiledVectorizer:
+    """
+    A fitted TfidfVectorizer fused with the SelectKBest selector that follows it, compiled by compile_vectorizer.
+
+    It computes the same float32 features as selector.transform(vectorizer.transform(texts)), bit for bit, but
+    keeps only what the transform needs: the vocabulary, the idf weights, and the output column of every term.
+    The stop_words_ set of the vectorizer, and the scores and p-values of the selector, are dropped. The terms
+    that the selector drops are still counted, as they are part of the l2 norm of every row.
+    """
+
+    def __init__(self, vocabulary, idf, columns, analyzer_params, dtype="int32"):
+        self.vocabulary = vocabulary
+        self.idf = idf
+        # The output column of every vocabulary column, -1 for the dropped ones, or None if none is dropped
+        self.columns = columns
+        self.analyzer_params = analyzer_params
+        self.dtype = dtype
+        self._build()
+
+    def _build(self):
+        import scipy.sparse as sp
+        from sklearn.feature_extraction.text import CountVectorizer
+
+        # A list of stop words is frozen, so that the key stays hashable
+        self.analyzer_key = tuple(sorted(
+            (param, tuple(value) if isinstance(value, list) else value) for param, value in self.analyzer_params.items()
+        ))
+        self._analyzer = CountVectorizer(**self.analyzer_params).build_analyzer()
+        n_features = len(self.vocabulary)
+        self._idf_diag = sp.diags(self.idf, offsets=0, shape=(n_features, n_features), format="csr", dtype="float64")
+        if self.columns is None:
+            self.n_features = n_features
+            self._selected = None
+        else:
+            self.n_features = int((self.columns >= 0).sum())
+            self._selected = np.flatnonzero(self.columns >= 0)
+
+    def __getstate__(self):
+        # The analyzer and the idf matrix are rebuilt on load
+        return {key: value for key, value in self.__dict__.items() if not key.startswith("_")
+                and key not in ("analyzer_key", "n_features")}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build()
+
+    def transform(self, texts):
+        """
+        Returns the selected tf-idf features of texts, as a float32 sparse matrix with one row per text.
+
+            Parameters:
+                texts (list): The texts to vectorize. The n-grams of PreprocessedText texts are extracted once for
+                    all the vectorizers with the same analyzer.
+        """
+        import scipy.sparse as sp
+        from sklearn.preprocessing import normalize
+
+        vocabulary = self.vocabulary
+        j_indices = []
+        values = []
+        indptr = [0]
+        for text in texts:
+            ngrams = text.ngrams(self.analyzer_key, self._analyzer) if isinstance(text, PreprocessedText) \
+                else self._analyzer(text)
+            # Counted like CountVectorizer, so that every row keeps the same order of terms
+            counts = {}
+            for ngram in ngrams:
+                column = vocabulary.get(ngram)
+                if column is not None:
+                    counts[column] = counts.get(column, 0) + 1
+            j_indices.extend(counts.keys())
+            values.extend(counts.values())
+            indptr.append(len(j_indices))
+
+        x = sp.csr_matrix((values, j_indices, indptr), shape=(len(indptr) - 1, len(vocabulary)), dtype=self.dtype)
+        x.sort_indices()
+        # The same operations as TfidfTransformer.transform, which round alike
+        x = normalize(x.astype("float64") * self._idf_diag, norm="l2", copy=False)
+
+        if self._selected is not None:
+            x = x[:, self._selected]
+        return x.astype("float32")
+
+
+def compile_vectorizer(vectorizer, selector=None):
+    """
+    Fuses a fitted TfidfVectorizer and the feature selector that follows it into a CompiledVectorizer.
+
+        Parameters:
+            vectorizer (TfidfVectorizer): The vectorizer, with word n-grams and its default smooth idf and l2 norm.
+            selector (SelectorMixin): The selector of the vectorizer features, or None if all of them are kept.
+
+        Returns:
+            compiled (CompiledVectorizer): The fused vectorizer.
+    """
+    params = vectorizer.get_params()
+    if params["analyzer"] != "word" or params["preprocessor"] is not None or params["tokenizer"] is not None:
+        raise ValueError("Only vectorizers of word n-grams with the default preprocessor and tokenizer are supported")
+    if params["binary"] or params["sublinear_tf"] or not params["use_idf"] or params["norm"] != "l2":
+        raise ValueError("Only vectorizers of l2-normalized tf-idf features are supported")
+
+    columns = None
+    if selector is not None:
+        support = selector.get_support()
+        if not support.all():
+            columns = np.where(support, np.cumsum(support) - 1, -1).astype("int32")
+
+    return CompiledVectorizer(
+        dict(vectorizer.vocabulary_),
+        np.asarray(vectorizer.idf_, dtype="float64"),
+        columns,
+        {param: params[param] for param in _ANALYZER_PARAMS},
+        np.dtype(params["dtype"]).name,
+    )
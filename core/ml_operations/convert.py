@@ -0,0 +1,90 @@
+import os
+import shutil
+import sys
+
+from joblib import dump, load
+
+from .compiled_vectorizer import compile_vectorizer
+from .dense_network import convert_keras_model
+
+
+def convert_binary_classifiers(directory, output_directory):
+    """
+    Rewrites the pickled vectorizers, selectors and models of every "K#" subdirectory as uncompressed joblib
+    files, whose numpy arrays can be memory-mapped by load_models_from_directory with mmap_mode="r".
+    Keras models are copied, and also converted to .npz files that load_models_from_directory runs with NumPy.
+    Every vectorizer is also compiled with its selector into a "K#_compiled_vectorizer.pkl" file, which
+    load_models_from_directory uses in place of both.
+
+        Parameters:
+            directory (str): The directory of the binary classifiers, one subdirectory per KU.
+            output_directory (str): The directory to write the converted classifiers to, with the same layout.
+    """
+    for subdir in sorted(os.listdir(directory)):
+        if not os.path.isdir(os.path.join(directory, subdir)):
+            continue
+        os.makedirs(os.path.join(output_directory, subdir), exist_ok=True)
+
+        for file in os.listdir(os.path.join(directory, subdir)):
+            path = os.path.join(directory, subdir, file)
+            output_path = os.path.join(output_directory, subdir, file)
+            if file.endswith(".pkl"):
+                # Without compression, joblib stores every numpy array as a contiguous, mappable block
+                dump(load(path), output_path, compress=0)
+            else:
+                shutil.copy2(path, output_path)
+            if file.endswith(".h5"):
+                convert_keras_model(path, os.path.splitext(output_path)[0] + ".npz")
+        compile_binary_classifier_vectorizer(os.path.join(directory, subdir), os.path.join(output_directory, subdir))
+        print(f"Converted {subdir}")
+
+
+def compile_binary_classifier_vectorizer(directory, output_directory=None):
+    """
+    Fuses the vectorizer and the selector of a binary classifier into a CompiledVectorizer, written as
+    "K#_compiled_vectorizer.pkl", which computes the same features without the fitting attributes the transform
+    does not need, and extracts the n-grams of a window once for all the classifiers.
+
+        Parameters:
+            directory (str): The directory of the classifier, e.g. models/binary_classifiers/K1.
+            output_directory (str): The directory to write the compiled vectorizer to, by default directory itself.
+    """
+    name = os.path.basename(os.path.normpath(directory))
+    paths = {}
+    for file in sorted(os.listdir(directory)):
+        for kind in ("vectorizer", "selector"):
+            if file.startswith(f"{name}_{kind}") and file.endswith(".pkl"):
+                paths.setdefault(kind, os.path.join(directory, file))
+    if len(paths) < 2:
+        print(f"Vectorizer or selector not found for {name}, not compiled")
+        return
+
+    compiled = compile_vectorizer(load(paths["vectorizer"]), load(paths["selector"]))
+    dump(compiled, os.path.join(output_directory or directory, f"{name}_compiled_vectorizer.pkl"), compress=0)
+
+
+def convert_codebert(directory, output_directory=None):
+    """
+    Writes the CodeBERT weights as model.safetensors, which load_codebert_model maps instead of reading.
+
+        Parameters:
+            directory (str): The directory of the PyTorch model.
+            output_directory (str): The directory to write the model to, by default directory itself.
+    """
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    output_directory = output_directory or directory
+    model = AutoModelForSequenceClassification.from_pretrained(directory)
+    model.save_pretrained(output_directory, safe_serialization=True)
+    if output_directory != directory:
+        AutoTokenizer.from_pretrained(directory).save_pretrained(output_directory)
+    print(f"Converted {directory} to {os.path.join(output_directory, 'model.safetensors')}")
+
+
+if __name__ == "__main__":
+    # Usage: python -m core.ml_operations.convert
+    from config.settings import CODEBERT_BASE_PATH, MODELS_BASE_PATH, MODELS_MMAP_PATH
+
+    if "--skip-codebert" not in sys.argv:
+        convert_codebert(CODEBERT_BASE_PATH)
+    convert_binary_classifiers(MODELS_BASE_PATH, MODELS_MMAP_PATH)
@@ -0,0 +1,89 @@
+import numpy as np
+
+
+def _softmax(x):
+    exp = np.exp(x - x.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+_ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "sigmoid": lambda x: 1 / (1 + np.exp(-x)),
+    "tanh": np.tanh,
+    "softmax": _softmax,
+}
+
+
+class DenseNetwork:
+    """
+    Runs a sequential network of dense layers with NumPy, in place of the Keras model it was converted from by
+    convert_keras_model, so that the binary classifiers do not need TensorFlow.
+    """
+
+    def __init__(self, kernels, biases, activations):
+        self.kernels = kernels
+        self.biases = biases
+        self.activations = activations
+
+    def __call__(self, x):
+        """
+        Returns the outputs of the network, one row per input row, like calling the Keras model.
+
+            Parameters:
+                x (ndarray or sparse matrix): The inputs, one row per sample. A sparse matrix is only multiplied,
+                    never made dense.
+        """
+        for kernel, bias, activation in zip(self.kernels, self.biases, self.activations):
+            x = _ACTIVATIONS[activation](np.asarray(x @ kernel) + bias)
+        return x
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as data:
+            activations = [str(activation) for activation in data["activations"]]
+            kernels = [data[f"kernel_{i}"] for i in range(len(activations))]
+            biases = [data[f"bias_{i}"] for i in range(len(activations))]
+        return DenseNetwork(kernels, biases, activations)
+
+    def save(self, path):
+        arrays = {"activations": np.array(self.activations)}
+        for i, (kernel, bias) in enumerate(zip(self.kernels, self.biases)):
+            arrays[f"kernel_{i}"], arrays[f"bias_{i}"] = kernel, bias
+        # Written uncompressed, so that loading is a plain read
+        np.savez(path, **arrays)
+
+
+def convert_keras_model(path, output_path):
+    """
+    Extracts the weights and activations of a Keras sequential model of dense layers into a .npz file that
+    DenseNetwork.load reads without TensorFlow. Dropout layers, which do nothing at inference, are skipped.
+
+        Parameters:
+            path (str): The path of the Keras model, e.g. K1_model.h5.
+            output_path (str): The path of the .npz file to write.
+
+        Returns:
+            network (DenseNetwork): The converted network.
+    """
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(path)
+    kernels, biases, activations = [], [], []
+    for layer in model.layers:
+        if isinstance(layer, (tf.keras.layers.Dropout, tf.keras.layers.InputLayer)):
+            continue
+        if not isinstance(layer, tf.keras.layers.Dense):
+            raise ValueError(f"Unsupported layer {layer.name} ({type(layer).__name__}) in {path}")
+        activation = layer.get_config()["activation"]
+        if activation not in _ACTIVATIONS:
+            raise ValueError(f"Unsupported activation {activation} of layer {layer.name} in {path}")
+
+        kernel, bias = layer.get_weights() if layer.use_bias else (layer.get_weights()[0], None)
+        kernels.append(kernel)
+        biases.append(bias if bias is not None else np.zeros(kernel.shape[1], dtype=kernel.dtype))
+        activations.append(activation)
+
+    network = DenseNetwork(kernels, biases, activations)
+    network.save(output_path)
+    return network
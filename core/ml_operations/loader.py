@@ -1,14 +1,17 @@
 import os
 from joblib import load
-import tensorflow as tf
 from .model import *
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from .onnx_engine import OnnxSequenceClassifier, export_codebert_onnx
+from .dense_network import DenseNetwork
+from .compiled_vectorizer import CompiledVectorizer
 
 # Suppress TensorFlow warnings about CPU instructions
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 
+# tensorflow and transformers are imported by the functions that need them, as they take seconds to import
 
-def load_models_from_directory(directory, models_to_load=None):
+
+def load_models_from_directory(directory, models_to_load=None, mmap_mode=None):
     models = []
 
     # Iterate over all subdirectories
@@ -25,37 +28,51 @@ def load_models_from_directory(directory, models_to_load=None):
         model = None
         filetype = None
 
-        # Find and load the vectorizer
-        vectorizer_path = None
-        for file in os.listdir(os.path.join(directory, subdir)):
-            if file.startswith(f"{subdir}_vectorizer") and file.endswith(".pkl"):
-                vectorizer_path = os.path.join(directory, subdir, file)
-                vectorizer = load(vectorizer_path)
-                break
-        if not vectorizer_path:
-            print(f"Vectorizer not found for {subdir}. Skipping...")
-            continue
+        # A vectorizer compiled with its selector (python -m core.ml_operations.convert) replaces both of them
+        compiled_path = os.path.join(directory, subdir, f"{subdir}_compiled_vectorizer.pkl")
+        if os.path.exists(compiled_path):
+            vectorizer = load(compiled_path, mmap_mode=mmap_mode)
+        else:
+            # Find and load the vectorizer
+            vectorizer_path = None
+            for file in os.listdir(os.path.join(directory, subdir)):
+                if file.startswith(f"{subdir}_vectorizer") and file.endswith(".pkl"):
+                    vectorizer_path = os.path.join(directory, subdir, file)
+                    vectorizer = load(vectorizer_path, mmap_mode=mmap_mode)
+                    break
+            if not vectorizer_path:
+                print(f"Vectorizer not found for {subdir}. Skipping...")
+                continue
 
-        # Find and load the selector
-        selector_path = None
-        for file in os.listdir(os.path.join(directory, subdir)):
-            if file.startswith(f"{subdir}_selector") and file.endswith(".pkl"):
-                selector_path = os.path.join(directory, subdir, file)
-                selector = load(selector_path)
-                break
-        if not selector_path:
-            print(f"Selector not found for {subdir}. Skipping...")
-            continue
+            # Find and load the selector
+            selector_path = None
+            for file in os.listdir(os.path.join(directory, subdir)):
+                if file.startswith(f"{subdir}_selector") and file.endswith(".pkl"):
+                    selector_path = os.path.join(directory, subdir, file)
+                    selector = load(selector_path, mmap_mode=mmap_mode)
+                    break
+            if not selector_path:
+                print(f"Selector not found for {subdir}. Skipping...")
+                continue
 
-        # Load the model, either .pkl or .h5
+        # Load the model, either .pkl, or .npz converted from .h5 (python -m core.ml_operations.convert), or .h5.
+        # A converted .npz model is preferred to its .h5 original, as it runs without importing TensorFlow.
         model_path = None
-        for file in os.listdir(os.path.join(directory, subdir)):
-            if file.endswith("model.pkl"):
+        files = sorted(os.listdir(os.path.join(directory, subdir)), key=lambda file: not file.endswith("model.npz"))
+        for file in files:
+            if file.endswith("model.npz"):
                 model_path = os.path.join(directory, subdir, file)
-                model = load(model_path)
+                model = DenseNetwork.load(model_path)
+                filetype = "npz"
+                break
+            elif file.endswith("model.pkl"):
+                model_path = os.path.join(directory, subdir, file)
+                model = load(model_path, mmap_mode=mmap_mode)
                 filetype = "pkl"
                 break
             elif file.endswith("model.h5"):
+                import tensorflow as tf
+
                 model_path = os.path.join(directory, subdir, file)
                 model = tf.keras.models.load_model(model_path)
                 filetype = "h5"
@@ -65,7 +82,7 @@ def load_models_from_directory(directory, models_to_load=None):
             print(f"No suitable model found for {subdir}. Skipping...")
             continue
 
-        if vectorizer and selector and model:
+        if vectorizer and (selector or isinstance(vectorizer, CompiledVectorizer)) and model:
             print(f"Loaded {subdir} model")
             # append the loaded Model instance to the models list
             models.append(Model(vectorizer, selector, model, subdir, filetype))
@@ -73,7 +90,59 @@ def load_models_from_directory(directory, models_to_load=None):
     return models
 
 
-def load_codebert_model(directory, number_of_kus=27):
+def load_codebert_model(directory, number_of_kus=27, engine="torch", quantize=False, onnx_directory=None):
+    """
+    Loads the CodeBERT model, served either by PyTorch or by ONNX Runtime.
+
+        Parameters:
+            directory (str): The directory of the PyTorch model and its tokenizer.
+            number_of_kus (int): The number of KUs the model predicts.
+            engine (str): "torch", or "onnx" to export the model to ONNX once and run it through ONNX Runtime.
+            quantize (bool): Whether the ONNX engine uses the int8 dynamically quantized model.
+            onnx_directory (str): Where the ONNX exports are cached, by default an "onnx" directory in directory.
+
+        Returns:
+            model (CodeBERTModel): The loaded model.
+    """
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
     tokenizer = AutoTokenizer.from_pretrained(directory)
-    model = AutoModelForSequenceClassification.from_pretrained(directory)
+    if engine == "torch" and os.path.exists(os.path.join(directory, "model.safetensors")):
+        model = _map_codebert_weights(directory)
+    elif engine == "torch":
+        model = AutoModelForSequenceClassification.from_pretrained(directory)
+    elif engine == "onnx":
+        onnx_path = export_codebert_onnx(directory, onnx_directory or os.path.join(directory, "onnx"), quantize)
+        model = OnnxSequenceClassifier(onnx_path)
+    else:
+        raise ValueError(f"Unknown CodeBERT engine: {engine}")
     return CodeBERTModel(tokenizer, model, "CodeBERT", number_of_kus)
+
+
+def _map_codebert_weights(directory):
+    # The parameters are the tensors of the memory-mapped safetensors file, so the weights stay in the page
+    # cache, shared by all processes of the host, instead of being copied into the heap of each one
+    from safetensors.torch import load_file
+    from transformers import AutoConfig, AutoModelForSequenceClassification
+    from transformers.modeling_utils import no_init_weights
+
+    with no_init_weights():
+        model = AutoModelForSequenceClassification.from_config(AutoConfig.from_pretrained(directory))
+    result = model.load_state_dict(load_file(os.path.join(directory, "model.safetensors")), strict=False, assign=True)
+    # Only the tied weights may be missing, as they are saved once; any other parameter would be left uninitialized
+    missing_keys = set(result.missing_keys) - set(model._tied_weights_keys or [])
+    if missing_keys:
+        raise ValueError(f"Weights missing from {directory}: {', '.join(sorted(missing_keys))}")
+    model.tie_weights()
+    return model.eval()
+
+
+def connect_codebert_model(directory, socket_path, number_of_kus=27):
+    """
+    Loads only the tokenizer of the CodeBERT model, and returns a client of the model server listening on socket_path.
+    """
+    from transformers import AutoTokenizer
+    from .model_server import CodeBERTClient
+
+    tokenizer = AutoTokenizer.from_pretrained(directory)
+    return CodeBERTClient(tokenizer, socket_path, "CodeBERT", number_of_kus)
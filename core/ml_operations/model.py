@@ -1,5 +1,9 @@
 from core.utils.code_preprocessing import *
-import torch
+from itertools import accumulate
+
+import numpy as np
+
+from .preprocessed_text import PreprocessedText
 
 
 class Model:
@@ -14,35 +18,98 @@ class Model:
         return self.name
 
     def predict(self, code):
-        prediction = None
+        return self.predict_many([code])[0]
 
-        code = "\n".join(code)
-        code = remove_blank_lines(code)
-        code = replace_strings_and_chars(code)
-        code = replace_numbers(code)
-        code = replace_booleans(code)
-        code_tokens_list = tokenize_code(code)
+    def predict_many(self, windows):
+        """
+        Predicts many code windows at once, with a single vectorization into one sparse matrix and a single call
+        to the model.
+
+            Parameters:
+                windows (list): A list of code windows, each one a list of lines.
 
-        code_vec = self.__ngram_vectorize_text(
-            texts=[word_list_to_string(code_tokens_list)],
-        )
+            Returns:
+                predictions (list): The prediction of every window, 0 or 1, as returned by predict.
+        """
+        return self.predict_preprocessed(Model.preprocess(windows))
 
-        # Use the trained model to make a prediction on the preprocessed text
+    def predict_preprocessed(self, texts):
+        """
+        Same as predict_many, on windows already preprocessed by Model.preprocess, which all models can share.
+        """
+        if not texts:
+            return []
+        code_vec = self.__ngram_vectorize_text(texts=texts)
+
+        # Use the trained model to make a prediction on the preprocessed texts
         if self.filetype == "pkl":
-            prediction = self.model.predict(code_vec)
-            prediction = prediction[0]
-        elif self.filetype == "h5":
-            code_vec = code_vec.toarray()
-            prediction = self.model(code_vec)
-            prediction = prediction[0][0]
-            if prediction > 0.5:
-                prediction = 1
-            else:
-                prediction = 0
+            return self.model.predict(code_vec).tolist()
+        if self.filetype in ("h5", "npz"):
+            outputs = self.__network_outputs(code_vec)
+            return [1 if output > 0.5 else 0 for output in outputs]
+        return [None] * len(texts)
+
+    def predict_scores(self, windows):
+        """
+        Scores many code windows at once, on a scale where 0.5 is the decision boundary of predict.
+
+            Parameters:
+                windows (list): A list of code windows, each one a list of lines.
+
+            Returns:
+                scores (ndarray): One score between 0 and 1 per window: the output of the network for .h5 and .npz
+                models, and the logistic function of the decision function for the others.
+        """
+        return self.predict_scores_preprocessed(Model.preprocess(windows))
+
+    def predict_scores_preprocessed(self, texts):
+        """
+        Same as predict_scores, on windows already preprocessed by Model.preprocess, which all models can share.
+        """
+        if not texts:
+            return np.zeros(0)
+        code_vec = self.__ngram_vectorize_text(texts=texts)
+
+        if self.filetype in ("h5", "npz"):
+            return self.__network_outputs(code_vec)
+        if hasattr(self.model, "decision_function"):
+            return 1 / (1 + np.exp(-np.asarray(self.model.decision_function(code_vec), dtype="float64").reshape(-1)))
+        return np.asarray(self.model.predict(code_vec), dtype="float64")
+
+    @staticmethod
+    def preprocess(windows):
+        """
+        Normalizes and tokenizes code windows into the texts the vectorizers of all binary classifiers take, so
+        that the windows are preprocessed once for any number of models.
 
-        return prediction
+            Parameters:
+                windows (list): A list of code windows, each one a list of lines.
+
+            Returns:
+                texts (list): The preprocessed text of every window, as a PreprocessedText whose n-grams compiled
+                vectorizers extract once.
+        """
+        texts = []
+        for code in windows:
+            code = "\n".join(code)
+            code = remove_blank_lines(code)
+            code = replace_strings_and_chars(code)
+            code = replace_numbers(code)
+            code = replace_booleans(code)
+            texts.append(PreprocessedText(word_list_to_string(tokenize_code(code))))
+        return texts
+
+    def __network_outputs(self, code_vec):
+        # A DenseNetwork takes the sparse matrix as it is, a Keras model needs a dense array
+        if self.filetype == "h5":
+            code_vec = code_vec.toarray()
+        return np.asarray(self.model(code_vec)).reshape(-1)
 
     def __ngram_vectorize_text(self, texts):
+        # A CompiledVectorizer already selects the features, and returns them as float32
+        if self.selector is None:
+            return self.vectorizer.transform(texts)
+
         # Vectorize new texts using the same vectorizer that was used during training.
         x = self.vectorizer.transform(texts)
 
@@ -53,11 +120,17 @@ class Model:
 
 
 class CodeBERTModel:
-    def __init__(self, tokenizer, model, name, number_of_kus):
+    def __init__(self, tokenizer, model, name, number_of_kus, thresholds=None):
         self.tokenizer = tokenizer
         self.model = model
         self.name = name
         self.number_of_kus = number_of_kus
+        # The probability above which a KU counts as detected, per KU
+        self.thresholds = thresholds or [0.5] * number_of_kus
+        # An optional PredictionCache of the window probabilities
+        self.cache = None
+        # Tokenizes the files, as the truncation of the shared tokenizer is set by every call to it
+        self.file_tokenizer = untruncated_backend_tokenizer(tokenizer)
 
     def __str__(self):
         return self.name
@@ -66,25 +139,244 @@ class CodeBERTModel:
         return self.number_of_kus
 
     def predict(self, code):
+        return self.predict_batch([code], batch_size=1)[0]
+
+    def predict_batch(self, windows, batch_size=16):
+        """
+        Predicts the KUs of many code windows, running them through the model in padded batches.
+
+            Parameters:
+                windows (list): A list of code windows, each one a list of lines.
+                batch_size (int): The number of windows per forward pass.
+
+            Returns:
+                results (list): One list of binary predictions per window, in the order of the windows.
+        """
+        return self.predict_encoded(self.encode(windows), batch_size=batch_size)
+
+    def encode(self, windows):
+        """
+        Preprocesses and tokenizes code windows without padding them.
+
+            Parameters:
+                windows (list): A list of code windows, each one a list of lines.
+
+            Returns:
+                input_ids (list): The token ids of every window, truncated to the maximum length of the model.
+        """
+        if not windows:
+            return []
+        codes = [self.__preprocess(code) for code in windows]
+        return self.tokenizer(codes, truncation=True)["input_ids"]
+
+    def tokenize_file(self, lines):
+        """
+        Preprocesses and tokenizes the lines of a file once, so that windows can be sliced out of the token ids.
+
+            Parameters:
+                lines (list): The lines of the file.
+
+            Returns:
+                tokenized_file (TokenizedFile): The token ids of the file, line by line.
+        """
+        # The preprocessing acts within lines, so the whole file is preprocessed at once unless it splits a line
+        code_lines = self.__preprocess(lines).split("\n") if lines else []
+        if len(code_lines) != len(lines):
+            code_lines = [self.__preprocess([line]) for line in lines]
+        return TokenizedFile(self.tokenizer, code_lines, self.file_tokenizer)
+
+    def predict_encoded(self, input_ids, batch_size=16):
+        """
+        Predicts the KUs of already tokenized code windows, padding every batch to its longest window.
+
+            Parameters:
+                input_ids (list): The token ids of every window, as returned by encode.
+                batch_size (int): The number of windows per forward pass.
+
+            Returns:
+                results (list): One list of binary predictions per window, in the order of the windows.
+        """
+        return [
+            [int(probability > threshold) for probability, threshold in zip(probabilities, self.thresholds)]
+            for probabilities in self.predict_proba_encoded(input_ids, batch_size=batch_size)
+        ]
+
+    def predict_proba_encoded(self, input_ids, batch_size=16):
+        """
+        Computes the KU probabilities of already tokenized code windows, padding every batch to its longest window.
+
+            Parameters:
+                input_ids (list): The token ids of every window, as returned by encode.
+                batch_size (int): The number of windows per forward pass.
+
+            Returns:
+                results (list): One list of KU probabilities per window, in the order of the windows.
+        """
+        if self.cache is None:
+            return self._forward(input_ids, batch_size)
+
+        # Only the windows that are not cached go through the model
+        keys = [self.cache.key(window_ids) for window_ids in input_ids]
+        results = self.cache.get_many(keys)
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            probabilities = self._forward([input_ids[i] for i in missing], batch_size)
+            self.cache.put_many([keys[i] for i in missing], probabilities)
+            for i, window_probabilities in zip(missing, probabilities):
+                results[i] = window_probabilities
+        return results
+
+    def _forward(self, input_ids, batch_size):
+        # torch is only imported once a model is used, as it is slow to import
+        import torch
+
+        results = []
+        self.model.eval()
+
+        for batch_start in range(0, len(input_ids), batch_size):
+            batch = input_ids[batch_start:batch_start + batch_size]
+            inputs = self.tokenizer.pad({"input_ids": batch}, padding=True, return_tensors='pt')
+
+            # Make predictions
+            with torch.no_grad():
+                outputs = self.model(**inputs)
+
+            # Convert logits to probabilities
+            predictions = torch.sigmoid(outputs.logits)
+
+            results.extend(predictions.tolist())
+
+        return results
+
+    @staticmethod
+    def __preprocess(code):
         code = "\n".join(code)
         code = remove_blank_lines(code)
         code = replace_strings_and_chars(code)
         code = replace_numbers(code)
         code = replace_booleans(code)
+        return code
 
-        # Tokenize the input code snippet
-        inputs = self.tokenizer([code], padding=True, truncation=True, return_tensors='pt')
 
-        # Make predictions
-        self.model.eval()
-        with torch.no_grad():
-            outputs = self.model(**inputs)
+def untruncated_backend_tokenizer(tokenizer):
+    """
+    Returns a private copy of the backend of a fast tokenizer, with truncation and padding disabled once and for all,
+    or None for a slow tokenizer. Every call to a fast tokenizer sets the truncation of its backend, which other
+    threads may be using, so the copy is made before the tokenizer is shared, and is only ever read afterwards.
+    """
+    if tokenizer is None or not tokenizer.is_fast:
+        return None
+    from tokenizers import Tokenizer
+
+    backend_tokenizer = Tokenizer.from_str(tokenizer.backend_tokenizer.to_str())
+    backend_tokenizer.no_truncation()
+    backend_tokenizer.no_padding()
+    return backend_tokenizer
+
+
+class TokenizedFile:
+    """
+    The token ids of the preprocessed lines of a file, with a line to token offset map.
+
+    The preprocessing steps act within a line, and the byte-level tokenizer never merges a line break with
+    the characters before it, so the token ids of a window are the ids of its first line on its own followed
+    by the ids of every other line with its leading line break. The whole file is tokenized once, and only
+    the first lines of windows are tokenized again without their line break.
+
+    With a fast tokenizer, the text is tokenized by backend_tokenizer, as returned by untruncated_backend_tokenizer,
+    and never by the tokenizer itself, whose state other threads share.
+    """
+
+    def __init__(self, tokenizer, lines, backend_tokenizer=None):
+        self.tokenizer = tokenizer
+        self.backend_tokenizer = backend_tokenizer
+        self.lines = lines
+        self.max_tokens = tokenizer.model_max_length - tokenizer.num_special_tokens_to_add()
+
+        # offsets[i] is the position in token_ids of the first token of line i, including its line break
+        self.token_ids, self.offsets = self.__tokenize_lines()
+        self.__first_line_ids = {0: self.token_ids[:self.offsets[1]]} if lines else {}
+
+    def __tokenize_lines(self):
+        if not self.lines:
+            return [], [0]
+        text = "\n".join(self.lines)
+
+        if self.backend_tokenizer is not None:
+            # Every token of a byte-level tokenizer is a string of one character per byte, so the line boundaries
+            # are found by counting bytes
+            encoding = self.backend_tokenizer.encode(text, add_special_tokens=False)
+            token_ids = encoding.ids
+            token_starts = {
+                position: i for i, position in enumerate(accumulate(map(len, encoding.tokens), initial=0))
+            }
+
+            offsets = [0]
+            position = 0
+            for line in self.lines[:-1]:
+                position += len(line.encode("utf-8"))
+                offsets.append(token_starts.get(position))
+                position += 1
+            offsets.append(len(token_ids))
+
+            if None not in offsets and token_starts.get(len(text.encode("utf-8"))) == len(token_ids):
+                return token_ids, offsets
+
+        # Otherwise every line is tokenized on its own with its line break
+        token_ids = self.__encode([self.lines[0]])[0]
+        offsets = [0, len(token_ids)]
+        if len(self.lines) > 1:
+            other_lines = ["\n" + line for line in self.lines[1:]]
+            for line_ids in self.__encode(other_lines):
+                token_ids.extend(line_ids)
+                offsets.append(len(token_ids))
+        return token_ids, offsets
+
+    def __encode(self, texts):
+        # The token ids of every text, without special tokens
+        if self.backend_tokenizer is not None:
+            return [encoding.ids for encoding in self.backend_tokenizer.encode_batch(texts, add_special_tokens=False)]
+        return self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+
+    def line_length(self, line_idx):
+        """
+        Returns the number of tokens of a line, including its leading line break.
+        """
+        return self.offsets[line_idx + 1] - self.offsets[line_idx]
+
+    def window_length(self, start, end):
+        """
+        Returns the number of tokens of a window of lines before truncation, without the special tokens.
+        """
+        if end <= start:
+            return 0
+        return len(self.__first_line(start)) + self.offsets[end] - self.offsets[start + 1]
+
+    def __first_line(self, start):
+        if start not in self.__first_line_ids:
+            self.__first_line_ids[start] = self.__encode([self.lines[start]])[0]
+        return self.__first_line_ids[start]
+
+    def window_ids(self, spans):
+        """
+        Builds the input ids of windows of lines, truncated to the maximum length of the model.
 
-        # Convert logits to probabilities
-        predictions = torch.sigmoid(outputs.logits)
+            Parameters:
+                spans (list): A list of (start, end) line spans, end exclusive.
 
-        # Apply a threshold to get binary predictions
-        threshold = 0.5
-        binary_predictions = (predictions > threshold).int()
+            Returns:
+                input_ids (list): The token ids of every window, equal to those of CodeBERTModel.encode.
+        """
+        starts = sorted({start for start, end in spans if end > start and start not in self.__first_line_ids})
+        if starts:
+            self.__first_line_ids.update(zip(starts, self.__encode([self.lines[start] for start in starts])))
 
-        return binary_predictions[0]
+        input_ids = []
+        for start, end in spans:
+            ids = []
+            if end > start:
+                first_line_ids = self.__first_line(start)
+                rest_end = min(self.offsets[end], self.offsets[start + 1] + self.max_tokens)
+                ids = first_line_ids + self.token_ids[self.offsets[start + 1]:rest_end]
+            input_ids.append(self.tokenizer.build_inputs_with_special_tokens(ids[:self.max_tokens]))
+        return input_ids
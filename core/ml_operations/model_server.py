@@ -0,0 +1,147 @@
+import logging
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+
+import numpy as np
+
+from .model import CodeBERTModel
+
+# Every message starts with a header: a status or request code, and the number of windows and of values
+# in its body. A predict request carries the length of every window (uint32) followed by all their token
+# ids (uint32); its response carries number_of_kus probabilities (float32) per window. An error response
+# carries the utf-8 error message, in bytes, instead.
+HEADER = struct.Struct("<BII")
+PREDICT = 1
+OK = 0
+ERROR = 1
+
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serves the predictions of a CodeBERT model over a Unix domain socket.
+
+    Every connection is handled in its own thread, and the windows of all connections are run through one
+    InferenceScheduler, so that they share batches.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, model, socket_path):
+        from core.analysis.inference_scheduler import get_scheduler
+
+        self.model = model
+        self.scheduler = get_scheduler(model)
+        # A socket file left behind by a previous server would make the bind fail
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, ModelRequestHandler)
+
+
+class ModelRequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        while True:
+            try:
+                header = _recv_exactly(self.request, HEADER.size)
+            except ConnectionError:
+                return
+            code, number_of_windows, number_of_ids = HEADER.unpack(header)
+
+            try:
+                # The body is read whatever the request code, so that the next request starts at a header
+                lengths = np.frombuffer(_recv_exactly(self.request, 4 * number_of_windows), dtype="<u4")
+                token_ids = np.frombuffer(_recv_exactly(self.request, 4 * number_of_ids), dtype="<u4")
+                if code != PREDICT:
+                    raise ValueError(f"Unknown request code: {code}")
+                boundaries = np.cumsum(lengths)[:-1] if number_of_windows else []
+                windows = [window.tolist() for window in np.split(token_ids, boundaries)][:number_of_windows]
+
+                futures = [self.server.scheduler.submit(window_ids) for window_ids in windows]
+                probabilities = np.array([f.result() for f in futures], dtype="<f4")
+                self.request.sendall(HEADER.pack(OK, number_of_windows, probabilities.size) + probabilities.tobytes())
+            except ConnectionError:
+                return
+            except Exception as e:
+                logging.exception("Error serving a predict request")
+                message = str(e).encode("utf-8")
+                self.request.sendall(HEADER.pack(ERROR, 0, len(message)) + message)
+
+
+class CodeBERTClient(CodeBERTModel):
+    """
+    A CodeBERTModel that tokenizes windows locally and sends them to a ModelServer for inference, so that it
+    can be used anywhere a CodeBERTModel is, without holding the weights.
+    """
+
+    def __init__(self, tokenizer, socket_path, name, number_of_kus):
+        super().__init__(tokenizer, None, name, number_of_kus)
+        self.socket_path = socket_path
+        # One connection per thread, as requests and responses are not tagged
+        self._connections = threading.local()
+
+    def _forward(self, input_ids, batch_size):
+        if not input_ids:
+            return []
+        lengths = np.array([len(window_ids) for window_ids in input_ids], dtype="<u4")
+        token_ids = np.fromiter((i for window_ids in input_ids for i in window_ids), dtype="<u4")
+        request = HEADER.pack(PREDICT, len(input_ids), len(token_ids)) + lengths.tobytes() + token_ids.tobytes()
+
+        connection = self._connection()
+        try:
+            connection.sendall(request)
+            status, number_of_windows, number_of_values = HEADER.unpack(_recv_exactly(connection, HEADER.size))
+            body = _recv_exactly(connection, number_of_values if status != OK else 4 * number_of_values)
+        except OSError:
+            # The server may have been restarted, the next call reconnects
+            connection.close()
+            self._connections.socket = None
+            raise
+
+        if status != OK:
+            raise RuntimeError(f"Model server error: {body.decode('utf-8')}")
+        return np.frombuffer(body, dtype="<f4").reshape(number_of_windows, self.number_of_kus).tolist()
+
+    def _connection(self):
+        connection = getattr(self._connections, "socket", None)
+        if connection is None:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.connect(self.socket_path)
+            self._connections.socket = connection
+        return connection
+
+
+def _recv_exactly(connection, size):
+    chunks = []
+    while size:
+        chunk = connection.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+if __name__ == "__main__":
+    # Usage: python -m core.ml_operations.model_server [socket path]
+    from .loader import load_codebert_model
+    from config.settings import (
+        CODEBERT_BASE_PATH,
+        CODEBERT_ENGINE,
+        CODEBERT_QUANTIZE,
+        CODEBERT_ONNX_PATH,
+        CODEBERT_SERVER_SOCKET,
+    )
+
+    path = sys.argv[1] if len(sys.argv) > 1 else CODEBERT_SERVER_SOCKET
+    if not path:
+        sys.exit("No socket path given, and CODEBERT_SERVER_SOCKET is not set")
+    codebert = load_codebert_model(
+        CODEBERT_BASE_PATH, 27, engine=CODEBERT_ENGINE, quantize=CODEBERT_QUANTIZE, onnx_directory=CODEBERT_ONNX_PATH
+    )
+    with ModelServer(codebert, path) as server:
+        print(f"Serving {codebert} on {path}")
+        server.serve_forever()
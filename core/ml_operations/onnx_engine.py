@@ -0,0 +1,116 @@
+import inspect
+import os
+
+
+class OnnxSequenceClassifier:
+    """
+    Runs an ONNX export of a sequence classification model through ONNX Runtime, with the call interface of
+    the PyTorch model, so that CodeBERTModel can use either engine.
+    """
+
+    def __init__(self, path, num_threads=None):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.path = path
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [session_input.name for session_input in self.session.get_inputs()]
+
+    def eval(self):
+        return self
+
+    def __call__(self, input_ids, attention_mask, **kwargs):
+        import torch
+
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        feed = {name: inputs[name].numpy().astype("int64") for name in self.input_names}
+        logits = self.session.run(["logits"], feed)[0]
+        return OnnxOutput(torch.from_numpy(logits))
+
+
+class OnnxOutput:
+    def __init__(self, logits):
+        self.logits = logits
+
+
+def export_codebert_onnx(directory, output_directory, quantize=False):
+    """
+    Exports the CodeBERT model to ONNX, optionally with int8 dynamic quantization, unless an up-to-date export
+    is already cached.
+
+        Parameters:
+            directory (str): The directory of the PyTorch model, as used by load_codebert_model.
+            output_directory (str): The directory where the exported models are cached.
+            quantize (bool): Whether to return the int8 quantized export instead of the float32 one.
+
+        Returns:
+            path (str): The path of the ONNX model file.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    onnx_path = os.path.join(output_directory, "model.onnx")
+    quantized_path = os.path.join(output_directory, "model.int8.onnx")
+
+    # The export is stale if any file of the PyTorch model changed after it
+    source_mtime = max(
+        os.path.getmtime(os.path.join(directory, file))
+        for file in os.listdir(directory)
+        if os.path.isfile(os.path.join(directory, file))
+    )
+
+    if not _is_fresh(onnx_path, source_mtime):
+        _export(directory, onnx_path)
+    if not quantize:
+        return onnx_path
+
+    if not _is_fresh(quantized_path, os.path.getmtime(onnx_path)):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print(f"Quantizing {onnx_path} to int8")
+        # Like the export, through a temporary file, so that an interrupted quantization is never cached
+        temp_path = quantized_path + ".tmp"
+        quantize_dynamic(onnx_path, temp_path, weight_type=QuantType.QInt8)
+        os.replace(temp_path, quantized_path)
+    return quantized_path
+
+
+def _is_fresh(path, source_mtime):
+    return os.path.exists(path) and os.path.getmtime(path) >= source_mtime
+
+
+def _export(directory, onnx_path):
+    import torch
+    from transformers import AutoModelForSequenceClassification
+
+    print(f"Exporting {directory} to {onnx_path}")
+    model = AutoModelForSequenceClassification.from_pretrained(directory)
+    model.eval()
+    # The logits are returned as a tuple, not as a SequenceClassifierOutput
+    model.config.return_dict = False
+
+    sample = torch.ones((1, 8), dtype=torch.long)
+    options = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # Newer versions of torch default to the dynamo exporter, which needs onnxscript
+        options["dynamo"] = False
+
+    # Write to a temporary file first, so that an interrupted export is never mistaken for a cached one
+    temp_path = onnx_path + ".tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample, sample),
+            temp_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+            },
+            opset_version=14,
+            **options,
+        )
+    os.replace(temp_path, onnx_path)
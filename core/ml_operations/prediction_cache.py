@@ -0,0 +1,188 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class PredictionCache:
+    """
+    Caches the KU probabilities of windows, keyed by a hash of their token ids and of the model fingerprint.
+
+    The token ids are a function of the normalized window text, so identical windows share an entry whatever file,
+    commit or repository they come from. Entries are kept in an in-process LRU tier of max_entries windows, backed
+    by an optional SQLite file of at most max_disk_entries windows, from which the least recently used ones are
+    evicted.
+
+    Only the in-process tier is read and written under the lock of the cache. The SQLite file is accessed outside
+    of it, through a connection per thread, so that lookups served from memory never wait for the disk.
+
+    A pickled cache, such as the one sent to the workers of a CodeBERTPool, keeps its settings and SQLite file but
+    starts with an empty in-process tier and counters.
+    """
+
+    def __init__(self, fingerprint, max_entries=100000, path=None, max_disk_entries=5000000):
+        self.fingerprint = fingerprint.encode("utf-8")
+        self.max_entries = max_entries
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self._reset()
+
+    def __getstate__(self):
+        return {key: getattr(self, key) for key in ("fingerprint", "max_entries", "path", "max_disk_entries")}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def _reset(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # The SQLite connection of every thread
+        self._local = threading.local()
+        # Approximate number of entries of the SQLite file, counted when it is first opened
+        self._disk_entries = None
+
+    def key(self, input_ids):
+        return hashlib.sha1(self.fingerprint + np.asarray(input_ids, dtype="<u4").tobytes()).digest()
+
+    def get_many(self, keys):
+        """
+        Returns the cached probabilities of every key, None for the keys that are not cached.
+        """
+        results = [None] * len(keys)
+        missing = []
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                probabilities = self._entries.get(key)
+                if probabilities is not None:
+                    self._entries.move_to_end(key)
+                    results[i] = probabilities
+                else:
+                    missing.append(i)
+
+        found = self._disk_get([keys[i] for i in missing]) if missing and self.path else {}
+
+        with self._lock:
+            for i in missing:
+                probabilities = found.get(keys[i])
+                if probabilities is not None:
+                    results[i] = probabilities
+                    self._remember(keys[i], probabilities)
+            self.disk_hits += len(found)
+            self.misses += sum(result is None for result in results)
+            self.hits += sum(result is not None for result in results)
+        return results
+
+    def put_many(self, keys, probabilities):
+        with self._lock:
+            for key, window_probabilities in zip(keys, probabilities):
+                self._remember(key, window_probabilities)
+        if self.path:
+            self._disk_put(keys, probabilities)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0,
+            "entries": len(self._entries),
+        }
+
+    def _remember(self, key, probabilities):
+        self._entries[key] = probabilities
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _db(self):
+        # Every thread has its own connection, and a forked worker process opens its own too
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS window_predictions (
+                    key BLOB PRIMARY KEY,
+                    probabilities BLOB NOT NULL,
+                    last_used INTEGER NOT NULL
+                )
+            ''')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS window_predictions_last_used ON window_predictions (last_used)'
+            )
+            if self._disk_entries is None:
+                (self._disk_entries,) = connection.execute('SELECT COUNT(*) FROM window_predictions').fetchone()
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def _disk_get(self, keys):
+        db = self._db()
+        found = {}
+        # SQLite limits the number of parameters of a query
+        for chunk_start in range(0, len(keys), 500):
+            chunk = keys[chunk_start:chunk_start + 500]
+            rows = db.execute(
+                f'SELECT key, probabilities FROM window_predictions WHERE key IN ({",".join("?" * len(chunk))})',
+                chunk,
+            ).fetchall()
+            for key, probabilities in rows:
+                found[bytes(key)] = np.frombuffer(probabilities, dtype="<f4").tolist()
+
+        if found:
+            with db:
+                db.executemany(
+                    'UPDATE window_predictions SET last_used = ? WHERE key = ?',
+                    [(time.time_ns(), key) for key in found],
+                )
+        return found
+
+    def _disk_put(self, keys, probabilities):
+        db = self._db()
+        now = time.time_ns()
+        with db:
+            db.executemany(
+                'INSERT OR REPLACE INTO window_predictions (key, probabilities, last_used) VALUES (?, ?, ?)',
+                [
+                    (key, np.asarray(window_probabilities, dtype="<f4").tobytes(), now)
+                    for key, window_probabilities in zip(keys, probabilities)
+                ],
+            )
+            # Counted without a lock, as the count only decides when to look for entries to evict
+            self._disk_entries += len(keys)
+            if self._disk_entries > self.max_disk_entries:
+                (count,) = db.execute('SELECT COUNT(*) FROM window_predictions').fetchone()
+                # Evict a tenth more than needed, so that eviction does not run on every insert
+                deleted = db.execute(
+                    'DELETE FROM window_predictions WHERE key IN '
+                    '(SELECT key FROM window_predictions ORDER BY last_used LIMIT ?)',
+                    (max(count - self.max_disk_entries + self.max_disk_entries // 10, 0),),
+                ).rowcount
+                self._disk_entries = count - deleted
+
+
+def model_fingerprint(directory, *options):
+    """
+    Fingerprints a model by the names, sizes and modification times of its files, and the options it is served with,
+    so that cached predictions are not reused after the model changes.
+    """
+    digest = hashlib.sha1(os.path.realpath(directory).encode("utf-8"))
+    for file in sorted(os.listdir(directory)):
+        path = os.path.join(directory, file)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            digest.update(f"{file}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    digest.update(repr(options).encode("utf-8"))
+    return digest.hexdigest()
@@ -0,0 +1,11 @@
+class PreprocessedText(str):
+    """
+    The text of a window, as returned by Model.preprocess, which keeps the n-grams a CompiledVectorizer extracted
+    from it, so that the vectorizers of all binary classifiers, which split texts alike, analyze it once.
+    """
+
+    def ngrams(self, analyzer_key, analyzer):
+        cache = self.__dict__.setdefault("_ngrams", {})
+        if analyzer_key not in cache:
+            cache[analyzer_key] = analyzer(self)
+        return cache[analyzer_key]
@@ -0,0 +1,354 @@
+import logging
+import os
+import resource
+import threading
+import time
+
+
+class ModelRegistry:
+    """
+    Loads every registered model at most once per process, on first use or on an explicit warmup, and keeps
+    track of how long each one took to load and how much memory it added.
+
+    A loaded model can be reloaded from its files without a restart: the new version is loaded and warmed up in the
+    background, then swapped in atomically. The analyses that checked out the previous version keep using it, and it
+    is retired once the last of them checks it back in.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._version_functions = {}
+        self._warmup_functions = {}
+        self._retire_callbacks = {}
+        # Name -> (model, version) of the current version of every loaded model
+        self._models = {}
+        self._stats = {}
+        self._locks = {}
+        # (name, version) -> number of analyses using that version, and the previous versions still in use
+        self._checkouts = {}
+        self._retiring = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory, version=None, warmup=None):
+        """
+        Registers a model under a name, without loading it.
+
+            Parameters:
+                name (str): The name the model is requested by.
+                factory (function): Loads and returns the model, called without arguments.
+                version (function): Returns the version of the model files, called without arguments before they
+                    are loaded. By default, versions count the loads of the model.
+                warmup (function): Runs a few dummy predictions on a newly loaded model, called with the model
+                    before it is swapped in by a reload.
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._version_functions[name] = version
+            self._warmup_functions[name] = warmup
+            self._retire_callbacks.setdefault(name, [])
+            self._locks.setdefault(name, threading.Lock())
+
+    def on_retire(self, name, callback):
+        """
+        Registers a function called with every previous version of a model once no analysis uses it anymore, to
+        release what was built for it, such as its inference scheduler.
+        """
+        with self._lock:
+            self._retire_callbacks[name].append(callback)
+
+    def get(self, name):
+        """
+        Returns the model registered under name, loading it if no thread loaded it yet.
+        """
+        return self.get_versioned(name)[0]
+
+    def get_versioned(self, name):
+        """
+        Returns the model registered under name and its version, loading it if no thread loaded it yet.
+        """
+        loaded = self._models.get(name)
+        if loaded is not None:
+            return loaded
+
+        with self._locks[name]:
+            # Another thread may have loaded the model while this one waited
+            if name not in self._models:
+                self._models[name] = self._load(name)
+            return self._models[name]
+
+    def checkout(self, name):
+        """
+        Returns the current version of a model, as get_versioned, and keeps that version alive until checkin is
+        called with it, even if a newer version is swapped in meanwhile.
+        """
+        self.get_versioned(name)
+        with self._lock:
+            model, version = self._models[name]
+            self._checkouts[(name, version)] = self._checkouts.get((name, version), 0) + 1
+        return model, version
+
+    def checkin(self, name, version):
+        """
+        Releases a version of a model returned by checkout, retiring it if it was replaced and no longer used.
+        """
+        with self._lock:
+            key = (name, version)
+            self._checkouts[key] -= 1
+            if self._checkouts[key]:
+                return
+            del self._checkouts[key]
+            model = self._retiring.pop(key, None)
+        if model is not None:
+            self._retire(name, model, version)
+
+    def version(self, name):
+        """
+        Returns the version of the loaded model registered under name, or None if it is not loaded.
+        """
+        loaded = self._models.get(name)
+        return loaded[1] if loaded is not None else None
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def warmup(self, names=None, background=False):
+        """
+        Loads the given models, or all registered ones, ahead of their first use.
+
+            Parameters:
+                names (list): The names of the models to load, by default all of them.
+                background (bool): Whether to load them in a daemon thread and return immediately.
+
+            Returns:
+                thread (Thread): The loading thread if background is set, None otherwise.
+        """
+        return self._run(self.get, "warmup", names, background)
+
+    def reload(self, names=None, background=False):
+        """
+        Loads a new version of the given models, or of all registered ones, from their files, warms it up and swaps
+        it in. A model whose files did not change since it was loaded is kept, and one not loaded yet is loaded.
+
+            Parameters:
+                names (list): The names of the models to reload, by default all of them.
+                background (bool): Whether to reload them in a daemon thread and return immediately.
+
+            Returns:
+                thread (Thread): The reloading thread if background is set, None otherwise.
+        """
+        return self._run(self._reload, "reload", names, background)
+
+    def stats(self):
+        """
+        Returns, for every registered model, whether it is loaded, its version, its load time in seconds, the memory
+        it added to the process in bytes and the counters of its prediction cache, if it has one.
+        """
+        stats = {}
+        for name in self._factories:
+            model, version = self._models.get(name, (None, None))
+            stats[name] = {
+                "loaded": name in self._models,
+                "version": version,
+                **self._stats.get(name, {"load_time": None, "memory": None}),
+            }
+            cache = getattr(model, "cache", None)
+            if cache is not None:
+                stats[name]["cache"] = cache.stats()
+        return stats
+
+    def _run(self, function, action, names, background):
+        names = list(self._factories) if names is None else names
+
+        def run_all():
+            for name in names:
+                try:
+                    function(name)
+                except Exception:
+                    logging.exception(f"Error in the {action} of model {name}")
+
+        if not background:
+            run_all()
+            return None
+        thread = threading.Thread(target=run_all, name=f"model-{action}", daemon=True)
+        thread.start()
+        return thread
+
+    def _load(self, name):
+        version_function = self._version_functions[name]
+        if version_function is not None:
+            version = version_function()
+        else:
+            version = str(int(self.version(name) or 0) + 1)
+
+        logging.info(f"Loading model {name}")
+        rss_before = _rss()
+        start_time = time.perf_counter()
+        model = self._factories[name]()
+        self._stats[name] = {
+            "load_time": time.perf_counter() - start_time,
+            "memory": max(_rss() - rss_before, 0),
+        }
+        logging.info(f"Loaded model {name} version {version} in {self._stats[name]['load_time']:.2f}s")
+        return model, version
+
+    def _reload(self, name):
+        with self._locks[name]:
+            previous = self._models.get(name)
+            version_function = self._version_functions[name]
+            if previous is not None and version_function is not None and version_function() == previous[1]:
+                logging.info(f"Model {name} is already at version {previous[1]}")
+                return
+
+            model, version = self._load(name)
+            warmup = self._warmup_functions[name]
+            if warmup is not None and previous is not None:
+                start_time = time.perf_counter()
+                warmup(model)
+                logging.info(f"Warmed up model {name} version {version} in {time.perf_counter() - start_time:.2f}s")
+
+            with self._lock:
+                self._models[name] = (model, version)
+                # The previous version is retired now, or by the last analysis that still uses it
+                if previous is not None and self._checkouts.get((name, previous[1])):
+                    self._retiring[(name, previous[1])] = previous[0]
+                    previous = None
+
+        if previous is not None:
+            self._retire(name, *previous)
+
+    def _retire(self, name, model, version):
+        logging.info(f"Retiring model {name} version {version}")
+        for callback in self._retire_callbacks[name]:
+            try:
+                callback(model)
+            except Exception:
+                logging.exception(f"Error retiring model {name} version {version}")
+
+
+def _rss():
+    # Resident memory of the process, in bytes
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # Peak resident memory, in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def load_local_codebert():
+    """
+    Loads the CodeBERT model of the settings in this process, without its prediction cache, as the workers of a
+    CodeBERTPool do before they attach a copy of the cache of the pool model.
+    """
+    from .loader import load_codebert_model
+    from config.settings import CODEBERT_BASE_PATH, CODEBERT_ENGINE, CODEBERT_QUANTIZE, CODEBERT_ONNX_PATH
+
+    return load_codebert_model(
+        CODEBERT_BASE_PATH, 27, engine=CODEBERT_ENGINE, quantize=CODEBERT_QUANTIZE, onnx_directory=CODEBERT_ONNX_PATH,
+    )
+
+
+def _load_codebert():
+    from .loader import connect_codebert_model
+    from .prediction_cache import PredictionCache
+    from config.settings import (
+        CODEBERT_BASE_PATH,
+        CODEBERT_SERVER_SOCKET,
+        CODEBERT_CACHE_SIZE,
+        CODEBERT_CACHE_PATH,
+        CODEBERT_CACHE_DISK_SIZE,
+    )
+
+    # Connect to the model server when one is configured
+    if CODEBERT_SERVER_SOCKET:
+        model = connect_codebert_model(CODEBERT_BASE_PATH, CODEBERT_SERVER_SOCKET, 27)
+    else:
+        model = load_local_codebert()
+
+    if CODEBERT_CACHE_SIZE:
+        model.cache = PredictionCache(
+            codebert_fingerprint(),
+            max_entries=CODEBERT_CACHE_SIZE,
+            path=CODEBERT_CACHE_PATH,
+            max_disk_entries=CODEBERT_CACHE_DISK_SIZE,
+        )
+    return model
+
+
+def codebert_fingerprint():
+    """
+    Identifies the CodeBERT model files and the engine they are served with, so that stored predictions are not
+    reused after either of them changes.
+    """
+    from .prediction_cache import model_fingerprint
+    from config.settings import CODEBERT_BASE_PATH, CODEBERT_ENGINE, CODEBERT_QUANTIZE, CODEBERT_SERVER_SOCKET
+
+    return model_fingerprint(CODEBERT_BASE_PATH, CODEBERT_SERVER_SOCKET or CODEBERT_ENGINE, CODEBERT_QUANTIZE)
+
+
+def _warmup_codebert(model):
+    from config.settings import CODEBERT_BATCH_SIZE, MODEL_WARMUP_BATCHES
+
+    # Full batches of full-size dummy windows, run past the prediction cache
+    input_ids = model.encode([["int value = 0;"] * 35] * CODEBERT_BATCH_SIZE)
+    for _ in range(MODEL_WARMUP_BATCHES):
+        model._forward(input_ids, CODEBERT_BATCH_SIZE)
+
+
+def _binary_classifiers_directory():
+    from config.settings import MODELS_BASE_PATH, MODELS_MMAP_PATH
+
+    # Map the converted classifiers (python -m core.ml_operations.convert) when they exist
+    if os.path.isdir(MODELS_MMAP_PATH):
+        return MODELS_MMAP_PATH, "r"
+    return MODELS_BASE_PATH, None
+
+
+def load_binary_classifiers():
+    """
+    Loads the binary classifiers of MODELS_TO_LOAD, from their converted copies when they exist.
+    """
+    from .loader import load_models_from_directory
+    from config.settings import MODELS_TO_LOAD
+
+    directory, mmap_mode = _binary_classifiers_directory()
+    return load_models_from_directory(directory, MODELS_TO_LOAD, mmap_mode=mmap_mode)
+
+
+def binary_classifiers_fingerprint():
+    """
+    Identifies the files of the binary classifiers that are loaded, so that a reload skips unchanged classifiers.
+    """
+    import hashlib
+    from .prediction_cache import model_fingerprint
+    from config.settings import MODELS_TO_LOAD
+
+    directory, mmap_mode = _binary_classifiers_directory()
+    digest = hashlib.sha1(repr(mmap_mode).encode("utf-8"))
+    for name in sorted(MODELS_TO_LOAD):
+        if os.path.isdir(os.path.join(directory, name)):
+            digest.update(model_fingerprint(os.path.join(directory, name)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _warmup_binary_classifiers(classifiers):
+    from config.settings import MODEL_WARMUP_BATCHES
+
+    for _ in range(MODEL_WARMUP_BATCHES):
+        for classifier in classifiers:
+            classifier.predict_scores([["int value = 0;"] * 35])
+
+
+registry = ModelRegistry()
+registry.register("codebert", _load_codebert, codebert_fingerprint, _warmup_codebert)
+registry.register(
+    "binary_classifiers", load_binary_classifiers, binary_classifiers_fingerprint, _warmup_binary_classifiers,
+)
+
+
+def get_codebert():
+    return registry.get("codebert")
+
+
+def get_binary_classifiers():
+    return registry.get("binary_classifiers")
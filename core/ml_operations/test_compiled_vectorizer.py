@@ -0,0 +1,75 @@
+import pickle
+import unittest
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_selection import SelectKBest, chi2
+
+from core.ml_operations.compiled_vectorizer import compile_vectorizer
+from core.ml_operations.preprocessed_text import PreprocessedText
+
+TEXTS = [
+    "public int getValue ( ) return value ;",
+    "for ( int i = 0 ; i < n ; i ++ ) sum += values [ i ] ;",
+    "try reader . readLine ( ) ; catch ( IOException e ) throw e ;",
+    "public void setValue ( int value ) this . value = value ;",
+    "Thread thread = new Thread ( runnable ) ; thread . start ( ) ;",
+    "synchronized ( lock ) counter ++ ; lock . notifyAll ( ) ;",
+]
+LABELS = [0, 0, 1, 0, 1, 1]
+
+
+class CompiledVectorizerTests(unittest.TestCase):
+
+    def test_same_features_as_vectorizer_and_selector(self):
+        """
+        Title: Testing the vectorizers compiled with their selectors
+        Description: This test verifies that a CompiledVectorizer returns exactly the same float32
+        features as the TfidfVectorizer and SelectKBest selector it was compiled from, whether the
+        selector drops features or not, for plain strings and for PreprocessedText texts, before and
+        after pickling.
+        Related methods: compile_vectorizer, CompiledVectorizer.transform, PreprocessedText.ngrams
+        """
+        vectorizer = TfidfVectorizer(ngram_range=(1, 2), min_df=2, strip_accents="unicode")
+        x = vectorizer.fit_transform(TEXTS)
+        new_texts = TEXTS[::-1] + ["int value = values [ 0 ] ; thread . start ( ) ;", ""]
+
+        for k in (x.shape[1] // 2, "all"):
+            selector = SelectKBest(chi2, k=k).fit(x, LABELS)
+            expected = selector.transform(vectorizer.transform(new_texts)).astype("float32")
+            compiled = compile_vectorizer(vectorizer, selector)
+
+            for texts in (new_texts, [PreprocessedText(text) for text in new_texts]):
+                for vectorized in (compiled.transform(texts), pickle.loads(pickle.dumps(compiled)).transform(texts)):
+                    self.assertEqual(vectorized.shape, expected.shape)
+                    self.assertEqual(vectorized.dtype, np.float32)
+                    np.testing.assert_array_equal(vectorized.indptr, expected.indptr)
+                    np.testing.assert_array_equal(vectorized.indices, expected.indices)
+                    np.testing.assert_array_equal(vectorized.data, expected.data)
+
+        # The n-grams of a PreprocessedText are extracted once for vectorizers with the same analyzer
+        text = PreprocessedText(TEXTS[0])
+        compiled.transform([text])
+        ngrams = text.ngrams(compiled.analyzer_key, None)
+        compile_vectorizer(vectorizer).transform([text])
+        self.assertIs(text.ngrams(compiled.analyzer_key, None), ngrams)
+
+    def test_stop_words_list(self):
+        """
+        Title: Testing the vectorizers with a list of stop words
+        Description: This test verifies that a vectorizer whose stop words are given as a list compiles to a
+        CompiledVectorizer that returns the same features, and whose n-grams are cached for PreprocessedText texts.
+        Related methods: compile_vectorizer, CompiledVectorizer.transform, PreprocessedText.ngrams
+        """
+        vectorizer = TfidfVectorizer(stop_words=["int", "return"])
+        vectorizer.fit(TEXTS)
+        compiled = compile_vectorizer(vectorizer)
+        text = PreprocessedText(TEXTS[0])
+
+        expected = vectorizer.transform([TEXTS[0]]).astype("float32")
+        np.testing.assert_array_equal(compiled.transform([text]).toarray(), expected.toarray())
+        self.assertNotIn("int", text.ngrams(compiled.analyzer_key, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from joblib import dump
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_selection import SelectKBest, chi2
+from sklearn.linear_model import LogisticRegression
+
+from core.ml_operations.compiled_vectorizer import CompiledVectorizer
+from core.ml_operations.convert import convert_binary_classifiers, convert_codebert
+from core.ml_operations.loader import load_codebert_model, load_models_from_directory
+from core.ml_operations.model import Model
+from core.ml_operations.test_model import HAS_TORCH, build_tiny_codebert, random_lines
+
+
+def save_binary_classifier(directory, name, marker):
+    """
+    Trains a binary classifier of KU name, detecting the windows that contain marker, and saves its compressed
+    vectorizer, selector and model pickles in a subdirectory of directory, as in models/binary_classifiers.
+    """
+    windows = [random_lines(5, seed) for seed in range(40)]
+    texts = Model.preprocess(windows)
+    labels = [int(marker in text) for text in texts]
+
+    vectorizer = TfidfVectorizer(ngram_range=(1, 2))
+    x = vectorizer.fit_transform(texts)
+    selector = SelectKBest(chi2, k=x.shape[1] // 2).fit(x, labels)
+    model = LogisticRegression().fit(selector.transform(x), labels)
+
+    os.makedirs(os.path.join(directory, name))
+    for kind, value in (("vectorizer", vectorizer), ("selector", selector), ("model", model)):
+        dump(value, os.path.join(directory, name, f"{name}_{kind}.pkl"), compress=3)
+
+
+class ConvertTests(unittest.TestCase):
+
+    def test_binary_classifiers_conversion(self):
+        """
+        Title: Testing the conversion of the binary classifiers for memory-mapping
+        Description: This test verifies that the binary classifiers converted by convert_binary_classifiers
+        load with memory-mapped arrays and a compiled vectorizer, and score windows exactly like the original
+        classifiers.
+        Related methods: convert_binary_classifiers, load_models_from_directory
+        """
+        windows = [random_lines(5, seed) for seed in range(100, 120)]
+        with tempfile.TemporaryDirectory() as directory:
+            original_directory = os.path.join(directory, "binary_classifiers")
+            converted_directory = os.path.join(directory, "binary_classifiers_mmap")
+            save_binary_classifier(original_directory, "K1", "String")
+            save_binary_classifier(original_directory, "K2", "return")
+            convert_binary_classifiers(original_directory, converted_directory)
+
+            originals = sorted(load_models_from_directory(original_directory), key=str)
+            converted = sorted(load_models_from_directory(converted_directory, mmap_mode="r"), key=str)
+            self.assertEqual([str(model) for model in converted], ["K1", "K2"])
+            for original, model in zip(originals, converted):
+                self.assertIsInstance(model.vectorizer, CompiledVectorizer)
+                self.assertIsInstance(model.vectorizer.idf, np.memmap)
+                self.assertEqual(model.predict_many(windows), original.predict_many(windows))
+                np.testing.assert_allclose(model.predict_scores(windows), original.predict_scores(windows), rtol=1e-6)
+
+    @unittest.skipUnless(HAS_TORCH, "torch, tokenizers and transformers are not installed")
+    def test_codebert_conversion(self):
+        """
+        Title: Testing the conversion of CodeBERT to memory-mapped safetensors weights
+        Description: This test verifies that a CodeBERT model converted by convert_codebert is loaded from its
+        memory-mapped model.safetensors file, with its tokenizer, and computes the same KU probabilities as the
+        original model.
+        Related methods: convert_codebert, load_codebert_model
+        """
+        windows = [random_lines(size, seed) for seed, size in enumerate((1, 5, 20))]
+        with tempfile.TemporaryDirectory() as directory:
+            original_directory = build_tiny_codebert(os.path.join(directory, "codebert"))
+            converted_directory = os.path.join(directory, "codebert_safetensors")
+            convert_codebert(original_directory, converted_directory)
+            self.assertTrue(os.path.exists(os.path.join(converted_directory, "model.safetensors")))
+
+            original = load_codebert_model(original_directory, 4)
+            converted = load_codebert_model(converted_directory, 4)
+            input_ids = converted.encode(windows)
+            self.assertEqual(input_ids, original.encode(windows))
+            np.testing.assert_allclose(
+                converted.predict_proba_encoded(input_ids), original.predict_proba_encoded(input_ids), atol=1e-6,
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
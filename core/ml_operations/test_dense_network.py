@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from core.ml_operations.dense_network import DenseNetwork
+
+
+class DenseNetworkTests(unittest.TestCase):
+
+    def test_sparse_forward_and_round_trip(self):
+        """
+        Title: Testing the NumPy forward pass of the converted dense networks
+        Description: This test verifies that a DenseNetwork computes the same outputs for sparse and
+        dense inputs, that its outputs match a reference relu-sigmoid computation, and that it is read
+        back unchanged from the .npz file it is saved to.
+        Related methods: DenseNetwork.__call__, DenseNetwork.save, DenseNetwork.load
+        """
+        rng = np.random.default_rng(0)
+        kernels = [rng.normal(size=(50, 8)).astype("float32"), rng.normal(size=(8, 1)).astype("float32")]
+        biases = [rng.normal(size=8).astype("float32"), rng.normal(size=1).astype("float32")]
+        network = DenseNetwork(kernels, biases, ["relu", "sigmoid"])
+
+        x = rng.random((6, 50)).astype("float32") * (rng.random((6, 50)) < 0.1)
+        expected = 1 / (1 + np.exp(-(np.maximum(x @ kernels[0] + biases[0], 0) @ kernels[1] + biases[1])))
+
+        np.testing.assert_allclose(network(x), expected, rtol=1e-5)
+        np.testing.assert_allclose(network(csr_matrix(x)), expected, rtol=1e-5)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "K0_model.npz")
+            network.save(path)
+            loaded = DenseNetwork.load(path)
+        self.assertEqual(loaded.activations, ["relu", "sigmoid"])
+        np.testing.assert_array_equal(loaded(csr_matrix(x)), network(csr_matrix(x)))
+
+
+if __name__ == '__main__':
+    unittest.main()
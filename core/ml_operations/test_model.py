@@ -0,0 +1,129 @@
+import importlib.util
+import os
+import random
+import tempfile
+import unittest
+
+from core.analysis.windows import token_budget_windows
+from core.ml_operations.model import CodeBERTModel
+
+HAS_TOKENIZERS = all(importlib.util.find_spec(module) for module in ("tokenizers", "transformers"))
+HAS_TORCH = HAS_TOKENIZERS and importlib.util.find_spec("torch") is not None
+
+WORDS = [
+    "public", "class", "void", "int", "String", "return", "if", "else", "for", "new", "private", "static", "null",
+    "System.out.println", "List<String>", "Map", "try", "catch", "throw", "Exception", "\"naïve\"", "\"日本語\"",
+    "'€'", "42", "3.14", "true", "(", ")", "{", "}", ";", "+=", "->", "//", "é", "ß", "😀",
+]
+
+
+def random_lines(count, seed=0):
+    """
+    Returns count lines of Java-like code with spaces, tabs, non-ASCII characters and CRLF line endings.
+    """
+    generator = random.Random(seed)
+    lines = []
+    for _ in range(count):
+        indent = generator.choice(["", "  ", "    ", "\t", "\t\t", "  \t"])
+        words = " ".join(generator.choice(WORDS) for _ in range(generator.randint(1, 10)))
+        lines.append(indent + words + generator.choice([";", "", " {", "\r", ";\r", "\t;"]))
+    return lines
+
+
+def build_tiny_tokenizer(directory):
+    """
+    Trains a small byte-level BPE tokenizer, of the kind of the CodeBERT tokenizer, and saves it as a RoBERTa
+    tokenizer in directory. Returns the tokenizer.
+    """
+    from tokenizers import ByteLevelBPETokenizer
+    from transformers import RobertaTokenizerFast
+
+    texts = ["\n".join(random_lines(40, seed)) for seed in range(50)]
+    tokenizer = ByteLevelBPETokenizer()
+    tokenizer.train_from_iterator(texts, vocab_size=400, special_tokens=["<s>", "<pad>", "</s>", "<unk>", "<mask>"])
+    os.makedirs(directory, exist_ok=True)
+    tokenizer.save_model(directory)
+    tokenizer = RobertaTokenizerFast(
+        vocab_file=os.path.join(directory, "vocab.json"),
+        merges_file=os.path.join(directory, "merges.txt"),
+        model_max_length=128,
+    )
+    tokenizer.save_pretrained(directory)
+    return tokenizer
+
+
+def build_tiny_codebert(directory, number_of_kus=4):
+    """
+    Saves a tiny, randomly initialized RoBERTa sequence classifier with the tokenizer of build_tiny_tokenizer
+    in directory, laid out like the CodeBERT model directory.
+    """
+    import torch
+    from transformers import RobertaConfig, RobertaForSequenceClassification
+
+    tokenizer = build_tiny_tokenizer(directory)
+    torch.manual_seed(0)
+    config = RobertaConfig(
+        vocab_size=len(tokenizer), hidden_size=32, num_hidden_layers=2, num_attention_heads=2, intermediate_size=64,
+        max_position_embeddings=tokenizer.model_max_length + 2, num_labels=number_of_kus,
+        problem_type="multi_label_classification", pad_token_id=tokenizer.pad_token_id,
+    )
+    RobertaForSequenceClassification(config).save_pretrained(directory, safe_serialization=False)
+    return directory
+
+
+@unittest.skipUnless(HAS_TOKENIZERS, "tokenizers and transformers are not installed")
+class TokenizedFileTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.model = CodeBERTModel(build_tiny_tokenizer(cls.directory.name), None, "CodeBERT", 4)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_window_ids_match_encode(self):
+        """
+        Title: Testing the token ids of windows sliced out of a tokenized file
+        Description: This test verifies that, with a byte-level BPE tokenizer, the token ids of every window
+        that TokenizedFile slices out of the file tokenized once are those of the window tokenized on its own
+        by CodeBERTModel.encode, for multi-line windows with tabs, non-ASCII characters and CRLF line endings,
+        including the windows that are truncated to the maximum length of the model.
+        Related methods: CodeBERTModel.tokenize_file, TokenizedFile.window_ids, CodeBERTModel.encode
+        """
+        lines = random_lines(120, seed=100)
+        tokenized_file = self.model.tokenize_file(lines)
+
+        spans = [(start, end) for start in range(0, len(lines), 7) for end in (start + 1, start + 5, start + 40)
+                 if end <= len(lines)]
+        self.assertTrue(any(tokenized_file.window_length(start, end) > tokenized_file.max_tokens
+                            for start, end in spans))
+        self.assertEqual(tokenized_file.window_ids(spans), self.model.encode([lines[s:e] for s, e in spans]))
+
+    def test_token_budget_windows_cover_every_line(self):
+        """
+        Title: Testing the token-budget windows of a tokenized file
+        Description: This test verifies that token_budget_windows covers every line of the file, in order,
+        with windows that fit in the maximum sequence length of the model and whose consecutive windows share
+        at most the requested number of tokens.
+        Related methods: token_budget_windows, TokenizedFile.window_length
+        """
+        lines = random_lines(300, seed=200)
+        tokenized_file = self.model.tokenize_file(lines)
+
+        for token_overlap in (0, 32):
+            windows = token_budget_windows(tokenized_file, token_overlap)
+            covered = set()
+            for (start, end), (next_start, _) in zip(windows, windows[1:] + [(len(lines), None)]):
+                self.assertLess(start, next_start)
+                self.assertLessEqual(tokenized_file.window_length(start, end), tokenized_file.max_tokens)
+                self.assertLessEqual(sum(tokenized_file.line_length(i) for i in range(next_start, end)),
+                                     token_overlap)
+                covered.update(range(start, end))
+            self.assertEqual(covered, set(range(len(lines))))
+            self.assertEqual(windows[-1][1], len(lines))
+
+
+if __name__ == '__main__':
+    unittest.main()
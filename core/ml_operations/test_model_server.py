@@ -0,0 +1,60 @@
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from concurrent.futures import Future
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+from core.ml_operations.model_server import ERROR, HEADER, OK, PREDICT, ModelServer, _recv_exactly
+
+
+def predicted(window_ids):
+    future = Future()
+    future.set_result([len(window_ids) / 10, 0.5])
+    return future
+
+
+class ModelServerTests(unittest.TestCase):
+
+    def test_unknown_request_code(self):
+        """
+        Title: Testing the requests of unknown codes to the model server
+        Description: This test verifies that the ModelServer answers a request of unknown code with an
+        error, after reading its whole body, so that the next predict request of the same connection is
+        answered with the probabilities of its windows.
+        Related methods: ModelRequestHandler.handle
+        """
+        scheduler = MagicMock()
+        scheduler.submit.side_effect = predicted
+        with tempfile.TemporaryDirectory() as directory, \
+                patch("core.analysis.inference_scheduler.get_scheduler", return_value=scheduler):
+            path = os.path.join(directory, "model.sock")
+            server = ModelServer(MagicMock(), path)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.addCleanup(server.server_close)
+            self.addCleanup(server.shutdown)
+
+            lengths = np.array([2, 3], dtype="<u4")
+            token_ids = np.arange(5, dtype="<u4")
+            body = lengths.tobytes() + token_ids.tobytes()
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                connection.connect(path)
+
+                connection.sendall(HEADER.pack(7, 2, 5) + body)
+                status, _, size = HEADER.unpack(_recv_exactly(connection, HEADER.size))
+                self.assertEqual(status, ERROR)
+                self.assertIn("Unknown request code: 7", _recv_exactly(connection, size).decode("utf-8"))
+
+                connection.sendall(HEADER.pack(PREDICT, 2, 5) + body)
+                status, number_of_windows, size = HEADER.unpack(_recv_exactly(connection, HEADER.size))
+                self.assertEqual((status, number_of_windows, size), (OK, 2, 4))
+                probabilities = np.frombuffer(_recv_exactly(connection, 4 * size), dtype="<f4")
+                np.testing.assert_allclose(probabilities, [0.2, 0.5, 0.3, 0.5])
+                self.assertEqual([call.args[0] for call in scheduler.submit.call_args_list], [[0, 1], [2, 3, 4]])
+
+
+if __name__ == '__main__':
+    unittest.main()
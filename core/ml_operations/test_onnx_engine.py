@@ -0,0 +1,51 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from core.ml_operations.loader import load_codebert_model
+from core.ml_operations.onnx_engine import export_codebert_onnx
+from core.ml_operations.test_model import HAS_TORCH, build_tiny_codebert, random_lines
+
+HAS_ONNX = HAS_TORCH and all(importlib.util.find_spec(module) for module in ("onnx", "onnxruntime"))
+
+
+@unittest.skipUnless(HAS_ONNX, "torch, onnx and onnxruntime are not installed")
+class OnnxEngineTests(unittest.TestCase):
+
+    def test_onnx_engines_match_torch(self):
+        """
+        Title: Testing the ONNX engines of CodeBERT
+        Description: This test verifies that the float32 ONNX export of a CodeBERT model computes the same KU
+        probabilities as the PyTorch model, that the int8 quantized export stays close to them, and that both
+        exports are cached and reused until the PyTorch model changes.
+        Related methods: load_codebert_model, export_codebert_onnx, OnnxSequenceClassifier
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            build_tiny_codebert(directory)
+            windows = [random_lines(size, seed) for seed, size in enumerate((1, 5, 20, 60))]
+
+            torch_model = load_codebert_model(directory, 4)
+            input_ids = torch_model.encode(windows)
+            expected = np.array(torch_model.predict_proba_encoded(input_ids, batch_size=3))
+
+            onnx_model = load_codebert_model(directory, 4, engine="onnx")
+            np.testing.assert_allclose(onnx_model.predict_proba_encoded(input_ids, batch_size=3), expected, atol=1e-5)
+
+            quantized_model = load_codebert_model(directory, 4, engine="onnx", quantize=True)
+            np.testing.assert_allclose(
+                quantized_model.predict_proba_encoded(input_ids, batch_size=3), expected, atol=0.05,
+            )
+
+            onnx_directory = os.path.join(directory, "onnx")
+            self.assertEqual(sorted(os.listdir(onnx_directory)), ["model.int8.onnx", "model.onnx"])
+            mtimes = {file: os.path.getmtime(os.path.join(onnx_directory, file)) for file in os.listdir(onnx_directory)}
+            export_codebert_onnx(directory, onnx_directory, quantize=True)
+            for file, mtime in mtimes.items():
+                self.assertEqual(os.path.getmtime(os.path.join(onnx_directory, file)), mtime)
+
+
+if __name__ == '__main__':
+    unittest.main()
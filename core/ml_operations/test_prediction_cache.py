@@ -0,0 +1,105 @@
+import os
+import pickle
+import tempfile
+import threading
+import unittest
+
+from core.ml_operations.prediction_cache import PredictionCache
+
+
+class PredictionCacheTests(unittest.TestCase):
+
+    def test_lru_and_disk_tiers(self):
+        """
+        Title: Testing the two tiers of the window prediction cache
+        Description: This test verifies that PredictionCache evicts the least recently used windows from
+        its in-process tier, serves them again from its SQLite tier, keeps the SQLite file within its size
+        bound, separates the entries of different model fingerprints, and counts hits and misses.
+        Related methods: PredictionCache.get_many, PredictionCache.put_many
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache.sqlite")
+            cache = PredictionCache("model-a", max_entries=2, path=path, max_disk_entries=10)
+            keys = [cache.key([0, i, 2]) for i in range(3)]
+
+            self.assertEqual(cache.get_many(keys), [None, None, None])
+            cache.put_many(keys, [[0.25], [0.5], [0.75]])
+
+            # The first window was evicted from memory, and is read back from disk
+            self.assertEqual(cache.get_many(keys), [[0.25], [0.5], [0.75]])
+            self.assertEqual(cache.stats()["disk_hits"], 1)
+            self.assertEqual((cache.hits, cache.misses), (3, 3))
+
+            # Another model does not see the entries of the first one
+            other_cache = PredictionCache("model-b", path=path)
+            self.assertEqual(other_cache.get_many([other_cache.key([0, 0, 2])]), [None])
+
+            cache.put_many([cache.key([i]) for i in range(20)], [[0.0]] * 20)
+            self.assertLessEqual(cache._db().execute("SELECT COUNT(*) FROM window_predictions").fetchone()[0], 10)
+            cache._db().close()
+            other_cache._db().close()
+
+    def test_disk_access_outside_the_lock(self):
+        """
+        Title: Testing concurrent lookups of the window prediction cache
+        Description: This test verifies that a lookup of PredictionCache served from its in-process tier
+        does not wait for a slow lookup of another thread in the SQLite tier, and that the entries a thread
+        writes to the SQLite file are read back by another thread, through its own connection.
+        Related methods: PredictionCache.get_many, PredictionCache.put_many
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            cache = PredictionCache("model-a", max_entries=1, path=os.path.join(directory, "cache.sqlite"))
+            keys = [cache.key([i]) for i in range(2)]
+            writer = threading.Thread(target=cache.put_many, args=(keys, [[0.25], [0.5]]))
+            writer.start()
+            writer.join()
+
+            # A lookup of the evicted first window blocks in the SQLite tier until released
+            disk_get = cache._disk_get
+            started, release = threading.Event(), threading.Event()
+
+            def slow_disk_get(disk_keys):
+                started.set()
+                release.wait(5)
+                return disk_get(disk_keys)
+
+            cache._disk_get = slow_disk_get
+            results = []
+            reader = threading.Thread(target=lambda: results.append(cache.get_many(keys[:1])))
+            reader.start()
+            self.assertTrue(started.wait(5))
+
+            self.assertEqual(cache.get_many(keys[1:]), [[0.5]])
+            self.assertEqual(results, [])
+            release.set()
+            reader.join()
+            self.assertEqual(results, [[[0.25]]])
+
+
+    def test_pickled_cache(self):
+        """
+        Title: Testing the copies of the window prediction cache sent to worker processes
+        Description: This test verifies that a pickled PredictionCache keeps the fingerprint, sizes and SQLite
+        file of the original, starts with an empty in-process tier and counters, and shares the entries of the
+        SQLite file with the original in both directions.
+        Related methods: PredictionCache.__getstate__, PredictionCache.__setstate__
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            cache = PredictionCache("model-a", max_entries=5, path=os.path.join(directory, "cache.sqlite"))
+            keys = [cache.key([i]) for i in range(2)]
+            cache.put_many(keys[:1], [[0.25]])
+            self.assertEqual(cache.get_many(keys[:1]), [[0.25]])
+
+            copy = pickle.loads(pickle.dumps(cache))
+            self.assertEqual((copy.fingerprint, copy.max_entries, copy.path), (cache.fingerprint, 5, cache.path))
+            self.assertEqual((copy.stats()["entries"], copy.hits), (0, 0))
+
+            self.assertEqual(copy.get_many(keys[:1]), [[0.25]])
+            self.assertEqual(copy.stats()["disk_hits"], 1)
+            copy.put_many(keys[1:], [[0.5]])
+            self.assertEqual(cache.get_many(keys[1:]), [[0.5]])
+            cache._db().close()
+            copy._db().close()
+
+if __name__ == '__main__':
+    unittest.main()
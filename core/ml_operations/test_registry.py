@@ -0,0 +1,50 @@
+import unittest
+
+from core.ml_operations.registry import ModelRegistry
+
+
+class ModelRegistryTests(unittest.TestCase):
+
+    def test_reload_swaps_versions(self):
+        """
+        Title: Testing the hot reload of a model
+        Description: This test verifies that ModelRegistry.reload loads and warms up a new version of a
+        model whose files changed and swaps it in, that an analysis which checked out the previous version
+        keeps it until it checks it back in, at which point the previous version is retired, and that a
+        model whose files did not change is not reloaded.
+        Related methods: ModelRegistry.reload, ModelRegistry.checkout, ModelRegistry.checkin
+        """
+        files = {"version": "v1"}
+        warmed_up, retired = [], []
+        registry = ModelRegistry()
+        registry.register(
+            "model", lambda: {"weights": files["version"]}, lambda: files["version"], warmed_up.append,
+        )
+        registry.on_retire("model", retired.append)
+
+        model, version = registry.checkout("model")
+        self.assertEqual((model, version), ({"weights": "v1"}, "v1"))
+
+        # The files did not change
+        registry.reload(["model"])
+        self.assertIs(registry.get("model"), model)
+
+        files["version"] = "v2"
+        registry.reload(["model"])
+        self.assertEqual(registry.get_versioned("model"), ({"weights": "v2"}, "v2"))
+        self.assertEqual(registry.stats()["model"]["version"], "v2")
+        self.assertEqual(warmed_up, [{"weights": "v2"}])
+        # The running analysis still holds the previous version
+        self.assertEqual(retired, [])
+
+        registry.checkin("model", version)
+        self.assertEqual(retired, [{"weights": "v1"}])
+
+        # A version no analysis uses is retired as soon as it is replaced
+        files["version"] = "v3"
+        registry.reload(["model"])
+        self.assertEqual(retired, [{"weights": "v1"}, {"weights": "v2"}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,8 @@ from .code_preprocessing import (remove_comments, remove_imports, remove_package
 
 
 class CodeFile:
-    def __init__(self, filename, content, author=None, timestamp=None, sha=None):
+    def __init__(self, filename, content, author=None, timestamp=None, sha=None, blob_sha=None,
+                 previous_blob_sha=None):
         self.filename = filename
         self.content = content
         self.content = self.__clean_file()
@@ -12,7 +13,16 @@ class CodeFile:
         self.author = author
         self.timestamp = timestamp
         self.sha = sha
+        # The id of the git blob of the file content, shared by every commit and fork with the same content
+        self.blob_sha = blob_sha
+        # The id of the git blob of the file before the commit, if the commit modified or renamed it
+        self.previous_blob_sha = previous_blob_sha
         self.ku_results = {}
+        # The maximum probability of every KU over the scored windows, and optionally the scores of every window
+        self.ku_scores = None
+        self.window_scores = None
+        # Whether the KU scores only cover the windows scored before the analysis of the file stopped early
+        self.ku_scores_partial = False
 
     def __str__(self):
         return self.filename
@@ -31,3 +41,8 @@ class CodeFile:
 
     def add_ku_result(self, ku_name, result):
         self.ku_results[ku_name] = result
+
+    def set_ku_scores(self, ku_scores, window_scores=None, partial=False):
+        self.ku_scores = ku_scores
+        self.window_scores = window_scores
+        self.ku_scores_partial = partial
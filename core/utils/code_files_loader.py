@@ -66,6 +66,8 @@ def read_files_from_dict_list(dict_list: list):
                 author=contribution["author"],
                 timestamp=contribution["timestamp"],
                 sha=sha,
+                blob_sha=contribution.get("blob_sha"),
+                previous_blob_sha=contribution.get("previous_blob_sha"),
             )
             logging.debug(f"Successfully processed file: {filename}")
 